@@ -20,7 +20,9 @@ port scans, network connections, and more using the unified logging system.
 <xbar.var>boolean(MONITOR_VNC=true): Monitor VNC connections</xbar.var>
 <xbar.var>boolean(MONITOR_PORTS=true): Monitor network port connections</xbar.var>
 <xbar.var>string(MONITORED_PORTS="21,445,548,3306,3689,5432"): Comma-separated ports to monitor</xbar.var>
-<xbar.var>boolean(MONITOR_LISTENING=true): Monitor new listening ports (21-9999)</xbar.var>
+<xbar.var>boolean(MONITOR_LISTENING=true): Monitor new listening ports</xbar.var>
+<xbar.var>string(LISTENING_PORT_RANGES="22-9998"): Comma-separated listening port ranges to monitor</xbar.var>
+<xbar.var>string(LISTENING_IGNORE=""): Comma-separated ports, port ranges or process names to ignore</xbar.var>
 <xbar.var>boolean(MONITOR_DOTENV=true): Monitor new .env files in home directory</xbar.var>
 <xbar.var>boolean(MONITOR_DANGEROUS_COMMANDS=true): Monitor npx, uvx, op commands</xbar.var>
 <xbar.var>boolean(MONITOR_DNS=true): Monitor DNS resolver changes</xbar.var>
@@ -31,14 +33,22 @@ port scans, network connections, and more using the unified logging system.
 """
 
 import os
+import re
 import sys
 import json
+import time
+import heapq
+import random
+import bisect
+import socket
+import functools
+import threading
 import asyncio
 import subprocess
 import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, List, Dict, Tuple, Any
+from typing import Optional, List, Dict, Tuple, Any, Callable
 
 # Try to import desktop-notifier for rich notifications
 try:
@@ -47,13 +57,139 @@ try:
 except ImportError:
     DESKTOP_NOTIFIER_AVAILABLE = False
 
+# Optional faster JSON libraries (see JSON Codec)
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration
 APP_NAME = "Security Growler"
-STATE_DIR = Path.home() / "Library" / "Application Support" / "SecurityGrowler"
+
+# Linux host mode: journald, /proc and `ip` instead of /usr/bin/log, lsof and ifconfig
+IS_LINUX = sys.platform.startswith("linux")
+
+if IS_LINUX:
+    STATE_DIR = Path(os.environ.get("XDG_STATE_HOME") or Path.home() / ".local" / "state") / "security-growler"
+    LOG_FILE = STATE_DIR / "security-growler.log"
+else:
+    STATE_DIR = Path.home() / "Library" / "Application Support" / "SecurityGrowler"
+    LOG_FILE = Path.home() / "Library" / "Logs" / "SecurityGrowler.log"
 STATE_FILE = STATE_DIR / "state.json"
-LOG_FILE = Path.home() / "Library" / "Logs" / "SecurityGrowler.log"
-MAX_EVENTS = 50
+MAX_EVENTS = 20000      # events retained in history (indexed, so render cost doesn't grow with this)
+MENU_EVENTS = 20        # events shown in the "Recent Events" menu
+MENU_CATEGORY_EVENTS = 5    # events shown per monitor in the "By Monitor" menu
+MENU_TOP_SOURCES = 5    # sources shown in the "Top Sources" menu
 MAX_LOG_LINES = 1000
+MAX_SEEN_EVENTS = 5000  # log entry IDs remembered to avoid re-alerting (bursts can exceed a few hundred per tick)
+
+
+# =============================================================================
+# JSON Codec
+# =============================================================================
+#
+# Decoding `log show` output and loading/saving state.json are a measurable
+# part of every tick. JSON_CODEC picks the library: "json", "orjson",
+# "msgspec", or "auto" (the default), which takes the fastest installed one
+# for each job (see `bench codec`): msgspec decodes log entries straight into
+# LogEntry structs, skipping the fields no monitor reads (backtraces, image
+# UUIDs...); orjson is quickest for state.json; the standard json module is
+# the fallback.
+
+JSON_CODEC = os.environ.get("JSON_CODEC", "auto")
+
+
+def _stdlib_json_loads(data: Any) -> Any:
+    return json.loads(data)
+
+
+def _json_default(obj: Any) -> Any:
+    """Fallback encoding: LogEntry structs as the dicts they stand for, anything else as str."""
+    if msgspec is not None and isinstance(obj, msgspec.Struct):
+        return msgspec.to_builtins(obj)
+    return str(obj)
+
+
+def _stdlib_json_dumps(obj: Any, indent: bool = False) -> bytes:
+    if indent:
+        return json.dumps(obj, indent=2, default=_json_default).encode()
+    return json.dumps(obj, separators=(",", ":"), default=_json_default).encode()
+
+
+def _orjson_dumps(obj: Any, indent: bool = False) -> bytes:
+    options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+    return orjson.dumps(obj, default=_json_default, option=options)
+
+
+def _msgspec_dumps(obj: Any, indent: bool = False) -> bytes:
+    data = _msgspec_encoder.encode(obj)
+    return msgspec.json.format(data, indent=2) if indent else data
+
+
+if msgspec is not None:
+    class LogEntry(msgspec.Struct, omit_defaults=True):
+        """
+        One `log show --style json` entry. Has the dict-style get() the
+        parsers use, so it is interchangeable with the plain dicts that
+        journald and the other codecs produce.
+        """
+        eventMessage: Optional[str] = None
+        process: Optional[str] = None
+        processImagePath: Optional[str] = None
+        senderImagePath: Optional[str] = None
+        subsystem: Optional[str] = None
+        category: Optional[str] = None
+        messageType: Optional[str] = None
+        eventType: Optional[str] = None
+        timestamp: Optional[str] = None
+        eventID: Optional[int] = None
+        traceID: Optional[int] = None
+        processID: Optional[int] = None
+
+        def get(self, key: str, default: Any = None) -> Any:
+            value = getattr(self, key, None)
+            return default if value is None else value
+
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=str)
+    _msgspec_log_decoder = msgspec.json.Decoder(List[LogEntry])
+
+
+# name -> (loads, dumps); dumps returns bytes and takes indent=True for files people edit
+JSON_CODECS = {"json": (_stdlib_json_loads, _stdlib_json_dumps)}
+if orjson is not None:
+    JSON_CODECS["orjson"] = (orjson.loads, _orjson_dumps)
+if msgspec is not None:
+    JSON_CODECS["msgspec"] = (msgspec.json.decode, _msgspec_dumps)
+
+
+def get_json_codec_name() -> str:
+    """Resolve JSON_CODEC for general encoding/decoding ("auto" picks the fastest installed library)."""
+    if JSON_CODEC in JSON_CODECS:
+        return JSON_CODEC
+    return next(name for name in ("orjson", "msgspec", "json") if name in JSON_CODECS)
+
+
+def json_loads(data: Any) -> Any:
+    """Decode JSON (str or bytes) with the configured codec."""
+    return JSON_CODECS[get_json_codec_name()][0](data)
+
+
+def json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Encode JSON to bytes with the configured codec (compact unless indent)."""
+    return JSON_CODECS[get_json_codec_name()][1](obj, indent)
+
+
+def json_decode_error() -> Tuple[type, ...]:
+    """Exceptions the configured codec raises on malformed input."""
+    errors: Tuple[type, ...] = (ValueError,)   # json.JSONDecodeError and orjson.JSONDecodeError
+    if msgspec is not None:
+        errors += (msgspec.DecodeError,)
+    return errors
+
 
 # Monitor toggle management
 def get_monitor_overrides() -> Dict[str, bool]:
@@ -62,9 +198,8 @@ def get_monitor_overrides() -> Dict[str, bool]:
     overrides_file = STATE_DIR / "monitor_overrides.json"
     if overrides_file.exists():
         try:
-            with open(overrides_file, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+            return json_loads(overrides_file.read_bytes())
+        except (*json_decode_error(), IOError):
             pass
     return {}
 
@@ -73,19 +208,23 @@ def toggle_monitor(monitor_name: str) -> None:
     STATE_DIR.mkdir(parents=True, exist_ok=True)
     overrides_file = STATE_DIR / "monitor_overrides.json"
 
-    # Load current overrides
-    overrides = get_monitor_overrides()
+    # Two quick clicks must not both toggle from the same old value
+    with _locked(STATE_DIR / "monitor_overrides.lock"):
+        # Load current overrides
+        overrides = get_monitor_overrides()
+
+        # Get current effective state (env var default, then override)
+        env_default = os.environ.get(monitor_name, "true").lower() == "true"
+        current_state = overrides.get(monitor_name, env_default)
 
-    # Get current effective state (env var default, then override)
-    env_default = os.environ.get(monitor_name, "true").lower() == "true"
-    current_state = overrides.get(monitor_name, env_default)
+        # Toggle it
+        overrides[monitor_name] = not current_state
 
-    # Toggle it
-    overrides[monitor_name] = not current_state
+        # Save
+        write_atomic(overrides_file, json_dumps(overrides, indent=True))
 
-    # Save
-    with open(overrides_file, "w") as f:
-        json.dump(overrides, f, indent=2)
+    # The refresh xbar does after the click should run the monitor right away
+    request_refresh()
 
 def is_monitor_enabled(monitor_name: str, env_default: str = "true") -> bool:
     """Check if a monitor is enabled, considering both env vars and overrides."""
@@ -110,9 +249,11 @@ MONITOR_LOCAL_IP = is_monitor_enabled("MONITOR_LOCAL_IP")
 MONITOR_MDM = is_monitor_enabled("MONITOR_MDM")
 MONITOR_ARP_SPOOF = is_monitor_enabled("MONITOR_ARP_SPOOF")
 
-# Listening port range to monitor
-LISTENING_PORT_MIN = 21
-LISTENING_PORT_MAX = 9999
+# Listening port ranges to monitor, plus ports/ranges/process names to ignore
+LISTENING_PORT_RANGES = os.environ.get("LISTENING_PORT_RANGES", "22-9998")
+LISTENING_IGNORE = os.environ.get("LISTENING_IGNORE", "")
+# How long a listening socket may vanish before it counts as gone (avoids re-alerts on blips)
+LISTENING_GRACE_SECONDS = int(os.environ.get("LISTENING_GRACE_SECONDS", "300"))
 
 # Dangerous commands to monitor
 DANGEROUS_COMMANDS = ["npx", "uvx", "op"]
@@ -143,20 +284,81 @@ ALERT_ICON = "iVBORw0KGgoAAAANSUhEUgAAABAAAAAQCAYAAAAf8/9hAAAABHNCSVQICAgIfAhkiA
 # =============================================================================
 # State Management
 # =============================================================================
+#
+# The menubar app can start the script while a previous run is still going
+# (the timer, "Refresh Now" and toggle clicks all spawn one), and each run is
+# load_state -> collect -> save_state. Runs therefore take TICK_LOCK_FILE
+# first: a run that can't get it within TICK_LOCK_WAIT seconds renders the
+# last saved state instead of collecting again, so overlapping runs neither
+# repeat the probes nor overwrite each other's seen_events. State and
+# overrides are written to a temp file and renamed into place, so a reader
+# never sees a half-written file.
+
+TICK_LOCK_FILE = STATE_DIR / "tick.lock"
+TICK_LOCK_WAIT = float(os.environ.get("TICK_LOCK_WAIT", "2"))
+
+
+def _locked(path: Path, blocking: bool = True):
+    """
+    Open and flock a lock file; returns the handle, or None if another
+    process holds it (non-blocking only). Any other failure, e.g. a
+    filesystem without flock, raises OSError rather than looking like
+    "busy", so `with _locked(...)` never gets None.
+    """
+    import fcntl
+
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        handle.close()
+        return None
+    except OSError:
+        handle.close()
+        raise
+    return handle
+
+
+def acquire_tick_lock(wait: float = TICK_LOCK_WAIT):
+    """The tick lock's handle, or None if another run still holds it after `wait` seconds."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    deadline = time.monotonic() + wait
+    while True:
+        handle = _locked(TICK_LOCK_FILE, blocking=False)
+        if handle is not None or time.monotonic() >= deadline:
+            return handle
+        time.sleep(0.1)
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace a file's contents in one step (write a temp file, then rename it over)."""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
 
 def load_state() -> Dict[str, Any]:
     """Load persisted state from disk."""
     STATE_DIR.mkdir(parents=True, exist_ok=True)
     if STATE_FILE.exists():
         try:
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
+            state = json_loads(STATE_FILE.read_bytes())
+            # Events are stored as compact rows (dicts in state from older versions)
+            state["events"] = [
+                Event.from_row(row) if isinstance(row, list) else Event.from_record(row)
+                for row in state.get("events", [])
+            ]
+            return state
+        except (*json_decode_error(), IOError):
             pass
     return {
         "last_check": None,
         "seen_events": [],
-        "known_connections": {},
+        "connections": {},
         "events": [],
     }
 
@@ -164,11 +366,9 @@ def load_state() -> Dict[str, Any]:
 def save_state(state: Dict[str, Any]) -> None:
     """Save state to disk."""
     STATE_DIR.mkdir(parents=True, exist_ok=True)
-    # Trim events to prevent unbounded growth
-    state["events"] = state["events"][-MAX_EVENTS:]
-    state["seen_events"] = state["seen_events"][-500:]
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f, indent=2, default=str)
+    # Trim to prevent unbounded growth (events are trimmed as they're added)
+    state["seen_events"] = state["seen_events"][-MAX_SEEN_EVENTS:]
+    write_atomic(STATE_FILE, json_dumps(dict(state, events=[event.to_row() for event in state["events"]])))
 
 
 def log_event(event_type: str, title: str, body: str) -> None:
@@ -188,793 +388,3663 @@ def log_event(event_type: str, title: str, body: str) -> None:
 
 
 # =============================================================================
-# Auto-Update Checking
+# Event Records
 # =============================================================================
+#
+# Monitors return Event records. Up to MAX_EVENTS of them stay in memory as the
+# history, so they are slotted and their repeated strings (monitor, severity,
+# source, user, process) are interned. Besides the rendered title and body an
+# event carries its details as data: the source IP, user and process, plus a
+# small `fields` map (port, pid, command...). The index, archive and sinks read
+# those directly instead of re-parsing the text.
+#
+# state.json stores each event as a compact row (to_row); the archive, sinks
+# and fleet get flat JSON records (to_record), whose keys are unchanged from
+# when events were plain dicts.
+
+# Offset between the monotonic clock and the wall clock, for events loaded from disk
+_MONOTONIC_OFFSET = time.monotonic() - time.time()
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else None
+
+
+class Event:
+    """One security event, as reported by a monitor."""
+
+    __slots__ = ("seq", "ts", "mono", "monitor", "severity", "title", "body", "source", "user", "process", "fields")
+
+    def __init__(
+        self,
+        severity: str,
+        title: str,
+        body: str,
+        monitor: str = "other",
+        source: Optional[str] = None,
+        user: Optional[str] = None,
+        process: Optional[str] = None,
+        fields: Optional[Dict[str, Any]] = None,
+        ts: Optional[float] = None,
+        seq: int = -1,
+    ):
+        self.seq = seq
+        if ts is None:
+            self.ts = time.time()
+            self.mono = time.monotonic()
+        else:
+            self.ts = ts
+            self.mono = ts + _MONOTONIC_OFFSET
+        self.monitor = sys.intern(monitor)
+        self.severity = sys.intern(severity)   # "alert" or "notify"
+        self.title = title
+        self.body = body
+        self.source = _intern(source)
+        self.user = _intern(user)
+        self.process = _intern(process)
+        self.fields = fields or None   # most events have none; don't keep an empty dict each
+
+    def __repr__(self) -> str:
+        return f"Event({self.monitor}/{self.severity}: {self.title!r})"
+
+    @property
+    def date(self) -> datetime:
+        return datetime.fromtimestamp(self.ts)
+
+    def to_row(self) -> List[Any]:
+        """Compact positional form for state.json."""
+        return [self.seq, round(self.ts, 3), self.monitor, self.severity, self.title, self.body, self.source, self.user, self.process, self.fields]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "Event":
+        # Skips __init__: a full history is decoded on every tick
+        event = cls.__new__(cls)
+        event.seq, event.ts, monitor, severity, event.title, event.body, source, user, process, event.fields = row
+        event.mono = event.ts + _MONOTONIC_OFFSET
+        event.monitor = sys.intern(monitor)
+        event.severity = sys.intern(severity)
+        event.source = source and sys.intern(source)
+        event.user = user and sys.intern(user)
+        event.process = process and sys.intern(process)
+        return event
+
+    def to_record(self) -> Dict[str, Any]:
+        """Flat JSON record for the archive, sinks and `--json` output."""
+        record = {
+            "seq": self.seq,
+            "date": self.date.isoformat(),
+            "monitor": self.monitor,
+            "type": self.severity,
+            "title": self.title,
+            "body": self.body,
+            "source": self.source,
+        }
+        if self.user:
+            record["user"] = self.user
+        if self.process:
+            record["process"] = self.process
+        if self.fields:
+            record["fields"] = self.fields
+        return record
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "Event":
+        try:
+            ts = datetime.fromisoformat(record["date"]).timestamp()
+        except (KeyError, ValueError, TypeError):
+            ts = time.time()
+        return cls(
+            record.get("type", "notify"), record.get("title", ""), record.get("body", ""),
+            record.get("monitor") or "other", record.get("source"), record.get("user"), record.get("process"),
+            record.get("fields"), ts=ts, seq=record.get("seq", -1),
+        )
 
-def compute_file_sha256(filepath: str) -> Optional[str]:
-    """Compute SHA256 hash of a file."""
-    try:
-        sha256_hash = hashlib.sha256()
-        with open(filepath, "rb") as f:
-            # Read in chunks to handle large files
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
-    except (IOError, OSError):
-        return None
 
+# =============================================================================
+# Event History
+# =============================================================================
+#
+# state["events"] holds up to MAX_EVENTS events in order, each tagged with a
+# sequence number. state["event_index"] is kept up to date as events are added
+# and evicted, so the menu can show per-monitor views, top sources and recent
+# counts without rescanning the history:
+#   by_type / by_monitor / by_source: counts over the retained history
+#   recent: monitor -> sequence numbers of its latest events
+#   minutes / hours: time buckets of counts for the last hour / day
+#   top_sources: cached top sources (recomputed only when a member shrinks)
 
-def fetch_remote_script_hash() -> Optional[str]:
-    """Fetch the latest version of this script from GitHub and compute its hash."""
-    github_raw_url = "https://github.com/pirate/security-growler/raw/master/security-growler.30s.py"
+_IP_PATTERN = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\b(?:[0-9a-fA-F]{1,4}:){2,7}[0-9a-fA-F]{1,4}\b")
 
-    try:
-        # Use curl to fetch the remote script
-        result = subprocess.run(
-            ["curl", "--max-time", "10", "--silent", "--location", github_raw_url],
-            capture_output=True,
-            timeout=15
-        )
 
-        if result.returncode != 0:
-            return None
+def extract_event_source(text: str) -> Optional[str]:
+    """Pull the first IP address mentioned in a free-text message, if any."""
+    match = _IP_PATTERN.search(text)
+    return match.group(0) if match else None
 
-        # Compute hash of remote content
-        remote_content = result.stdout
-        if not remote_content:
-            return None
 
-        sha256_hash = hashlib.sha256()
-        sha256_hash.update(remote_content)
-        return sha256_hash.hexdigest()
+def new_event_index() -> Dict[str, Any]:
+    """Create an empty event index."""
+    return {
+        "by_type": {},
+        "by_monitor": {},
+        "by_source": {},
+        "recent": {},
+        "minutes": {},
+        "hours": {},
+        "top_sources": [],
+        "top_dirty": False,
+    }
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return None
 
+def _bump(counts: Dict[str, int], key: str, delta: int) -> None:
+    """Adjust a counter, dropping it when it reaches zero."""
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
 
-def check_for_updates(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Check if a new version is available on GitHub."""
-    events = []
 
-    # Only check once per day
-    last_update_check = state.get("last_update_check")
-    if last_update_check:
-        try:
-            last_check_time = datetime.fromisoformat(last_update_check)
-            if datetime.now() - last_check_time < timedelta(days=1):
-                # Skip check, too soon
-                return events
-        except (ValueError, TypeError):
-            pass
+def _bump_bucket(buckets: Dict[str, Dict[str, Any]], bucket: int, keep: int, event: Event) -> None:
+    """Count an event in a time bucket, dropping buckets older than `keep`."""
+    counts = buckets.setdefault(str(bucket), {"n": 0, "alerts": 0, "m": {}})
+    counts["n"] += 1
+    if event.severity == "alert":
+        counts["alerts"] += 1
+    _bump(counts["m"], event.monitor, 1)
 
-    # Get path to this script
-    script_path = os.path.abspath(__file__)
+    for key in [k for k in buckets if int(k) <= bucket - keep]:
+        del buckets[key]
 
-    # Compute local hash
-    local_hash = compute_file_sha256(script_path)
-    if not local_hash:
-        return events
 
-    # Fetch and compute remote hash
-    remote_hash = fetch_remote_script_hash()
-    if not remote_hash:
-        # Failed to fetch, but don't alert
-        return events
+def index_event(index: Dict[str, Any], event: Event, now: Optional[float] = None) -> None:
+    """Add an event to the index."""
+    now = event.ts if now is None else now
+    monitor = event.monitor
+    source = event.source
 
-    # Compare hashes
-    if local_hash != remote_hash:
-        title = "UPDATE AVAILABLE"
-        body = "New version of Security Growler detected"
-        download_url = "https://github.com/pirate/security-growler/releases"
-        events.append(("alert", title, f"{body} - {download_url}"))
+    _bump(index["by_type"], event.severity, 1)
+    _bump(index["by_monitor"], monitor, 1)
 
-    # Update last check time
-    state["last_update_check"] = datetime.now().isoformat()
+    recent = index["recent"].setdefault(monitor, [])
+    recent.append(event.seq)
+    del recent[:-MENU_CATEGORY_EVENTS]
 
-    return events
+    _bump_bucket(index["minutes"], int(now // 60), 60, event)
+    _bump_bucket(index["hours"], int(now // 3600), 24, event)
 
+    if source:
+        _bump(index["by_source"], source, 1)
+        top = index["top_sources"]
+        if source in top or len(top) < MENU_TOP_SOURCES or index["by_source"][source] > index["by_source"].get(top[-1], 0):
+            if source not in top:
+                top.append(source)
+            top.sort(key=lambda src: -index["by_source"].get(src, 0))
+            del top[MENU_TOP_SOURCES:]
 
-# =============================================================================
-# Notifications
-# =============================================================================
 
-# Global notifier instance (initialized lazily)
-_notifier: Optional["DesktopNotifier"] = None
+def unindex_event(index: Dict[str, Any], event: Event) -> None:
+    """Remove an evicted event from the history counts (time buckets age out on their own)."""
+    _bump(index["by_type"], event.severity, -1)
+    _bump(index["by_monitor"], event.monitor, -1)
 
+    source = event.source
+    if source:
+        _bump(index["by_source"], source, -1)
+        if source in index["top_sources"]:
+            index["top_dirty"] = True
 
-def _get_notifier() -> Optional["DesktopNotifier"]:
-    """Get or create the desktop notifier instance."""
-    global _notifier
-    if DESKTOP_NOTIFIER_AVAILABLE and _notifier is None:
-        _notifier = DesktopNotifier(
-            app_name=APP_NAME,
-            notification_limit=10,
-        )
-    return _notifier
 
+def top_sources(index: Dict[str, Any]) -> List[Tuple[str, int]]:
+    """Most frequent sources in the retained history."""
+    if index["top_dirty"]:
+        index["top_sources"] = heapq.nlargest(MENU_TOP_SOURCES, index["by_source"], key=index["by_source"].get)
+        index["top_dirty"] = False
+    return [(src, index["by_source"][src]) for src in index["top_sources"] if src in index["by_source"]]
 
-async def _send_notification_async(title: str, message: str, is_alert: bool = False) -> None:
-    """Send notification using desktop-notifier (async)."""
-    notifier = _get_notifier()
-    if notifier is None:
-        return
 
-    try:
-        await notifier.send(
-            title=title,
-            message=message,
-            urgency=Urgency.Critical if is_alert else Urgency.Normal,
-            sound=DEFAULT_SOUND if is_alert else None,
-        )
-    except Exception:
-        pass
+def count_recent_events(index: Dict[str, Any], window: str = "hour", monitor: Optional[str] = None, alerts_only: bool = False) -> int:
+    """Count events in the last hour ("hour") or day ("day") from the time buckets."""
+    if window == "hour":
+        buckets, current, span = index["minutes"], int(time.time() // 60), 60
+    else:
+        buckets, current, span = index["hours"], int(time.time() // 3600), 24
 
+    total = 0
+    for key, counts in buckets.items():
+        if int(key) > current - span:
+            if monitor is not None:
+                total += counts["m"].get(monitor, 0)
+            else:
+                total += counts["alerts"] if alerts_only else counts["n"]
+    return total
+
+
+def get_event_index(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the event index, rebuilding it if missing (e.g. state from an older version)."""
+    index = state.get("event_index")
+    if index is None:
+        index = new_event_index()
+        for seq, event in enumerate(state["events"]):
+            event.seq = seq
+            if event.source is None:
+                event.source = _intern(extract_event_source(f"{event.title} {event.body}"))
+            index_event(index, event)
+        state["event_index"] = index
+        state["event_seq"] = len(state["events"])
+    return index
+
+
+def append_event(state: Dict[str, Any], event: Event) -> Event:
+    """Add an event to the history, keeping the index up to date."""
+    index = get_event_index(state)
+    rollups = get_rollups(state)
+    event.seq = state.get("event_seq", 0)
+    state["event_seq"] = event.seq + 1
+
+    state["events"].append(event)
+    index_event(index, event)
+    count_rollup(rollups, event)
+
+    # Evict the oldest events once the history is full
+    overflow = len(state["events"]) - MAX_EVENTS
+    if overflow > 0:
+        for old in state["events"][:overflow]:
+            unindex_event(index, old)
+        del state["events"][:overflow]
+
+    return event
+
+
+def get_event_by_seq(state: Dict[str, Any], seq: int) -> Optional[Event]:
+    """Look up a retained event by sequence number in O(1)."""
+    events = state["events"]
+    if not events:
+        return None
+    position = seq - events[0].seq
+    if 0 <= position < len(events):
+        return events[position]
+    return None
 
-def _send_notification_osascript(title: str, message: str, is_alert: bool = False) -> None:
-    """Fallback: Send a macOS notification using osascript."""
-    # Escape quotes for AppleScript
-    title_escaped = title.replace('"', '\\"').replace("'", "\\'")
-    message_escaped = message.replace('"', '\\"').replace("'", "\\'")
 
-    sound = 'sound name "Sosumi"' if is_alert else ""
-    script = f'''
-    display notification "{message_escaped}" with title "{APP_NAME}" subtitle "{title_escaped}" {sound}
-    '''
+# =============================================================================
+# Rollup Statistics
+# =============================================================================
+#
+# Calendar counters per monitor behind the menu's trends ("SSH: 3 today, 41
+# this week"). state["rollups"] holds buckets of {monitor: [events, alerts]}
+# keyed by local hour, day or week number:
+#   hours: today's hours (each event bumps its hour bucket, O(1))
+#   days:  earlier days of this week, rolled up from their hours
+#   weeks: earlier weeks, rolled up from their days (ROLLUP_WEEKS kept)
+# Rolling up happens when the hour changes and touches at most a day's worth
+# of buckets, so the rollups stay a fixed size however many events there are.
 
-    try:
-        subprocess.run(
-            ["osascript", "-e", script],
-            capture_output=True,
-            timeout=5
-        )
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        pass
+ROLLUP_WEEKS = 52
 
 
-def send_notification(title: str, message: str, is_alert: bool = False) -> None:
-    """Send a macOS notification using desktop-notifier or fallback to osascript."""
-    if not SHOW_NOTIFICATIONS:
-        return
+def _rollup_keys(ts: float) -> Tuple[int, int, int]:
+    """(hour, day, week) numbers of a timestamp in local time; weeks start on Monday."""
+    when = datetime.fromtimestamp(ts)
+    day = when.toordinal()
+    return day * 24 + when.hour, day, (day - 1) // 7
 
-    if DESKTOP_NOTIFIER_AVAILABLE:
-        try:
-            asyncio.run(_send_notification_async(title, message, is_alert))
-        except Exception:
-            # Fallback to osascript if async fails
-            _send_notification_osascript(title, message, is_alert)
-    else:
-        _send_notification_osascript(title, message, is_alert)
 
+def new_rollups() -> Dict[str, Any]:
+    return {"hours": {}, "days": {}, "weeks": {}, "hour": 0}
 
-# =============================================================================
-# Unified Log Reader
-# =============================================================================
 
-def get_log_entries(predicate: str, since_minutes: int = 1) -> List[Dict[str, str]]:
-    """
-    Query the macOS unified logging system using /usr/bin/log.
+def _merge_rollup_bucket(into: Dict[str, List[int]], counts: Dict[str, List[int]]) -> None:
+    for monitor, (n, alerts) in counts.items():
+        total = into.setdefault(monitor, [0, 0])
+        total[0] += n
+        total[1] += alerts
 
-    Args:
-        predicate: Log predicate filter string
-        since_minutes: How many minutes back to query
 
-    Returns:
-        List of log entries as dictionaries
-    """
-    # Calculate start time
-    start_time = (datetime.now() - timedelta(minutes=since_minutes)).strftime("%Y-%m-%d %H:%M:%S")
+def roll_up(rollups: Dict[str, Any], now: Optional[float] = None) -> None:
+    """Fold hours from before today into days, and days from before this week into weeks."""
+    hour, today, this_week = _rollup_keys(time.time() if now is None else now)
+    if hour <= rollups["hour"]:
+        return
+    rollups["hour"] = hour
+
+    for key in [key for key in rollups["hours"] if int(key) // 24 < today]:
+        _merge_rollup_bucket(rollups["days"].setdefault(str(int(key) // 24), {}), rollups["hours"].pop(key))
+    for key in [key for key in rollups["days"] if (int(key) - 1) // 7 < this_week]:
+        _merge_rollup_bucket(rollups["weeks"].setdefault(str((int(key) - 1) // 7), {}), rollups["days"].pop(key))
+    for key in [key for key in rollups["weeks"] if int(key) <= this_week - ROLLUP_WEEKS]:
+        del rollups["weeks"][key]
+
+
+def count_rollup(rollups: Dict[str, Any], event: Event) -> None:
+    """Count an event in its hour bucket."""
+    roll_up(rollups, event.ts)
+    hour = _rollup_keys(event.ts)[0]
+    counts = rollups["hours"].setdefault(str(hour), {}).setdefault(event.monitor, [0, 0])
+    counts[0] += 1
+    counts[1] += event.severity == "alert"
+
+
+def get_rollups(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the rollups, seeding them from the retained history if missing (state from an older version)."""
+    rollups = state.get("rollups")
+    if rollups is None:
+        rollups = new_rollups()
+        for event in state["events"]:
+            count_rollup(rollups, event)
+        state["rollups"] = rollups
+    return rollups
+
+
+def rollup_counts(rollups: Dict[str, Any], first_day: int, last_day: int) -> Dict[str, List[int]]:
+    """{monitor: [events, alerts]} for the local days first_day..last_day (ordinals, inclusive)."""
+    totals: Dict[str, List[int]] = {}
+    for key, counts in rollups["hours"].items():
+        if first_day <= int(key) // 24 <= last_day:
+            _merge_rollup_bucket(totals, counts)
+    for key, counts in rollups["days"].items():
+        if first_day <= int(key) <= last_day:
+            _merge_rollup_bucket(totals, counts)
+    for key, counts in rollups["weeks"].items():
+        # Weeks are only rolled up once over, so they're either inside the range or not
+        if first_day <= int(key) * 7 + 1 and int(key) * 7 + 7 <= last_day:
+            _merge_rollup_bucket(totals, counts)
+    return totals
+
+
+def monitor_trends(rollups: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Dict[str, List[int]]]:
+    """Per-monitor counts for today, this week and last week."""
+    _, today, this_week = _rollup_keys(time.time() if now is None else now)
+    monday = this_week * 7 + 1
+    return {
+        "today": rollup_counts(rollups, today, today),
+        "week": rollup_counts(rollups, monday, today),
+        "last_week": rollup_counts(rollups, monday - 7, monday - 1),
+    }
 
-    cmd = [
-        "/usr/bin/log", "show",
-        "--predicate", predicate,
-        "--start", start_time,
-        "--style", "json",
-        "--info",
-        "--debug",
+
+# =============================================================================
+# Incident Correlation
+# =============================================================================
+#
+# Separate alerts for an SSH login, a sudo, a new listening port and a new
+# .env file read better as one incident. Every new event is filed under its
+# correlation keys - user, source IP and session lineage (the process under
+# the service that started it, e.g. the sshd handling one connection) - in
+# state["correlation"]["buffers"], which only hold the last CORRELATION_WINDOW
+# seconds (and at most CORRELATION_MAX_PER_KEY events per key). A new event
+# is then checked against the patterns that contain its monitor, using only
+# the buffers of its own keys, so the work per event doesn't grow with the
+# history. When a pattern's steps have happened in order for one key, an
+# "INCIDENT" alert is added listing the member events.
+#
+# Patterns come from RULES_FILE as [[incident]] tables, ahead of the defaults:
+#
+#   [[incident]]
+#   id = "scan-then-smb"
+#   title = "Port scan followed by an SMB connection"
+#   steps = ["portscan", { monitor = "ports", title = "PORT 445" }]
+#   by = ["source"]                   # user, source and/or lineage
+#   window = 3600                     # seconds from first to last step
+#
+# A step is a monitor name, a table with `monitor` and an optional `title`
+# prefix the event's title must start with, or a list of those (any of).
+
+CORRELATION_WINDOW = int(os.environ.get("CORRELATION_WINDOW", "3600"))   # longest pattern window kept
+CORRELATION_MAX_PER_KEY = 32
+CORRELATION_MAX_ENTRIES = 5000
+CORRELATION_KEYS = ("user", "source", "lineage")
+
+
+def default_incident_patterns() -> List[Dict[str, Any]]:
+    """Built-in incident patterns."""
+    login = {"monitor": "ssh", "title": "SSH LOGIN"}
+    return [
+        {"id": "login-escalation", "title": "SSH login followed by sudo",
+         "steps": [login, "sudo"], "by": ["user", "lineage"], "window": 900},
+        {"id": "login-persistence", "title": "SSH login, sudo, then a new listener or .env file",
+         "steps": [login, "sudo", ["listening", "dotenv"]], "by": ["user", "lineage"], "window": 3600},
+        {"id": "scan-then-access", "title": "Port scan followed by access from the same address",
+         "steps": ["portscan", [login, "ports", "vnc"]], "by": ["source"], "window": 3600},
     ]
 
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
 
-        if result.returncode != 0:
-            return []
+def _compile_incident_step(step: Any) -> List[Tuple[str, str]]:
+    """A pattern step as its alternatives, [(monitor, title prefix), ...]."""
+    alternatives = []
+    for option in _as_list(step):
+        if isinstance(option, dict):
+            if "monitor" not in option:
+                raise ValueError("step needs a monitor")
+            alternatives += [(str(monitor), str(option.get("title", ""))) for monitor in _as_list(option["monitor"])]
+        else:
+            alternatives.append((str(option), ""))
+    return alternatives
 
-        # Parse JSON output
-        output = result.stdout.strip()
-        if not output:
-            return []
 
-        # The log command outputs JSON array
-        try:
-            entries = json.loads(output)
-            return entries if isinstance(entries, list) else []
-        except json.JSONDecodeError:
-            # Sometimes output is line-delimited JSON
-            entries = []
-            for line in output.splitlines():
-                line = line.strip()
-                if line.startswith("{"):
-                    try:
-                        entries.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-            return entries
+def _step_matches(step: List[Tuple[str, str]], monitor: str, title: str) -> bool:
+    return any(monitor == name and title.startswith(prefix) for name, prefix in step)
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
 
+class IncidentPatterns:
+    """Incident patterns indexed by the monitors their steps mention."""
 
-# =============================================================================
-# SSH Parser
-# =============================================================================
+    def __init__(self, patterns: List[Dict[str, Any]]):
+        self.patterns: List[Dict[str, Any]] = []
+        self.by_monitor: Dict[str, List[Dict[str, Any]]] = {}
+        self.errors: List[str] = []
+        seen_ids = set()
+        for i, raw in enumerate(patterns):
+            pattern_id = str(raw.get("id", f"incident-{i + 1}")) if isinstance(raw, dict) else f"incident-{i + 1}"
+            try:
+                if not isinstance(raw, dict) or not raw.get("steps"):
+                    raise ValueError("needs a list of steps")
+                by = [str(key) for key in _as_list(raw.get("by", list(CORRELATION_KEYS)))]
+                unknown = [key for key in by if key not in CORRELATION_KEYS]
+                if unknown:
+                    raise ValueError(f"unknown key(s) {', '.join(unknown)} (use {', '.join(CORRELATION_KEYS)})")
+                pattern = {
+                    "id": pattern_id,
+                    "title": str(raw.get("title", pattern_id)),
+                    "steps": [_compile_incident_step(step) for step in _as_list(raw["steps"])],
+                    "by": set(by),
+                    "window": min(float(raw.get("window", CORRELATION_WINDOW)), CORRELATION_WINDOW),
+                }
+            except (TypeError, ValueError) as e:
+                self.errors.append(f"incident {pattern_id}: {e}")
+                continue
+            # A user pattern replaces the built-in with the same id
+            if pattern_id in seen_ids:
+                continue
+            seen_ids.add(pattern_id)
+            self.patterns.append(pattern)
+            for monitor in {name for step in pattern["steps"] for name, _ in step}:
+                self.by_monitor.setdefault(monitor, []).append(pattern)
 
-def parse_ssh_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Parse SSH events from unified log."""
-    if not MONITOR_SSH:
-        return []
 
-    events = []
+_incident_patterns_cache: Dict[str, Any] = {"mtime": None, "patterns": None}
 
-    # Query for sshd events
-    predicate = '(process == "sshd") AND (eventMessage CONTAINS "Accepted" OR eventMessage CONTAINS "Failed" OR eventMessage CONTAINS "error")'
 
-    entries = get_log_entries(predicate)
+def get_incident_patterns() -> IncidentPatterns:
+    """Compiled incident patterns, recompiled only when RULES_FILE changes."""
+    try:
+        mtime = os.path.getmtime(RULES_FILE)
+    except OSError:
+        mtime = 0
+    if _incident_patterns_cache["patterns"] is None or _incident_patterns_cache["mtime"] != mtime:
+        user_patterns: List[Dict[str, Any]] = []
+        errors = []
+        if mtime:
+            try:
+                user_patterns = load_rules_file(RULES_FILE, section="incident")
+            except (OSError, ValueError, ImportError) as e:
+                errors.append(f"{RULES_FILE}: {e}")
+        patterns = IncidentPatterns(user_patterns + default_incident_patterns())
+        patterns.errors[:0] = errors
+        _incident_patterns_cache.update(mtime=mtime, patterns=patterns)
+    return _incident_patterns_cache["patterns"]
 
-    for entry in entries:
-        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
-        if event_id in state["seen_events"]:
-            continue
 
-        message = entry.get("eventMessage", "")
-        timestamp = entry.get("timestamp", "")
+def session_lineage(pid: Any) -> Optional[str]:
+    """
+    Identity of the session a process belongs to: its outermost ancestor
+    below the top-level service (the per-connection sshd under the sshd
+    listener, the login under Terminal), or itself if it is that process.
+    """
+    if not pid:
+        return None
+    snapshot = get_process_snapshot()
+    proc = snapshot.get(pid)
+    if not proc:
+        return None
+    chain = [proc] + snapshot.parent_chain(pid)
+    return (chain[-2] if len(chain) >= 2 else chain[-1])["identity"]
+
 
-        if "Accepted publickey" in message or "Accepted keyboard" in message:
-            # Successful login
-            user = ""
-            src = ""
-            if " for " in message:
-                user = message.split(" for ", 1)[-1].split(" ", 1)[0]
-            if " from " in message:
-                src = message.split(" from ", 1)[-1].split(" ", 1)[0]
-
-            method = "Public Key" if "publickey" in message else "Password"
-            title = f"SSH LOGIN: {user}"
-            body = f"from {src} via {method}"
-            events.append(("alert", title, body))
-            state["seen_events"].append(event_id)
+def correlation_keys(event: Event) -> List[str]:
+    """The buffers an event is filed under, e.g. ["user:bob", "source:203.0.113.7"]."""
+    keys = []
+    if event.user and event.user not in ("unknown", "root"):
+        keys.append(f"user:{event.user}")
+    if event.source:
+        keys.append(f"source:{event.source}")
+    lineage = session_lineage((event.fields or {}).get("pid"))
+    if lineage:
+        keys.append(f"lineage:{lineage}")
+    return keys
 
-        elif "Failed" in message or "error" in message.lower():
-            # Failed attempt or error
-            user = ""
-            src = ""
-            if " for " in message:
-                user = message.split(" for ", 1)[-1].split(" ", 1)[0]
-            if " from " in message:
-                src = message.split(" from ", 1)[-1].split(" ", 1)[0]
-            elif " by " in message:
-                src = message.split(" by ", 1)[-1].split(" ", 1)[0]
-
-            summary = message[:50] + "..." if len(message) > 50 else message
-            title = f"SSH EVENT: {user or 'unknown'}"
-            body = f"from {src}: {summary}"
-            events.append(("alert", title, body))
-            state["seen_events"].append(event_id)
 
-    return events
+def get_correlation(state: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    state["correlation"]: {"buffers": {key: [[ts, seq, monitor, title], ...]},
+    "queue": [[ts, key], ...] in arrival order (for expiry), "fired": {"pattern|first seq": expiry}}.
+    """
+    return state.setdefault("correlation", {"buffers": {}, "queue": [], "fired": {}})
+
+
+def expire_correlation(correlation: Dict[str, Any], now: float, limit: int = CORRELATION_MAX_ENTRIES) -> None:
+    """Drop buffered events older than CORRELATION_WINDOW, and the oldest beyond `limit`."""
+    buffers, queue = correlation["buffers"], correlation["queue"]
+    cutoff = now - CORRELATION_WINDOW
+    expired = 0
+    while expired < len(queue) and (queue[expired][0] < cutoff or len(queue) - expired > limit):
+        ts, key = queue[expired]
+        buffer = buffers.get(key)
+        # The buffer may already have dropped it (per-key cap)
+        if buffer and buffer[0][0] <= ts:
+            buffer.pop(0)
+            if not buffer:
+                del buffers[key]
+        expired += 1
+    del queue[:expired]
+    for fired_key in [key for key, expiry in correlation["fired"].items() if expiry < now]:
+        del correlation["fired"][fired_key]
+
+
+def _match_incident_steps(buffer: List[List[Any]], pattern: Dict[str, Any], now: float) -> Optional[List[List[Any]]]:
+    """Members completing the pattern in order, ending with the newest event, or None."""
+    steps = pattern["steps"]
+    newest = buffer[-1]
+    if not _step_matches(steps[-1], newest[2], newest[3]):
+        return None
+    members: List[List[Any]] = []
+    cutoff = now - pattern["window"]
+    for entry in buffer[:-1]:
+        if len(members) == len(steps) - 1:
+            break
+        if entry[0] >= cutoff and _step_matches(steps[len(members)], entry[2], entry[3]):
+            members.append(entry)
+    if len(members) < len(steps) - 1:
+        return None
+    return members + [newest]
+
+
+def correlate_event(state: Dict[str, Any], event: Event) -> List[Event]:
+    """File an event (already in the history) under its keys; returns any incidents it completes."""
+    correlation = get_correlation(state)
+    patterns = get_incident_patterns()
+    candidates = patterns.by_monitor.get(event.monitor, ())
+    incidents = []
+    entry = [event.ts, event.seq, event.monitor, event.title]
+    for key in correlation_keys(event):
+        buffer = correlation["buffers"].setdefault(key, [])
+        buffer.append(entry)
+        if len(buffer) > CORRELATION_MAX_PER_KEY:
+            buffer.pop(0)
+        correlation["queue"].append([event.ts, key])
+        if len(correlation["queue"]) > CORRELATION_MAX_ENTRIES:
+            # Make room for a batch at a time rather than shifting the queue for every event
+            expire_correlation(correlation, event.ts, limit=CORRELATION_MAX_ENTRIES * 9 // 10)
+
+        kind, _, value = key.partition(":")
+        for pattern in candidates:
+            if kind not in pattern["by"]:
+                continue
+            members = _match_incident_steps(buffer, pattern, event.ts)
+            if not members:
+                continue
+            # One incident per pattern and starting event, however many keys led to it
+            fired_key = f"{pattern['id']}|{members[0][1]}"
+            if fired_key in correlation["fired"]:
+                continue
+            correlation["fired"][fired_key] = event.ts + pattern["window"]
+            incidents.append(Event(
+                "alert", f"INCIDENT: {pattern['title']}", " → ".join(member[3] for member in members), "incidents",
+                source=value if kind == "source" else None, user=value if kind == "user" else event.user,
+                fields={"pattern": pattern["id"], "key": key, "members": [member[1] for member in members]},
+            ))
+    return incidents
 
 
 # =============================================================================
-# Sudo Parser
+# Event Archive
 # =============================================================================
+#
+# Every event is also appended to a long-term archive, partitioned by day:
+#   archive/2024-05-01.jsonl      today's segment (plain JSON lines, appended to)
+#   archive/2024-04-30.jsonl.gz   sealed (gzipped) once the day is over
+#   archive/2024-04-30.idx.json   per-segment index: time range, counts per
+#                                 monitor, and a Bloom filter of source IPs
+# `query` uses the file names and indexes to open only the segments that can
+# contain matches, so searching a year of history stays fast.
 
-def parse_sudo_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Parse sudo events from unified log."""
-    if not MONITOR_SUDO:
-        return []
+ARCHIVE_DIR = STATE_DIR / "archive"
+ARCHIVE_BLOOM_BITS = 8192   # 1KB per segment; ~2% false positives at 1000 sources
 
-    events = []
 
-    # Query for sudo events
-    predicate = '(process == "sudo") AND (eventMessage CONTAINS "COMMAND")'
+def _bloom_positions(value: str) -> List[int]:
+    digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+    return [int.from_bytes(digest[i:i + 4], "big") % ARCHIVE_BLOOM_BITS for i in range(0, 16, 4)]
 
-    entries = get_log_entries(predicate)
 
-    # Exclusion patterns to prevent self-monitoring loops
-    exclude_patterns = ["/usr/sbin/lsof", "/usr/bin/log show", "security-growler"]
+def _load_segment_index(day: str) -> Dict[str, Any]:
+    try:
+        with open(ARCHIVE_DIR / f"{day}.idx.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    for entry in entries:
-        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
-        if event_id in state["seen_events"]:
-            continue
 
-        message = entry.get("eventMessage", "")
+def archive_events(events: List[Event]) -> None:
+    """Append events to their day's segment and update its index; seal finished days."""
+    import base64
 
-        # Skip self-monitoring commands
-        if any(pattern in message for pattern in exclude_patterns):
+    if not events:
+        return
+    ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+
+    by_day: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        record = event.to_record()
+        by_day.setdefault(record["date"][:10], []).append(record)
+
+    for day, day_events in by_day.items():
+        with open(ARCHIVE_DIR / f"{day}.jsonl", "a") as f:
+            for record in day_events:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+        index = _load_segment_index(day) or {"first": day_events[0]["date"], "last": "", "count": 0, "alerts": 0, "monitors": {}}
+        bloom = bytearray(base64.b64decode(index["sources"])) if "sources" in index else bytearray(ARCHIVE_BLOOM_BITS // 8)
+        for event in day_events:
+            index["first"] = min(index["first"], event["date"])
+            index["last"] = max(index["last"], event["date"])
+            index["count"] += 1
+            index["alerts"] += event["type"] == "alert"
+            index["monitors"][event["monitor"]] = index["monitors"].get(event["monitor"], 0) + 1
+            if event.get("source"):
+                for bit in _bloom_positions(event["source"]):
+                    bloom[bit // 8] |= 1 << (bit % 8)
+        index["sources"] = base64.b64encode(bytes(bloom)).decode()
+
+        tmp = ARCHIVE_DIR / f"{day}.idx.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, ARCHIVE_DIR / f"{day}.idx.json")
+
+    seal_archive_segments()
+
+
+def seal_archive_segments(today: Optional[str] = None) -> None:
+    """Gzip the plain segments of days that are over."""
+    import gzip
+    import shutil
+
+    today = today or datetime.now().strftime("%Y-%m-%d")
+    for path in ARCHIVE_DIR.glob("*.jsonl"):
+        if path.stem >= today:
+            continue
+        sealed = path.with_name(path.name + ".gz")
+        if sealed.exists():
+            # Late events for an already sealed day (e.g. after a clock change): add a gzip member
+            with open(path, "rb") as src, gzip.open(sealed, "ab", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            tmp = path.with_name(path.name + ".gz.tmp")
+            with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp, sealed)
+        path.unlink()
+
+
+def query_archive(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    monitors: Optional[List[str]] = None,
+    source: Optional[str] = None,
+    alerts_only: bool = False,
+):
+    """Yield archived events matching the filters, oldest first, reading only candidate segments."""
+    import base64
+    import gzip
+
+    if not ARCHIVE_DIR.exists():
+        return
+    since_iso = since.isoformat() if since else ""
+    until_iso = until.isoformat() if until else "9999"
+    source_bits = _bloom_positions(source) if source else []
+    # Segments are written with compact separators, so these match the raw lines
+    monitor_needles = [f'"monitor":{json.dumps(monitor)}' for monitor in monitors or []]
+
+    days = sorted({path.name[:10] for path in ARCHIVE_DIR.glob("????-??-??.jsonl*")})
+    for day in days:
+        # Prune on the file name first, then on the segment's index
+        if day < since_iso[:10] or day > until_iso[:10]:
             continue
+        index = _load_segment_index(day)
+        if index:
+            if index["last"] < since_iso or index["first"] > until_iso:
+                continue
+            if monitors and not any(index["monitors"].get(monitor) for monitor in monitors):
+                continue
+            if alerts_only and not index["alerts"]:
+                continue
+            if source_bits:
+                bloom = base64.b64decode(index["sources"])
+                if not all(bloom[bit // 8] & (1 << (bit % 8)) for bit in source_bits):
+                    continue
 
-        # Parse sudo log format:
-        # user : TTY=ttys001 ; PWD=/Users/user ; USER=root ; COMMAND=/usr/bin/whoami
-        try:
-            if " ; " in message:
-                parts = message.split(" ; ")
-                user_part = parts[0] if parts else ""
-                user = user_part.split(":")[-1].strip().split()[-1] if user_part else "unknown"
-
-                tty = ""
-                pwd = ""
-                command = ""
-
-                for part in parts:
-                    if "TTY=" in part:
-                        tty = part.split("TTY=", 1)[-1].strip()
-                    elif "PWD=" in part:
-                        pwd = part.split("PWD=", 1)[-1].strip()
-                    elif "COMMAND=" in part:
-                        command = part.split("COMMAND=", 1)[-1].strip()
-
-                if command:
-                    title = f"SUDO: {user}"
-                    # Truncate long commands
-                    cmd_display = command[:60] + "..." if len(command) > 60 else command
-                    body = f"{cmd_display}"
-                    events.append(("alert", title, body))
-                    state["seen_events"].append(event_id)
-        except (IndexError, ValueError):
+        for path in (ARCHIVE_DIR / f"{day}.jsonl.gz", ARCHIVE_DIR / f"{day}.jsonl"):
+            if not path.exists():
+                continue
+            with (gzip.open(path, "rt") if path.suffix == ".gz" else open(path, "r")) as f:
+                yield from _filter_segment(f, since_iso, until_iso, monitors, monitor_needles, source, alerts_only)
+
+
+def _filter_segment(f, since_iso, until_iso, monitors, monitor_needles, source, alerts_only):
+    """Stream the events in one open segment that pass query_archive's filters."""
+    for line in f:
+        # Cheap substring checks before paying for json.loads
+        if source and source not in line:
+            continue
+        if monitor_needles and not any(needle in line for needle in monitor_needles):
+            continue
+        event = json.loads(line)
+        if not since_iso <= event["date"] <= until_iso:
             continue
+        if monitors and event["monitor"] not in monitors:
+            continue
+        if alerts_only and event["type"] != "alert":
+            continue
+        if source and event.get("source") != source:
+            continue
+        yield event
 
-    return events
+
+def run_query(argv: List[str]) -> int:
+    """
+    Search the long-term event archive.
+
+    Usage:
+        security-growler.30s.py query --since 7d [--until 1d] [--type ssh,sudo] [--src 1.2.3.4] [--alerts] [--limit 100] [--json]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="security-growler query", description=run_query.__doc__.strip().splitlines()[0])
+    parser.add_argument("--since", default="1d", help="how far back to search, e.g. 12h, 7d, 52w (default: 1d)")
+    parser.add_argument("--until", help="ignore events newer than this long ago")
+    parser.add_argument("--type", help="comma-separated monitors, e.g. ssh,sudo,ports")
+    parser.add_argument("--src", help="only events from this source IP")
+    parser.add_argument("--alerts", action="store_true", help="only alerts")
+    parser.add_argument("--limit", type=int, default=0, help="show only the newest N matches")
+    parser.add_argument("--json", action="store_true", help="print events as JSON lines")
+    args = parser.parse_args(argv)
+
+    now = datetime.now()
+    matches = query_archive(
+        since=now - parse_duration(args.since),
+        until=now - parse_duration(args.until) if args.until else None,
+        monitors=[m.strip() for m in args.type.split(",") if m.strip()] if args.type else None,
+        source=args.src,
+        alerts_only=args.alerts,
+    )
+    if args.limit:
+        from collections import deque
+        matches = deque(matches, maxlen=args.limit)
+
+    for event in matches:
+        if args.json:
+            print(json.dumps(event))
+        else:
+            print(f"{event['date'][:19].replace('T', ' ')}  [{event['monitor']}] {event['title']}: {event['body']}")
+    return 0
 
 
 # =============================================================================
-# Port Scan Parser
+# System Probes
 # =============================================================================
+#
+# Every external command goes through run_probe(): commands are run directly
+# from argv lists (no /bin/sh, no grep/awk pipelines) and parsed in Python.
+# Results are memoized for the duration of a tick, so e.g. `ipconfig getifaddr
+# en0` and the lsof socket table are only fetched once even when several
+# monitors need them. The backend can be swapped to replay recorded fixtures.
 
-def get_recent_connections() -> List[Dict[str, str]]:
-    """Get recent network connections using lsof to identify port scan sources."""
-    cmd = "lsof -i -n -P 2>/dev/null | grep -v '^COMMAND' | grep -v 'LISTEN'"
+# Directory of recorded probe output to replay instead of running commands
+PROBE_FIXTURES = os.environ.get("PROBE_FIXTURES", "")
+# Directory to record real probe output into (for building fixtures)
+PROBE_RECORD = os.environ.get("PROBE_RECORD", "")
 
+# Arguments whose values change every run and are ignored when matching fixtures
+_VOLATILE_PROBE_ARGS = {"--start", "--end", "--since", "--after-cursor"}
+
+# Per-tick memo of probe results: (argv, text) -> output
+_probe_cache: Dict[Tuple[Tuple[str, ...], bool], Any] = {}
+
+# Per-tick memo of parsed probe results: (argv, parser name) -> parsed value
+_parsed_probe_cache: Dict[Tuple[Tuple[str, ...], str], Any] = {}
+
+# Per-command invocation counters: {"calls": asked for, "runs": actually executed, "bytes": output size}
+_probe_stats: Dict[str, Dict[str, int]] = {}
+
+
+def probe_key(argv: List[str]) -> str:
+    """Stable string key for a probe command, with volatile arguments masked."""
+    parts = []
+    mask_next = False
+    for arg in argv:
+        parts.append("*" if mask_next else arg)
+        mask_next = arg in _VOLATILE_PROBE_ARGS
+    return " ".join(parts)
+
+
+def _subprocess_probe_backend(argv: List[str], timeout: float, text: bool) -> Any:
+    """Run a probe command directly (no shell) and return its stdout."""
     try:
         result = subprocess.run(
-            cmd,
-            shell=True,
+            argv,
             capture_output=True,
-            text=True,
-            timeout=10
+            text=text,
+            errors="replace" if text else None,
+            timeout=timeout
         )
+        return result.stdout
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
+        return None
 
-        connections = []
-        seen_sources = set()
-
-        for line in result.stdout.strip().splitlines():
-            parts = line.split()
-            if len(parts) >= 9:
-                # Parse lsof output
-                # PROCESS PID USER FD TYPE DEVICE SIZE/OFF NODE NAME
-                name = parts[-1] if parts else ""
-
-                # Look for connections with remote addresses
-                if "->" in name:
-                    local, remote = name.split("->", 1)
-                    # Extract remote IP (before the port)
-                    if ":" in remote:
-                        remote_ip = remote.rsplit(":", 1)[0]
-                        # Avoid duplicates
-                        if remote_ip and remote_ip not in seen_sources:
-                            seen_sources.add(remote_ip)
-                            connections.append({
-                                "process": parts[0],
-                                "pid": parts[1],
-                                "user": parts[2],
-                                "remote_ip": remote_ip,
-                                "full_connection": name,
-                            })
-
-        return connections
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
+def _fixture_probe_backend(argv: List[str], timeout: float, text: bool) -> Any:
+    """Replay probe output recorded in PROBE_FIXTURES/probes.json."""
+    global _probe_fixtures
+    if _probe_fixtures is None:
+        try:
+            with open(Path(PROBE_FIXTURES) / "probes.json", "r") as f:
+                _probe_fixtures = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            _probe_fixtures = {}
 
+    output = _probe_fixtures.get(probe_key(argv))
+    if output is None and argv[:2] == ["/usr/bin/log", "show"]:
+        output = _replay_log_fixture(argv)
+    if output is None:
+        return None
+    return output if text else output.encode("utf-8")
 
-def parse_portscan_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Parse port scan detection events from unified log."""
-    if not MONITOR_PORTSCAN:
-        return []
 
-    events = []
+def _replay_log_fixture(argv: List[str]) -> Optional[str]:
+    """
+    Answer a `log show` query no recording matches exactly by filtering every
+    recorded `log show` output with its predicate and levels, so fixtures
+    recorded with broader predicates still replay after a predicate changes.
+    """
+    recorded = [output for key, output in _probe_fixtures.items() if key.startswith("/usr/bin/log show")]
+    if not recorded:
+        return None
 
-    # Query for kernel port scan detection messages
-    predicate = '(process == "kernel") AND (eventMessage CONTAINS "Limiting closed port RST")'
+    entries: Dict[str, Dict[str, Any]] = {}
+    for output in recorded:
+        for entry in parse_log_output(output):
+            entries.setdefault(str(entry.get("eventID", repr(entry))), entry)
 
-    entries = get_log_entries(predicate)
+    predicate = argv[argv.index("--predicate") + 1] if "--predicate" in argv else "TRUEPREDICATE"
+    levels = [arg[2:] for arg in argv if arg in ("--info", "--debug")]
+    return json_dumps(filter_log_entries(list(entries.values()), predicate, levels), indent=True).decode()
 
-    for entry in entries:
-        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
-        if event_id in state["seen_events"]:
-            continue
 
-        message = entry.get("eventMessage", "")
+_probe_fixtures: Optional[Dict[str, str]] = None
+_probe_backend = _fixture_probe_backend if PROBE_FIXTURES else _subprocess_probe_backend
 
-        if "Limiting closed port RST response" in message:
-            # Extract rate limit info
-            rate_info = message.split("response ", 1)[-1] if "response " in message else message
 
-            # Try to identify the source of the port scan
-            recent_connections = get_recent_connections()
+def set_probe_backend(backend) -> None:
+    """Swap the probe backend: a callable (argv, timeout, text) -> stdout or None."""
+    global _probe_backend
+    _probe_backend = backend
+    reset_probes()
 
-            title = "PORT SCAN DETECTED"
-            if recent_connections:
-                # Get unique source IPs
-                source_ips = list(set(conn["remote_ip"] for conn in recent_connections[:5]))
-                if len(source_ips) == 1:
-                    body = f"from {source_ips[0]} - Limiting {rate_info}"
-                elif len(source_ips) <= 3:
-                    body = f"from {', '.join(source_ips)} - Limiting {rate_info}"
-                else:
-                    body = f"from {source_ips[0]} (+{len(source_ips)-1} more) - Limiting {rate_info}"
-            else:
-                body = f"Limiting {rate_info} (source unknown)"
 
-            events.append(("alert", title, body))
-            state["seen_events"].append(event_id)
+def reset_probes() -> None:
+    """Forget memoized probe results; called at the start of every tick."""
+    _probe_cache.clear()
+    _parsed_probe_cache.clear()
+    _probe_stats.clear()
 
-    return events
 
+def _record_probe(argv: List[str], output: Any) -> None:
+    """Save probe output into PROBE_RECORD/probes.json for later replay."""
+    record_file = Path(PROBE_RECORD) / "probes.json"
+    try:
+        record_file.parent.mkdir(parents=True, exist_ok=True)
+        recorded = json.loads(record_file.read_text()) if record_file.exists() else {}
+        if isinstance(output, bytes):
+            output = output.decode("utf-8", errors="replace")
+        recorded[probe_key(argv)] = output
+        record_file.write_text(json.dumps(recorded, indent=2))
+    except (json.JSONDecodeError, IOError):
+        pass
 
-# =============================================================================
-# FTP Parser
-# =============================================================================
 
-def parse_ftp_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Parse FTP events from unified log."""
-    events = []
+# Deadline (time.monotonic()) of the collection pass running on this thread, if any
+_tick_budget = threading.local()
 
-    # Query for ftpd events
-    predicate = '(process == "ftpd")'
 
-    entries = get_log_entries(predicate)
+def tick_time_left() -> Optional[float]:
+    """Seconds left in the current tick's budget (None outside a tick)."""
+    deadline = getattr(_tick_budget, "deadline", None)
+    return None if deadline is None else deadline - time.monotonic()
 
-    for entry in entries:
-        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
-        if event_id in state["seen_events"]:
-            continue
 
-        message = entry.get("eventMessage", "")
+def run_probe(argv: List[str], timeout: float = 10, text: bool = True) -> Any:
+    """
+    Run a system probe command, memoized for the rest of the tick.
 
-        if message:
-            title = "FTP Access"
-            body = message[:80] + "..." if len(message) > 80 else message
-            events.append(("notify", title, body))
-            state["seen_events"].append(event_id)
+    During a tick the timeout is capped by the time left in the tick budget,
+    and once the budget is spent probes are skipped (returning None).
 
-    return events
+    Args:
+        argv: Command and arguments (executed directly, never via a shell)
+        timeout: Seconds to wait before giving up
+        text: Return decoded str output (True) or raw bytes (False)
 
+    Returns:
+        The command's stdout, or None if it could not be run or timed out
+    """
+    key = (tuple(argv), text)
+    stats = _probe_stats.setdefault(argv[0].rsplit("/", 1)[-1], {"calls": 0, "runs": 0, "bytes": 0})
+    stats["calls"] += 1
+
+    if key in _probe_cache:
+        return _probe_cache[key]
+
+    # Never let a probe run past the tick's deadline
+    time_left = tick_time_left()
+    if time_left is not None:
+        if time_left <= 0:
+            stats["skipped"] = stats.get("skipped", 0) + 1
+            return None
+        timeout = min(timeout, time_left)
 
-# =============================================================================
-# Network Connection Monitor
-# =============================================================================
+    stats["runs"] += 1
+    output = _probe_backend(argv, timeout, text)
+    _probe_cache[key] = output
+    if output is not None:
+        stats["bytes"] = stats.get("bytes", 0) + len(output)
 
-def get_port_connections(port: int) -> List[Dict[str, str]]:
-    """Get current connections on a specific port using lsof."""
-    cmd = f"lsof +c 0 -i:{port} 2>/dev/null | grep -v '^COMMAND' | grep -v '^launchd '"
+    if PROBE_RECORD and output is not None:
+        _record_probe(argv, output)
 
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+    return output
 
-        connections = []
-        for line in result.stdout.strip().splitlines():
-            parts = line.split()
-            if len(parts) >= 9:
-                # Parse lsof output
-                # PROCESS PID USER FD TYPE DEVICE SIZE/OFF NODE NAME
-                conn = {
-                    "process": parts[0],
-                    "pid": parts[1],
-                    "user": parts[2],
-                    "name": parts[-1] if len(parts) > 8 else "",
-                    "port": port,
-                }
 
-                # Parse connection details from NAME field
-                name = parts[-1] if parts else ""
-                if "->" in name:
-                    local, remote = name.split("->", 1)
-                    conn["local"] = local
-                    conn["remote"] = remote
-                else:
-                    conn["local"] = name
-                    conn["remote"] = ""
+def run_parsed_probe(argv: List[str], parser, timeout: float = 10) -> Any:
+    """Run a probe and parse its output (None if it failed), memoized for the tick."""
+    key = (tuple(argv), parser.__name__)
+    if key not in _parsed_probe_cache:
+        output = run_probe(argv, timeout=timeout)
+        # A failed probe stays None so callers can tell "nothing" from "unknown"
+        _parsed_probe_cache[key] = None if output is None else parser(output)
+    else:
+        _probe_stats[argv[0].rsplit("/", 1)[-1]]["calls"] += 1
+    return _parsed_probe_cache[key]
 
-                connections.append(conn)
 
-        return connections
+def tick_memo(name: str, compute) -> Any:
+    """Memoize a non-command probe (e.g. reading /proc) for the rest of the tick."""
+    key = ((name,), "tick_memo")
+    stats = _probe_stats.setdefault(name, {"calls": 0, "runs": 0})
+    stats["calls"] += 1
+    if key not in _parsed_probe_cache:
+        stats["runs"] += 1
+        _parsed_probe_cache[key] = compute()
+    return _parsed_probe_cache[key]
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
 
+def probe_lines(argv: List[str], timeout: float = 10) -> List[str]:
+    """Run a probe and return its non-empty, stripped output lines."""
+    output = run_probe(argv, timeout=timeout) or ""
+    return [line.strip() for line in output.splitlines() if line.strip()]
 
-def parse_port_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor network connections on configured ports."""
-    if not MONITOR_PORTS:
-        return []
 
-    events = []
-    known = state.get("known_connections", {})
+# =============================================================================
+# Process Snapshot
+# =============================================================================
+#
+# One `ps` per tick gives every process with its parent PID and start time.
+# Processes are identified by "pid:start" so a reused PID is never mistaken
+# for the process that used to own it, and parent chains are cached so events
+# can say what spawned a process without any extra `ps` calls.
 
-    for port in PORTS_TO_MONITOR:
-        port_key = str(port)
-        connections = get_port_connections(port)
-
-        # Create connection identifiers
-        current_conns = set()
-        for conn in connections:
-            conn_id = f"{conn['process']}:{conn['pid']}:{conn.get('remote', '')}"
-            current_conns.add(conn_id)
-
-            # Check if this is a new connection
-            if port_key not in known:
-                known[port_key] = []
-
-            if conn_id not in known[port_key]:
-                known[port_key].append(conn_id)
-
-                port_name = PORT_NAMES.get(port, str(port))
-                title = f"PORT {port} ({port_name})"
-
-                # Determine connection direction
-                # If we have local->remote in lsof output, it's an outgoing connection
-                # If we just have a remote without ->, it means remote connected to us (incoming)
-                if conn.get("remote"):
-                    if conn.get("local") and "->" in conn.get("name", ""):
-                        # Outgoing: we initiated the connection
-                        body = f"{conn['process']}@localhost -> {conn['remote']}"
-                    else:
-                        # Incoming: remote connected to us
-                        body = f"{conn['remote']} -> {conn['process']}@localhost:{port}"
-                else:
-                    # No remote info, just show the process
-                    body = f"{conn['user']} {conn['process']} (PID {conn['pid']})"
+# Parents not worth showing in a "spawned by" chain
+LINEAGE_STOP_PIDS = {"0", "1"}
 
-                events.append(("notify", title, body))
 
-        # Clean up old connections
-        if port_key in known:
-            known[port_key] = [c for c in known[port_key] if c in current_conns]
+class ProcessSnapshot:
+    """
+    All running processes at one point in time, indexed by PID and identity.
+    ok is False when `ps` failed or was skipped, so the snapshot is empty
+    rather than a sign that every process exited.
+    """
 
-    state["known_connections"] = known
-    return events
+    def __init__(self, processes: List[Dict[str, str]], ok: bool = True):
+        self.ok = ok
+        self.by_pid = {proc["pid"]: proc for proc in processes}
+        self.by_identity = {proc["identity"]: proc for proc in processes}
+        self._chains: Dict[str, List[Dict[str, str]]] = {}
+
+    def __iter__(self):
+        return iter(self.by_pid.values())
+
+    def get(self, pid: str) -> Optional[Dict[str, str]]:
+        return self.by_pid.get(str(pid))
+
+    def identity(self, pid: str) -> Optional[str]:
+        """PID-reuse-safe identity ("pid:start") of a running process."""
+        proc = self.get(pid)
+        return proc["identity"] if proc else None
+
+    def parent_chain(self, pid: str, max_depth: int = 8) -> List[Dict[str, str]]:
+        """Ancestors of a process, nearest first (cached per snapshot)."""
+        pid = str(pid)
+        if pid in self._chains:
+            return self._chains[pid]
+
+        chain = []
+        proc = self.get(pid)
+        while proc and len(chain) < max_depth:
+            parent = self.get(proc["ppid"])
+            if not parent or parent["pid"] in LINEAGE_STOP_PIDS or parent["pid"] == proc["pid"]:
+                break
+            # Reuse the parent's cached chain if we already walked it
+            if parent["pid"] in self._chains:
+                chain.append(parent)
+                chain.extend(self._chains[parent["pid"]][:max_depth - len(chain)])
+                break
+            chain.append(parent)
+            proc = parent
+
+        self._chains[pid] = chain
+        return chain
+
+    def lineage(self, pid: str, depth: int = 3) -> str:
+        """Human-readable "spawned by" chain, e.g. "zsh ← Terminal"."""
+        return " ← ".join(proc["name"] for proc in self.parent_chain(pid)[:depth])
+
+
+def parse_ps_snapshot(output: str) -> ProcessSnapshot:
+    """
+    Parse `ps -Ao pid=,ppid=,user=,lstart=,args=` output.
 
+    Each line looks like:
+    812     1 me       Mon Jan 15 10:23:45 2024 /usr/local/bin/postgres -D /usr/local/var/postgres
+    """
+    processes = []
+    for line in output.splitlines():
+        parts = line.split(None, 8)
+        if len(parts) < 8:
+            continue
 
-def parse_vnc_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor VNC connections specifically (elevated to alert level)."""
-    if not MONITOR_VNC:
-        return []
+        pid, ppid, user = parts[0], parts[1], parts[2]
+        lstart = " ".join(parts[3:8])
+        try:
+            started = str(int(datetime.strptime(lstart, "%a %b %d %H:%M:%S %Y").timestamp()))
+        except ValueError:
+            started = lstart
+        args = parts[8] if len(parts) > 8 else ""
+        command = args.split(None, 1)[0] if args else ""
+
+        processes.append({
+            "pid": pid,
+            "ppid": ppid,
+            "user": user,
+            "start": started,
+            "identity": f"{pid}:{started}",
+            "comm": command,
+            "name": command.rsplit("/", 1)[-1],
+            "args": args,
+        })
+    return ProcessSnapshot(processes)
 
-    events = []
-    known = state.get("known_connections", {})
-    port = 5900
-    port_key = "vnc_5900"
 
-    connections = get_port_connections(port)
+def get_process_snapshot() -> ProcessSnapshot:
+    """Get the process snapshot for this tick (one `ps` run shared by all monitors)."""
+    snapshot = run_parsed_probe(["ps", "-Ao", "pid=,ppid=,user=,lstart=,args="], parse_ps_snapshot, timeout=5)
+    return snapshot if snapshot is not None else ProcessSnapshot([], ok=False)
 
-    current_conns = set()
-    for conn in connections:
-        conn_id = f"{conn['process']}:{conn['pid']}:{conn.get('remote', '')}"
-        current_conns.add(conn_id)
 
-        if port_key not in known:
-            known[port_key] = []
+def describe_spawned_by(pid: str) -> str:
+    """" (spawned by a ← b)" suffix for event bodies, or "" if unknown."""
+    lineage = get_process_snapshot().lineage(pid)
+    return f" (spawned by {lineage})" if lineage else ""
 
-        if conn_id not in known[port_key]:
-            known[port_key].append(conn_id)
 
-            title = "VNC CONNECTION"
+# =============================================================================
+# Auto-Update Checking
+# =============================================================================
 
-            # Determine connection direction
-            # If we have local->remote in lsof output, it's an outgoing connection
-            # If we just have a remote without ->, it means remote connected to us (incoming)
-            if conn.get("remote"):
-                if conn.get("local") and "->" in conn.get("name", ""):
-                    # Outgoing: we initiated the VNC connection
-                    body = f"{conn['process']}@localhost -> {conn['remote']}"
-                else:
-                    # Incoming: remote connected to our VNC server
-                    body = f"{conn['remote']} -> {conn['process']}@localhost:{port}"
-            else:
-                # No remote info, just show the process
-                body = f"{conn['user']} {conn['process']} (PID {conn['pid']})"
+def compute_file_sha256(filepath: str) -> Optional[str]:
+    """Compute SHA256 hash of a file."""
+    try:
+        sha256_hash = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            # Read in chunks to handle large files
+            for byte_block in iter(lambda: f.read(4096), b""):
+                sha256_hash.update(byte_block)
+        return sha256_hash.hexdigest()
+    except (IOError, OSError):
+        return None
 
-            # VNC connections are alerts, not just notifications
-            events.append(("alert", title, body))
 
-    # Clean up old connections
-    if port_key in known:
-        known[port_key] = [c for c in known[port_key] if c in current_conns]
+UPDATE_URL = "https://raw.githubusercontent.com/pirate/security-growler/master/security-growler.30s.py"
+UPDATE_CHECK_SECONDS = 24 * 3600
+UPDATE_RETRY_SECONDS = 3600
 
-    state["known_connections"] = known
-    return events
 
+def fetch_remote_script_hash(previous: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Conditionally fetch the latest script from GitHub (runs in the network worker).
 
-# =============================================================================
-# New Listening Ports Monitor
-# =============================================================================
+    Sends the ETag from the previous check as If-None-Match, so an unchanged
+    script costs a 304 instead of a full download. Returns the new
+    {"etag", "sha256", "checked"} record.
+    """
+    import urllib.error
+    import urllib.request
 
-def get_listening_ports() -> Dict[int, Dict[str, str]]:
-    """Get all listening ports and their processes using lsof."""
-    cmd = "lsof -i -P -n 2>/dev/null | grep LISTEN"
+    request = urllib.request.Request(UPDATE_URL)
+    if previous.get("etag") and previous.get("sha256"):
+        request.add_header("If-None-Match", previous["etag"])
 
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
-
-        listening = {}
-        for line in result.stdout.strip().splitlines():
-            parts = line.split()
-            if len(parts) >= 9:
-                process = parts[0]
-                pid = parts[1]
-                user = parts[2]
-                name = parts[-2] if parts[-1] == "(LISTEN)" else parts[-1]
-
-                # Extract port from name (e.g., "*:8080" or "127.0.0.1:3000")
-                if ":" in name:
-                    port_str = name.rsplit(":", 1)[-1]
-                    try:
-                        port = int(port_str)
-                        if LISTENING_PORT_MIN < port < LISTENING_PORT_MAX:
-                            listening[port] = {
-                                "process": process,
-                                "pid": pid,
-                                "user": user,
-                                "address": name,
-                            }
-                    except ValueError:
-                        continue
-
-        return listening
+        with urllib.request.urlopen(request, timeout=15) as response:
+            content = response.read()
+            return {"etag": response.headers.get("ETag"), "sha256": hashlib.sha256(content).hexdigest(), "checked": time.time()}
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return dict(previous, checked=time.time(), error=None)
+        error = f"HTTP {e.code}"
+    except (OSError, ValueError) as e:
+        error = str(e)
+
+    # Failed: keep the last good answer and try again in an hour
+    return dict(previous, checked=time.time() - UPDATE_CHECK_SECONDS + UPDATE_RETRY_SECONDS, error=error)
+
+
+def get_local_script_hash(state: Dict[str, Any]) -> Optional[str]:
+    """SHA256 of this script, re-hashed only when its mtime or size changes."""
+    script_path = os.path.abspath(__file__)
+    try:
+        stat = os.stat(script_path)
+    except OSError:
+        return None
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return {}
+    cached = state.get("script_hash", {})
+    if cached.get("mtime") == stat.st_mtime_ns and cached.get("size") == stat.st_size:
+        return cached.get("sha256")
 
+    local_hash = compute_file_sha256(script_path)
+    state["script_hash"] = {"mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": local_hash}
+    return local_hash
 
-def parse_listening_port_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor for new listening ports."""
-    if not MONITOR_LISTENING:
-        return []
 
+def check_for_updates(state: Dict[str, Any]) -> List[Event]:
+    """Check if a new version is available on GitHub (using the network worker's latest result)."""
     events = []
-    known_listening = set(state.get("known_listening_ports", []))
-    current_listening = get_listening_ports()
 
-    for port, info in current_listening.items():
-        if port not in known_listening:
-            title = f"NEW LISTENING PORT: {port}"
-            body = f"{info['user']} {info['process']} (PID {info['pid']}) on {info['address']}"
-            events.append(("alert", title, body))
+    # The worker checks once a day; only look at each of its results once
+    result = get_network_results().get("update", {})
+    state.pop("last_update_check", None)
+    if not result.get("sha256") or result.get("checked") == state.get("update_checked"):
+        return events
+    state["update_checked"] = result.get("checked")
+
+    local_hash = get_local_script_hash(state)
+    if not local_hash:
+        return events
+
+    # Compare hashes
+    if local_hash != result["sha256"]:
+        title = "UPDATE AVAILABLE"
+        body = "New version of Security Growler detected"
+        download_url = "https://github.com/pirate/security-growler/releases"
+        events.append(Event("alert", title, f"{body} - {download_url}", fields={"sha256": result["sha256"]}))
 
-    # Update known listening ports
-    state["known_listening_ports"] = list(current_listening.keys())
     return events
 
 
 # =============================================================================
-# .env File Monitor (using find)
+# Notifications
 # =============================================================================
 
-def find_recent_dotenv_files() -> List[str]:
-    """Find .env files modified in the last 2 minutes using find, excluding ~/Library."""
-    home = str(Path.home())
+# Global notifier instance (initialized lazily)
+_notifier: Optional["DesktopNotifier"] = None
 
-    # Use find to locate .env files modified in last 2 minutes
-    # -mmin -2 means modified within last 2 minutes
-    # -name matches both .env and *.env files
-    # -not -path excludes ~/Library
-    # -type f ensures we only get files
-    cmd = f'''find "{home}" -maxdepth 6 -type f \\( -name ".env" -o -name "*.env" \\) -mmin -2 -not -path "*/Library/*" -not -path "*/.git/*" -not -path "*/node_modules/*" 2>/dev/null'''
 
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=15
+def _get_notifier() -> Optional["DesktopNotifier"]:
+    """Get or create the desktop notifier instance."""
+    global _notifier
+    if DESKTOP_NOTIFIER_AVAILABLE and _notifier is None:
+        _notifier = DesktopNotifier(
+            app_name=APP_NAME,
+            notification_limit=10,
         )
+    return _notifier
 
-        files = []
-        for line in result.stdout.strip().splitlines():
-            path = line.strip()
-            if path:
-                files.append(path)
 
-        return files
+async def _send_notification_async(title: str, message: str, is_alert: bool = False) -> None:
+    """Send notification using desktop-notifier (async)."""
+    notifier = _get_notifier()
+    if notifier is None:
+        return
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
+    try:
+        await notifier.send(
+            title=title,
+            message=message,
+            urgency=Urgency.Critical if is_alert else Urgency.Normal,
+            sound=DEFAULT_SOUND if is_alert else None,
+        )
+    except Exception:
+        pass
 
 
-def parse_dotenv_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor for new .env files in home directory."""
-    if not MONITOR_DOTENV:
-        return []
+def _send_notification_osascript(title: str, message: str, is_alert: bool = False) -> None:
+    """Fallback: Send a macOS notification using osascript."""
+    # Escape quotes for AppleScript
+    title_escaped = title.replace('"', '\\"').replace("'", "\\'")
+    message_escaped = message.replace('"', '\\"').replace("'", "\\'")
 
-    events = []
-    known_dotenv = set(state.get("known_dotenv_files", []))
-    current_dotenv = find_recent_dotenv_files()
+    sound = 'sound name "Sosumi"' if is_alert else ""
+    script = f'''
+    display notification "{message_escaped}" with title "{APP_NAME}" subtitle "{title_escaped}" {sound}
+    '''
 
-    for filepath in current_dotenv:
-        if filepath not in known_dotenv:
-            # Get relative path from home
-            try:
-                rel_path = str(Path(filepath).relative_to(Path.home()))
-            except ValueError:
-                rel_path = filepath
+    try:
+        subprocess.run(
+            ["osascript", "-e", script],
+            capture_output=True,
+            timeout=5
+        )
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
+        pass
 
-            title = "NEW .ENV FILE"
-            body = f"~/{rel_path}"
-            events.append(("alert", title, body))
-            known_dotenv.add(filepath)
 
-    state["known_dotenv_files"] = list(known_dotenv)
-    return events
+def send_notification(title: str, message: str, is_alert: bool = False) -> None:
+    """Send a macOS notification using desktop-notifier or fallback to osascript."""
+    if not SHOW_NOTIFICATIONS:
+        return
+
+    if DESKTOP_NOTIFIER_AVAILABLE:
+        try:
+            asyncio.run(_send_notification_async(title, message, is_alert))
+        except Exception:
+            # Fallback to osascript if async fails
+            if not IS_LINUX:
+                _send_notification_osascript(title, message, is_alert)
+    elif not IS_LINUX:
+        _send_notification_osascript(title, message, is_alert)
 
 
 # =============================================================================
-# Dangerous Commands Monitor (npx, uvx, op) - uses shell history + ps polling
+# Unified Log Reader
 # =============================================================================
 
-def get_shell_history_commands() -> List[Dict[str, str]]:
-    """
-    Read recent commands from shell history files.
-    Works with zsh, bash, and fish shells.
+def parse_log_output(output: str) -> List[Dict[str, Any]]:
     """
-    home = Path.home()
-    commands = []
-
-    # Shell history file locations and their formats
-    history_files = [
-        (home / ".zsh_history", "zsh"),
-        (home / ".bash_history", "bash"),
-        (home / ".local/share/fish/fish_history", "fish"),
-    ]
+    Parse `log show --style json` output (a JSON array or line-delimited JSON).
 
-    for hist_file, shell_type in history_files:
-        if not hist_file.exists():
-            continue
+    When msgspec is used the entries are LogEntry structs rather than dicts;
+    both support the entry.get() access the parsers use.
+    """
+    output = output.strip()
+    if not output:
+        return []
 
+    errors = json_decode_error()
+    if msgspec is not None and JSON_CODEC in ("auto", "msgspec"):
         try:
-            # Read last 50 lines of history (recent commands)
-            with open(hist_file, "rb") as f:
-                # Seek to end and read backwards to get recent lines
+            return _msgspec_log_decoder.decode(output)
+        except (msgspec.DecodeError, msgspec.ValidationError):
+            pass  # not a plain array of entries; decode generically below
+
+    # The log command outputs JSON array
+    try:
+        entries = json_loads(output)
+        return entries if isinstance(entries, list) else []
+    except errors:
+        # Sometimes output is line-delimited JSON
+        entries = []
+        for line in output.splitlines():
+            line = line.strip().rstrip(",")
+            if line.startswith("{"):
                 try:
-                    f.seek(0, 2)  # End of file
-                    size = f.tell()
-                    # Read last 8KB or whole file if smaller
-                    read_size = min(8192, size)
-                    f.seek(max(0, size - read_size))
-                    content = f.read().decode("utf-8", errors="ignore")
-                except Exception:
+                    entries.append(json_loads(line))
+                except errors:
                     continue
+        return entries
+
+
+def get_log_entries(
+    predicate: str,
+    since_minutes: int = 1,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    archive: Optional[str] = None,
+    timeout: int = 30,
+    levels: Tuple[str, ...] = (),
+) -> List[Dict[str, str]]:
+    """
+    Query the macOS unified logging system using /usr/bin/log.
 
-            lines = content.splitlines()[-50:]  # Last 50 commands
+    Args:
+        predicate: Log predicate filter string
+        since_minutes: How many minutes back to query (ignored if start is given)
+        start: Explicit start of the time range to query
+        end: Explicit end of the time range to query
+        archive: Path to a .logarchive to read instead of the live system log
+        timeout: Seconds to wait for /usr/bin/log before giving up
+        levels: Extra levels to include ("info", "debug"); default-level and
+            above are always included
 
-            for line in lines:
+    Returns:
+        List of log entries as dictionaries
+    """
+    # Calculate start time
+    if start is None:
+        start = datetime.now() - timedelta(minutes=since_minutes)
+
+    # Parse JSON output
+    cmd = log_show_command(predicate, start, end=end, archive=archive, levels=levels)
+    return parse_log_output(run_probe(cmd, timeout=timeout) or "")
+
+
+def log_show_command(
+    predicate: str,
+    start: datetime,
+    end: Optional[datetime] = None,
+    archive: Optional[str] = None,
+    levels: Tuple[str, ...] = (),
+) -> List[str]:
+    """The `log show` argv for a query (see get_log_entries)."""
+    cmd = ["/usr/bin/log", "show"]
+    if archive:
+        cmd += ["--archive", archive]
+    cmd += [
+        "--predicate", predicate,
+        "--start", start.strftime("%Y-%m-%d %H:%M:%S"),
+    ]
+    if end is not None:
+        cmd += ["--end", end.strftime("%Y-%m-%d %H:%M:%S")]
+    cmd += ["--style", "json"]
+    # Info/debug messages multiply the output, so only ask for them where needed
+    cmd += [f"--{level}" for level in LOG_LEVELS_ORDER if level in levels]
+    return cmd
+
+
+LOG_LEVELS_ORDER = ("info", "debug")
+
+# Levels each monitor needs beyond default. sshd and ftpd log logins and
+# failures through syslog at LOG_INFO, which the unified log stores as Info
+# messages that `log show` hides without --info; sudo and the kernel are kept
+# at info too until a recorded capture shows they don't need it. Only debug is
+# dropped for them. MDM clients log profile and policy activity at info and
+# debug.
+LOG_LEVELS = {
+    "ssh": ("info",),
+    "sudo": ("info",),
+    "portscan": ("info",),
+    "ftp": ("info",),
+    "mdm": ("info", "debug"),
+}
+
+# Message types hidden unless the matching level was requested
+_LOG_LEVEL_TYPES = {"Info": "info", "Debug": "debug"}
+
+_PREDICATE_TOKEN = re.compile(r'''\s*(?:(?P<string>"(?:[^"\\]|\\.)*")|(?P<op>==|!=|[(){},])|(?P<word>[A-Za-z_][A-Za-z0-9_.]*(?:\[[cd]+\])?))''')
+
+
+def compile_log_predicate(predicate: str) -> Callable[[Dict[str, Any]], bool]:
+    """
+    Compile the subset of the `log` predicate language Security Growler uses
+    (==, !=, CONTAINS/BEGINSWITH/ENDSWITH with optional [c], IN {...}, AND, OR,
+    NOT, parentheses) into a Python test over a log entry. Used to replay
+    recorded fixtures under a different predicate.
+    """
+    tokens = []
+    position = 0
+    while position < len(predicate.rstrip()):
+        match = _PREDICATE_TOKEN.match(predicate, position)
+        if not match:
+            raise ValueError(f"bad predicate near: {predicate[position:position + 20]!r}")
+        tokens.append(match.group("string") or match.group("op") or match.group("word"))
+        position = match.end()
+    tokens.append("")
+
+    def peek() -> str:
+        return tokens[0]
+
+    def take(expected: Optional[str] = None) -> str:
+        token = tokens.pop(0)
+        if expected is not None and token.upper() != expected:
+            raise ValueError(f"expected {expected}, got {token!r}")
+        return token
+
+    def string() -> str:
+        token = take()
+        if not token.startswith('"'):
+            raise ValueError(f"expected a string, got {token!r}")
+        return json.loads(token)
+
+    def parse_or():
+        tests = [parse_and()]
+        while peek().upper() == "OR":
+            take()
+            tests.append(parse_and())
+        return tests[0] if len(tests) == 1 else (lambda entry: any(test(entry) for test in tests))
+
+    def parse_and():
+        tests = [parse_not()]
+        while peek().upper() == "AND":
+            take()
+            tests.append(parse_not())
+        return tests[0] if len(tests) == 1 else (lambda entry: all(test(entry) for test in tests))
+
+    def parse_not():
+        if peek().upper() == "NOT":
+            take()
+            test = parse_not()
+            return lambda entry: not test(entry)
+        if peek() == "(":
+            take()
+            test = parse_or()
+            take(")")
+            return test
+        return parse_comparison()
+
+    def parse_comparison():
+        field = take()
+        if field.upper() in ("TRUEPREDICATE", "FALSEPREDICATE"):
+            result = field.upper() == "TRUEPREDICATE"
+            return lambda entry: result
+        operator, _, options = take().upper().partition("[")
+        fold = "C" in options
+
+        def value_of(entry: Dict[str, Any]) -> str:
+            value = str(entry.get(field) or "")
+            return value.lower() if fold else value
+
+        if operator == "IN":
+            take("{")
+            values = {string()}
+            while peek() == ",":
+                take()
+                values.add(string())
+            take("}")
+            return lambda entry: value_of(entry) in values
+
+        value = string()
+        value = value.lower() if fold else value
+        tests = {
+            "==": lambda entry: value_of(entry) == value,
+            "!=": lambda entry: value_of(entry) != value,
+            "CONTAINS": lambda entry: value in value_of(entry),
+            "BEGINSWITH": lambda entry: value_of(entry).startswith(value),
+            "ENDSWITH": lambda entry: value_of(entry).endswith(value),
+        }
+        if operator not in tests:
+            raise ValueError(f"unsupported operator {operator}")
+        return tests[operator]
+
+    test = parse_or()
+    if peek():
+        raise ValueError(f"unexpected {peek()!r}")
+    return test
+
+
+def filter_log_entries(entries: List[Dict[str, Any]], predicate: str, levels: List[str]) -> List[Dict[str, Any]]:
+    """What `log show --predicate ... [--info] [--debug]` would return from these entries."""
+    test = compile_log_predicate(predicate)
+    return [
+        entry for entry in entries
+        if _LOG_LEVEL_TYPES.get(entry.get("messageType", ""), "") in ("", *levels) and test(entry)
+    ]
+
+
+# =============================================================================
+# Journald Reader (Linux)
+# =============================================================================
+
+# journalctl matches for each log monitor (same-field matches are ORed).
+# Monitors without an entry (port scans, MDM) have no Linux log source.
+JOURNAL_MATCHES = {
+    "ssh": ["SYSLOG_IDENTIFIER=sshd", "SYSLOG_IDENTIFIER=sshd-session"],
+    "sudo": ["SYSLOG_IDENTIFIER=sudo"],
+    "ftp": ["SYSLOG_IDENTIFIER=vsftpd", "SYSLOG_IDENTIFIER=proftpd", "SYSLOG_IDENTIFIER=pure-ftpd"],
+}
+
+# journald identifiers mapped onto the process names the parsers expect
+JOURNAL_PROCESS_NAMES = {"sshd-session": "sshd", "vsftpd": "ftpd", "proftpd": "ftpd", "pure-ftpd": "ftpd"}
+
+
+def journal_entry_to_log_entry(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a `journalctl -o json` record onto the unified-log entry shape the parsers use."""
+    message = record.get("MESSAGE", "")
+    if isinstance(message, list):
+        # Non-UTF-8 messages are exported as byte arrays
+        message = bytes(message).decode("utf-8", errors="replace")
+
+    identifier = record.get("SYSLOG_IDENTIFIER") or record.get("_COMM", "")
+    try:
+        timestamp = datetime.fromtimestamp(int(record["__REALTIME_TIMESTAMP"]) / 1e6).astimezone()
+        timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+    except (KeyError, ValueError):
+        timestamp = ""
+
+    return {
+        "eventID": record.get("__CURSOR", ""),
+        "eventMessage": message,
+        "process": JOURNAL_PROCESS_NAMES.get(identifier, identifier),
+        "subsystem": identifier,
+        "timestamp": timestamp,
+        "processID": int(record["_PID"]) if str(record.get("_PID", "")).isdigit() else None,
+    }
+
+
+def get_journal_entries(state: Dict[str, Any], monitor: str, since_minutes: int = 1) -> List[Dict[str, Any]]:
+    """
+    Read new journald entries for a monitor, resuming from its saved cursor.
+
+    The cursor in state["journal_cursors"] makes each read incremental: only
+    entries written since the last tick are returned and parsed.
+    """
+    matches = JOURNAL_MATCHES.get(monitor)
+    if not matches:
+        return []
+
+    cursors = state.setdefault("journal_cursors", {})
+    cmd = ["journalctl", "-o", "json", "--no-pager", "--output-fields=MESSAGE,SYSLOG_IDENTIFIER,_COMM,_PID"]
+    if cursors.get(monitor):
+        cmd += ["--after-cursor", cursors[monitor]]
+    else:
+        cmd += ["--since", f"{since_minutes} min ago"]
+    cmd += matches
+
+    entries = []
+    for line in (run_probe(cmd, timeout=30) or "").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        entries.append(journal_entry_to_log_entry(record))
+
+    if entries and entries[-1]["eventID"]:
+        cursors[monitor] = entries[-1]["eventID"]
+    return entries
+
+
+# Unified-log reads start where the monitor's last successful read ended (a
+# little earlier, since seen_events drops the overlap), so a deferred or failed
+# read is caught up next tick, but never reach back more than an hour
+LOG_WINDOW_OVERLAP_SECONDS = 5
+LOG_MAX_LOOKBACK_MINUTES = 60
+
+
+def read_log_entries(state: Dict[str, Any], monitor: str, predicate: str) -> List[Dict[str, Any]]:
+    """Fetch new log entries for a monitor from the platform's log (unified log or journald)."""
+    if IS_LINUX:
+        return get_journal_entries(state, monitor)
+
+    windows = state.setdefault("log_windows", {})
+    now = datetime.now()
+    start = now - timedelta(minutes=1)
+    if windows.get(monitor):
+        try:
+            last_end = datetime.fromisoformat(windows[monitor])
+            start = max(last_end - timedelta(seconds=LOG_WINDOW_OVERLAP_SECONDS), now - timedelta(minutes=LOG_MAX_LOOKBACK_MINUTES))
+        except ValueError:
+            pass
+
+    cmd = log_show_command(rules_log_predicate(monitor, predicate), start, levels=LOG_LEVELS.get(monitor, ()))
+    output = run_probe(cmd, timeout=30)
+    if output is None:
+        # Failed or out of tick budget: keep the window so the next read covers it
+        return []
+    windows[monitor] = now.isoformat()
+    return parse_log_output(output)
+
+
+# =============================================================================
+# Detection Rules
+# =============================================================================
+#
+# What each log monitor reports (and what it ignores) is decided by rules
+# rather than hard-coded substring checks. The built-in rules reproduce the
+# defaults below (SUDO_EXCLUDE_PATTERNS, MDM_INTERESTING_KEYWORDS, the sshd
+# login/failure messages...). Extra rules are read from RULES_FILE (TOML, JSON,
+# or YAML if PyYAML is installed) and take precedence over the built-ins:
+#
+#   [[rule]]
+#   id = "ignore-backup-sudo"
+#   monitor = "sudo"                  # or a list; omit for every monitor
+#   action = "drop"                   # "alert", "notify" or "drop"
+#   match = { message_contains = "/usr/local/bin/backup.sh" }
+#
+#   [[rule]]
+#   id = "smb-from-outside"
+#   monitor = "ports"
+#   action = "alert"
+#   title = "SMB FROM {remote}"       # optional; {field} placeholders
+#   match = { port = "445", remote = ["0.0.0.0/0", "::/0"] }
+#
+# Match fields (all must hold; a list means any of): process, subsystem, user,
+# port (ports/ranges), remote (CIDRs), message_contains (case-sensitive),
+# message_keywords (case-insensitive) and message_regex. The first matching
+# rule wins. Rules are compiled once into per-monitor dispatch indexes keyed
+# on process, subsystem, user and port, plus a 4-gram index over message
+# literals, so an event is only tested against rules that could match it.
+
+RULES_FILE = os.environ.get("RULES_FILE", str(STATE_DIR / "rules.toml"))
+RULE_ACTIONS = ("alert", "notify", "drop")
+RULE_MATCH_FIELDS = (
+    "process", "subsystem", "user", "port", "remote",
+    "message_contains", "message_keywords", "message_regex",
+)
+RULE_GRAM = 4   # message literals are indexed by one of their RULE_GRAM-character substrings
+
+
+def default_rules() -> List[Dict[str, Any]]:
+    """Built-in rules equivalent to the monitors' historic hard-coded filters."""
+    return [
+        {"id": "ssh-login", "monitor": "ssh", "action": "alert", "kind": "login",
+         "match": {"message_contains": ["Accepted publickey", "Accepted keyboard"]}},
+        {"id": "ssh-failure", "monitor": "ssh", "action": "alert", "kind": "failure",
+         "match": {"message_contains": "Failed"}},
+        {"id": "ssh-error", "monitor": "ssh", "action": "alert", "kind": "failure",
+         "match": {"message_keywords": "error"}},
+        # Skip our own probes so sudo doesn't monitor itself in a loop
+        {"id": "sudo-self", "monitor": "sudo", "action": "drop",
+         "match": {"message_contains": SUDO_EXCLUDE_PATTERNS}},
+        {"id": "sudo-command", "monitor": "sudo", "action": "alert"},
+        {"id": "portscan-rst-limit", "monitor": "portscan", "action": "alert",
+         "match": {"message_contains": "Limiting closed port RST response"}},
+        {"id": "ftp-access", "monitor": "ftp", "action": "notify"},
+        {"id": "mdm-interesting", "monitor": "mdm", "action": "alert",
+         "match": {"message_keywords": MDM_INTERESTING_KEYWORDS}},
+    ]
+
+
+def _as_list(value: Any) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def load_rules_file(path: str, section: str = "rule") -> List[Dict[str, Any]]:
+    """Read user rules from TOML, JSON or YAML (a top-level "rule"/"rules" list, or another section)."""
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    if path.endswith(".json"):
+        data = json.loads(raw)
+    elif path.endswith((".yaml", ".yml")):
+        import yaml  # optional dependency, only needed for YAML rule files
+        data = yaml.safe_load(raw)
+    else:
+        try:
+            import tomllib  # Python 3.11+
+        except ImportError:
+            try:
+                import tomli as tomllib  # optional backport for the system Python 3.9
+            except ImportError:
+                raise ImportError(
+                    "TOML rules need Python 3.11+ or the tomli package; "
+                    "use a .json RULES_FILE instead"
+                ) from None
+        data = tomllib.loads(raw.decode())
+
+    if isinstance(data, dict):
+        data = data.get(section, data.get(section + "s", []))
+    elif section != "rule":
+        # A bare list is a list of rules
+        data = []
+    if not isinstance(data, list):
+        raise ValueError(f"expected a list of {section}s")
+    return data
+
+
+def _compile_rule_tests(match: Dict[str, Any]) -> List[Callable[[Dict[str, Any]], bool]]:
+    """Turn a rule's match table into a list of field predicates."""
+    import ipaddress
+
+    tests: List[Callable[[Dict[str, Any]], bool]] = []
+    for field in ("process", "subsystem", "user"):
+        if field in match:
+            values = {str(value) for value in _as_list(match[field])}
+            tests.append(lambda fields, field=field, values=values: fields.get(field) in values)
+
+    if "port" in match:
+        ranges = parse_port_ranges(",".join(str(value) for value in _as_list(match["port"])))
+        if not ranges:
+            raise ValueError(f"bad port: {match['port']!r}")
+        starts = [low for low, _ in ranges]
+        tests.append(lambda fields: fields.get("port") is not None and port_in_ranges(int(fields["port"]), ranges, starts))
+
+    if "remote" in match:
+        networks = [ipaddress.ip_network(str(value), strict=False) for value in _as_list(match["remote"])]
+
+        def in_networks(fields: Dict[str, Any]) -> bool:
+            try:
+                address = ipaddress.ip_address(str(fields.get("remote") or "").strip("[]"))
+            except ValueError:
+                return False
+            return any(address in network for network in networks if network.version == address.version)
+        tests.append(in_networks)
+
+    if "message_contains" in match:
+        literals = [str(value) for value in _as_list(match["message_contains"])]
+        tests.append(lambda fields: any(literal in fields.get("message", "") for literal in literals))
+
+    if "message_keywords" in match:
+        keywords = [str(value).lower() for value in _as_list(match["message_keywords"])]
+        tests.append(lambda fields: any(keyword in fields["message_lower"] for keyword in keywords))
+
+    if "message_regex" in match:
+        pattern = re.compile(str(match["message_regex"]))
+        tests.append(lambda fields: pattern.search(fields.get("message", "")) is not None)
+
+    return tests
+
+
+def _regex_literal_prefix(pattern: str) -> str:
+    """Literal text every match of a regex must start with ("" if unknown)."""
+    if "|" in pattern:
+        return ""
+    body = pattern
+    for anchor in ("^", r"\b"):
+        if body.startswith(anchor):
+            body = body[len(anchor):]
+    literal = re.match(r"[A-Za-z0-9 _-]*", body).group()
+    # A quantifier makes the last character optional ("abcd?", "abcd*")
+    if body[len(literal):len(literal) + 1] in ("?", "*", "{"):
+        literal = literal[:-1]
+    return literal
+
+
+class RuleSet:
+    """
+    Rules compiled into per-monitor dispatch indexes.
+
+    Each rule is filed under one index slot, the most selective one it has:
+    an exact process, subsystem, user or port value, else a 4-gram of each of
+    its message literals, else a short "always check" list. match() gathers the
+    candidate rules for an event from those slots and tests only them, in
+    rule order.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules: List[Dict[str, Any]] = []
+        self.tests: List[List[Callable[[Dict[str, Any]], bool]]] = []
+        self.errors: List[str] = []
+        # monitor ("*" for any) -> {"exact": {field: {value: [rule numbers]}}, "grams": {gram: [...]}, "rest": [...]}
+        self.index: Dict[str, Dict[str, Any]] = {}
+
+        for rule in rules:
+            try:
+                self._add(rule)
+            except (KeyError, TypeError, ValueError, re.error) as e:
+                self.errors.append(f"{rule.get('id', '?') if isinstance(rule, dict) else '?'}: {e}")
+
+    def _add(self, rule: Dict[str, Any]) -> None:
+        match = rule.get("match", {})
+        unknown = set(match) - set(RULE_MATCH_FIELDS)
+        if unknown:
+            raise ValueError(f"unknown match fields {sorted(unknown)}")
+        if rule.get("action", "alert") not in RULE_ACTIONS:
+            raise ValueError(f"unknown action {rule['action']!r}")
+        for key in ("title", "body"):
+            if key in rule:
+                try:
+                    str(rule[key]).format_map(_RuleFields())
+                except (ValueError, IndexError, AttributeError) as e:
+                    raise ValueError(f"bad {key} template {rule[key]!r}: {e}")
+
+        number = len(self.rules)
+        tests = _compile_rule_tests(match)
+        self.rules.append(dict(rule, action=rule.get("action", "alert")))
+        self.tests.append(tests)
+
+        for monitor in _as_list(rule.get("monitor", "*")):
+            slots = self.index.setdefault(monitor, {"exact": {}, "grams": {}, "rest": []})
+            for field in ("process", "subsystem", "user", "port"):
+                if field in match and (field != "port" or all(str(value).isdigit() for value in _as_list(match[field]))):
+                    by_value = slots["exact"].setdefault(field, {})
+                    for value in _as_list(match[field]):
+                        by_value.setdefault(str(value), []).append(number)
+                    break
+            else:
+                literals = _as_list(match.get("message_contains", [])) + _as_list(match.get("message_keywords", []))
+                if not literals and "message_regex" in match:
+                    literals = [_regex_literal_prefix(str(match["message_regex"]))]
+                if literals and all(len(str(literal)) >= RULE_GRAM for literal in literals):
+                    grams = slots["grams"]
+                    for literal in literals:
+                        # File under the literal's least crowded 4-gram, so shared prefixes don't pile up
+                        text = str(literal).lower()
+                        gram = min(
+                            (text[i:i + RULE_GRAM] for i in range(len(text) - RULE_GRAM + 1)),
+                            key=lambda gram: len(grams.get(gram, ())),
+                        )
+                        grams.setdefault(gram, []).append(number)
+                else:
+                    slots["rest"].append(number)
+
+    def candidates(self, monitor: str, fields: Dict[str, Any]) -> List[int]:
+        """Rule numbers that could match, from the dispatch indexes."""
+        found: set = set()
+        for key in (monitor, "*"):
+            slots = self.index.get(key)
+            if not slots:
+                continue
+            for field, by_value in slots["exact"].items():
+                value = fields.get(field)
+                if value is not None:
+                    found.update(by_value.get(str(value), ()))
+            grams = slots["grams"]
+            if grams:
+                message = fields["message_lower"]
+                if len(grams) * RULE_GRAM < len(message):
+                    # Few literals: substring-search each indexed gram
+                    for gram, numbers in grams.items():
+                        if gram in message:
+                            found.update(numbers)
+                else:
+                    # Many literals: look up every gram of the message instead
+                    for i in range(len(message) - RULE_GRAM + 1):
+                        numbers = grams.get(message[i:i + RULE_GRAM])
+                        if numbers:
+                            found.update(numbers)
+            found.update(slots["rest"])
+        return sorted(found)
+
+    def match(self, monitor: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The first rule (in file order) matching an event's fields, if any."""
+        fields.setdefault("message_lower", fields.get("message", "").lower())
+        for number in self.candidates(monitor, fields):
+            if all(test(fields) for test in self.tests[number]):
+                return self.rules[number]
+        return None
+
+
+_rules_cache: Dict[str, Any] = {"mtime": None, "rules": None, "checked": 0.0}
+
+
+def get_rules() -> RuleSet:
+    """Compiled rules, recompiled only when RULES_FILE changes (checked at most once a second)."""
+    now = time.monotonic()
+    if _rules_cache["rules"] is not None and now - _rules_cache["checked"] < 1:
+        return _rules_cache["rules"]
+    _rules_cache["checked"] = now
+
+    try:
+        mtime = os.path.getmtime(RULES_FILE)
+    except OSError:
+        mtime = 0
+
+    if _rules_cache["rules"] is None or _rules_cache["mtime"] != mtime:
+        user_rules: List[Dict[str, Any]] = []
+        errors = []
+        if mtime:
+            try:
+                user_rules = load_rules_file(RULES_FILE)
+            except (OSError, ValueError, ImportError) as e:
+                errors.append(f"{RULES_FILE}: {e}")
+        rules = RuleSet(user_rules + default_rules())
+        rules.errors[:0] = errors
+        _rules_cache.update(mtime=mtime, rules=rules)
+    return _rules_cache["rules"]
+
+
+def _predicate_string(value: Any) -> str:
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _rule_log_clause(match: Dict[str, Any], exact: bool) -> Optional[str]:
+    """
+    The part of a rule's match table expressible as a `log` predicate.
+
+    For rules that report events (exact=False) the clause may be looser than
+    the rule (user, port and remote are checked in Python afterwards). Drop
+    rules must be exact, so they only translate if every field does. None
+    means "can't narrow the query".
+    """
+    if "message_regex" in match or (exact and {"user", "port", "remote"} & set(match)):
+        return None
+
+    clauses = []
+    for field in ("process", "subsystem"):
+        if field in match:
+            values = [_predicate_string(value) for value in _as_list(match[field])]
+            clauses.append(f"{field} == {values[0]}" if len(values) == 1 else f"{field} IN {{{', '.join(values)}}}")
+    for field, operator in (("message_contains", "CONTAINS"), ("message_keywords", "CONTAINS[c]")):
+        if field in match:
+            literals = [f"eventMessage {operator} {_predicate_string(value)}" for value in _as_list(match[field])]
+            clauses.append(literals[0] if len(literals) == 1 else "(" + " OR ".join(literals) + ")")
+
+    return " AND ".join(clauses) or None
+
+
+def rules_log_predicate(monitor: str, base: str) -> str:
+    """
+    Narrow a monitor's `log` predicate with its rules, so the filtering the
+    rules would do in Python happens inside `log show` instead.
+
+    Reporting rules are ORed into a message filter (unless one of them can't
+    be expressed, e.g. a regex). Drop rules are pushed down as NOT clauses
+    only while no reporting rule precedes them, since an earlier rule wins.
+    """
+    rules = get_rules()
+    positives: List[str] = []
+    drops: List[str] = []
+    unrestricted = False
+    reporting_seen = False
+
+    for rule in rules.rules:
+        if monitor not in _as_list(rule.get("monitor", "*")) and "*" not in _as_list(rule.get("monitor", "*")):
+            continue
+        if rule["action"] == "drop":
+            clause = _rule_log_clause(rule.get("match", {}), exact=True)
+            if clause and not reporting_seen:
+                drops.append(clause)
+            continue
+        reporting_seen = True
+        clause = _rule_log_clause(rule.get("match", {}), exact=False)
+        if clause is None:
+            unrestricted = True
+        else:
+            positives.append(clause)
+
+    predicate = f"({base})"
+    if positives and not unrestricted:
+        predicate += " AND (" + " OR ".join(positives) + ")"
+    for clause in drops:
+        predicate += f" AND NOT ({clause})"
+    return predicate
+
+
+class _RuleFields(dict):
+    """format_map() mapping that renders unknown placeholders as empty strings."""
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+def entry_rule_fields(entry: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    """Normalized rule fields for a log entry (parsers add user/remote/port)."""
+    fields = {
+        "process": entry.get("process", "") or "",
+        "subsystem": entry.get("subsystem", "") or "",
+        "message": entry.get("eventMessage", "") or "",
+    }
+    fields.update(extra)
+    return fields
+
+
+def apply_rule(rule: Optional[Dict[str, Any]], fields: Dict[str, Any], event: Optional[Event]) -> Optional[Event]:
+    """
+    Let the matching rule shape a monitor's event: drop it, change its
+    severity, or replace its title/body with the rule's templates.
+    """
+    if rule is None or event is None:
+        return event
+    if rule["action"] == "drop":
+        return None
+
+    values = _RuleFields(fields)
+    event.severity = sys.intern(rule["action"])
+    # Templates are checked when rules load, but e.g. "{remote[9]}" can still
+    # fail on a particular value: keep the monitor's own text then
+    for key in ("title", "body"):
+        if key in rule:
+            try:
+                setattr(event, key, str(rule[key]).format_map(values))
+            except (ValueError, IndexError, KeyError, AttributeError, TypeError):
+                pass
+    return event
+
+
+# =============================================================================
+# SSH Parser
+# =============================================================================
+
+# Which messages count (logins, failures, errors) comes from the rules, see rules_log_predicate
+SSH_PREDICATE = 'process == "sshd"'
+
+# Brute-force aggregation: failed logins are counted per source IP and per user
+# in ring buffers of SSH_FAIL_BUCKETS one-minute buckets. One alert is raised
+# when SSH_FAIL_THRESHOLD failures land inside the window, then a summary every
+# SSH_SUMMARY_INTERVAL seconds while the attack keeps going.
+SSH_FAIL_THRESHOLD = int(os.environ.get("SSH_FAIL_THRESHOLD", "5"))
+SSH_FAIL_BUCKETS = 10
+SSH_FAIL_BUCKET_SECONDS = 60
+SSH_SUMMARY_INTERVAL = 300
+SSH_MAX_TRACKED = 256   # LRU cap on tracked sources (and users)
+
+
+def _is_ip_address(text: str) -> bool:
+    return "/" not in text and parse_cidr(text) is not None
+
+
+def _ssh_user_and_source(message: str) -> Tuple[str, str]:
+    """Extract the user and remote address ("" if none is mentioned) from an sshd message."""
+    user = ""
+    src = ""
+    if " for " in message:
+        user = message.split(" for ", 1)[-1].split(" ", 1)[0]
+        if user == "invalid" and " for invalid user " in message:
+            user = message.split(" for invalid user ", 1)[-1].split(" ", 1)[0]
+    if " from " in message:
+        src = message.split(" from ", 1)[-1].split(" ", 1)[0]
+    elif " by " in message:
+        src = message.split(" by ", 1)[-1].split(" ", 1)[0]
+    # "closed by remote host", "by authenticating user bob 203.0.113.7 port 22"...
+    if not _is_ip_address(src):
+        src = extract_event_source(message) or ""
+        if not _is_ip_address(src):
+            src = ""
+    return user, src
+
+
+def classify_ssh_entry(entry: Dict[str, Any]) -> Tuple[Optional[str], Optional[Event]]:
+    """
+    Match an sshd log entry against the rules.
+
+    Returns the matching rule's kind ("login", "failure", or None for custom
+    rules) and the event, or (None, None) if the entry isn't interesting.
+    """
+    message = entry.get("eventMessage", "")
+    user, src = _ssh_user_and_source(message)
+    fields = entry_rule_fields(entry, user=user, remote=src)
+    rule = get_rules().match("ssh", fields)
+    if rule is None or rule["action"] == "drop":
+        return None, None
+
+    kind = rule.get("kind")
+    if kind == "login":
+        # Successful login
+        method = "Public Key" if "publickey" in message else "Password"
+        event = Event("alert", f"SSH LOGIN: {user}", f"from {src or 'unknown'} via {method}", source=src or None, user=user, process="sshd", fields={"method": method})
+    else:
+        # Failed attempt or error
+        summary = message[:50] + "..." if len(message) > 50 else message
+        event = Event("alert", f"SSH EVENT: {user or 'unknown'}", f"from {src or 'unknown'}: {summary}", source=src or None, user=user, process="sshd")
+    if entry.get("processID"):
+        # The sshd handling this connection, for correlating what the session does
+        event.fields = {**(event.fields or {}), "pid": str(entry.get("processID"))}
+    return kind, apply_rule(rule, fields, event)
+
+
+def parse_ssh_entry(entry: Dict[str, Any]) -> Optional[Event]:
+    """Turn a single sshd log entry into an event, if it is interesting."""
+    return classify_ssh_entry(entry)[1]
+
+
+def track_ssh_failure(
+    trackers: Dict[str, Dict[str, Any]],
+    key: str,
+    when: float,
+    detail: str,
+) -> Optional[str]:
+    """
+    Count one failed login for `key` and report what the caller should announce.
+
+    trackers maps key -> {"b": bucket counts, "t": newest bucket number,
+    "since": attack start, "last": latest failure, "total": failures since
+    then, "details": {detail: n}, "summary_at": last announcement or None},
+    in LRU order.
+
+    Returns "threshold" when the window first crosses SSH_FAIL_THRESHOLD,
+    "summary" when an ongoing attack is due for a summary, otherwise None.
+    """
+    bucket = int(when // SSH_FAIL_BUCKET_SECONDS)
+    tracker = trackers.pop(key, None)
+    if tracker is None:
+        tracker = {"b": [0] * SSH_FAIL_BUCKETS, "t": bucket, "since": when, "last": when, "total": 0, "details": {}, "summary_at": None}
+    trackers[key] = tracker  # (re)insert as most recently used
+
+    # Advance the ring, clearing buckets that fell out of the window
+    gap = bucket - tracker["t"]
+    if gap > 0:
+        for step in range(1, min(gap, SSH_FAIL_BUCKETS) + 1):
+            tracker["b"][(tracker["t"] + step) % SSH_FAIL_BUCKETS] = 0
+        tracker["t"] = bucket
+
+    # A quiet window means any previous attack is over; start a new one
+    if sum(tracker["b"]) == 0:
+        tracker.update(since=when, total=0, details={}, summary_at=None)
+
+    if gap > -SSH_FAIL_BUCKETS:  # ignore failures older than the window
+        tracker["b"][bucket % SSH_FAIL_BUCKETS] += 1
+    tracker["total"] += 1
+    tracker["last"] = max(tracker["last"], when)
+    if detail and (detail in tracker["details"] or len(tracker["details"]) < 20):
+        tracker["details"][detail] = tracker["details"].get(detail, 0) + 1
+
+    if len(trackers) > SSH_MAX_TRACKED:
+        del trackers[next(iter(trackers))]
+
+    if tracker["summary_at"] is None:
+        if sum(tracker["b"]) >= SSH_FAIL_THRESHOLD:
+            tracker["summary_at"] = when
+            return "threshold"
+    elif when - tracker["summary_at"] >= SSH_SUMMARY_INTERVAL:
+        tracker["summary_at"] = when
+        return "summary"
+    return None
+
+
+def _ssh_failure_event(kind: str, scope: str, key: str, tracker: Dict[str, Any], detail_name: str) -> Event:
+    """Build the alert/summary event for a brute-force tracker."""
+    window_minutes = SSH_FAIL_BUCKETS * SSH_FAIL_BUCKET_SECONDS // 60
+    top = sorted(tracker["details"], key=lambda d: -tracker["details"][d])[:3]
+    details = f" ({detail_name}: {', '.join(top)})" if top else ""
+    who = {"source": key if key != "unknown" else None} if scope == "from" else {"user": key}
+    fields = {"failures": sum(tracker["b"]), "total": tracker["total"], detail_name: top}
+    if kind == "threshold":
+        title = f"SSH BRUTE FORCE: {scope} {key}"
+        body = f"{sum(tracker['b'])} failed logins in {window_minutes} min{details}"
+        return Event("alert", title, body, process="sshd", fields=fields, **who)
+    minutes = max(1, int((tracker["last"] - tracker["since"]) // 60))
+    title = f"SSH BRUTE FORCE ONGOING: {scope} {key}"
+    body = f"{tracker['total']} failures over {minutes} min, {sum(tracker['b'])} in last {window_minutes} min{details}"
+    return Event("notify", title, body, process="sshd", fields=fields, **who)
+
+
+def process_ssh_entries(state: Dict[str, Any], entries: List[Dict[str, Any]]) -> List[Event]:
+    """Turn sshd log entries into events, aggregating failures per source and per user."""
+    events = []
+    trackers = state.setdefault("ssh_failures", {"src": {}, "user": {}})
+    seen = set(state["seen_events"])
+
+    for entry in entries:
+        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
+        if event_id in seen:
+            continue
+
+        kind, event = classify_ssh_entry(entry)
+        if not event:
+            continue
+        seen.add(event_id)
+        state["seen_events"].append(event_id)
+
+        if kind != "failure":
+            events.append(event)
+            continue
+
+        # Failed attempt or error: count it instead of alerting on every line
+        user, src = _ssh_user_and_source(entry.get("eventMessage", ""))
+        parsed = parse_log_timestamp(entry.get("timestamp", ""))
+        when = parsed.timestamp() if parsed else time.time()
+
+        kind = track_ssh_failure(trackers["src"], src or "unknown", when, user)
+        if kind:
+            events.append(_ssh_failure_event(kind, "from", src or "unknown", trackers["src"][src or "unknown"], "users"))
+        if user:
+            kind = track_ssh_failure(trackers["user"], user, when, src)
+            if kind:
+                events.append(_ssh_failure_event(kind, "user", user, trackers["user"][user], "from"))
+
+    return events
+
+
+def parse_ssh_events(state: Dict[str, Any]) -> List[Event]:
+    """Parse SSH events from unified log."""
+    if not MONITOR_SSH:
+        return []
+
+    # Query for sshd events
+    entries = read_log_entries(state, "ssh", SSH_PREDICATE)
+
+    return process_ssh_entries(state, entries)
+
+
+# =============================================================================
+# Sudo Parser
+# =============================================================================
+
+SUDO_PREDICATE = '(process == "sudo") AND (eventMessage CONTAINS "COMMAND")'
+
+# Exclusion patterns to prevent self-monitoring loops
+SUDO_EXCLUDE_PATTERNS = ["/usr/sbin/lsof", "/usr/bin/log show", "security-growler"]
+
+
+def parse_sudo_entry(entry: Dict[str, Any]) -> Optional[Event]:
+    """Turn a single sudo log entry into an event, if it is interesting."""
+    message = entry.get("eventMessage", "")
+
+    # Parse sudo log format:
+    # user : TTY=ttys001 ; PWD=/Users/user ; USER=root ; COMMAND=/usr/bin/whoami
+    try:
+        if " ; " in message:
+            parts = message.split(" ; ")
+            user_part = parts[0] if parts else ""
+            user = user_part.rsplit(" : ", 1)[0].split()[-1] if user_part.strip() else "unknown"
+
+            tty = ""
+            pwd = ""
+            command = ""
+
+            for part in parts:
+                if "TTY=" in part:
+                    tty = part.split("TTY=", 1)[-1].strip()
+                elif "PWD=" in part:
+                    pwd = part.split("PWD=", 1)[-1].strip()
+                elif "COMMAND=" in part:
+                    command = part.split("COMMAND=", 1)[-1].strip()
+
+            if command:
+                title = f"SUDO: {user}"
+                # Truncate long commands
+                cmd_display = command[:60] + "..." if len(command) > 60 else command
+                body = f"{cmd_display}"
+                # Rules decide what's ignored (by default our own probes, SUDO_EXCLUDE_PATTERNS)
+                fields = entry_rule_fields(entry, user=user, command=command, tty=tty, pwd=pwd)
+                event = Event("alert", title, body, user=user, process="sudo", fields={"command": command, "tty": tty, "pwd": pwd})
+                if entry.get("processID"):
+                    event.fields["pid"] = str(entry.get("processID"))
+                return apply_rule(get_rules().match("sudo", fields), fields, event)
+    except (IndexError, ValueError):
+        pass
+
+    return None
+
+
+def parse_sudo_events(state: Dict[str, Any]) -> List[Event]:
+    """Parse sudo events from unified log."""
+    if not MONITOR_SUDO:
+        return []
+
+    events = []
+
+    # Query for sudo events
+    entries = read_log_entries(state, "sudo", SUDO_PREDICATE)
+
+    for entry in entries:
+        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
+        if event_id in state["seen_events"]:
+            continue
+
+        event = parse_sudo_entry(entry)
+        if event:
+            events.append(event)
+            state["seen_events"].append(event_id)
+
+    return events
+
+
+# =============================================================================
+# Socket Enumeration
+# =============================================================================
+#
+# Monitors get open sockets from get_socket_table(), which dispatches to a
+# pluggable backend. Every backend returns the same socket dicts:
+#   process, pid, user, family (IPv4/IPv6), proto (TCP/UDP),
+#   name ("local->remote"), local, remote ("" if none), state (e.g. LISTEN)
+# and None when it can't enumerate sockets at all.
+
+# Which backend to use: auto, lsof or procfs
+SOCKET_BACKEND = os.environ.get("SOCKET_BACKEND", "auto")
+# Root of the proc filesystem (overridable to replay a captured /proc tree)
+PROC_ROOT = os.environ.get("PROC_ROOT", "/proc")
+
+# /proc/net TCP state codes, named the way lsof names them
+PROCFS_TCP_STATES = {
+    "01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECEIVED", "04": "FIN_WAIT_1",
+    "05": "FIN_WAIT_2", "06": "TIME_WAIT", "07": "CLOSED", "08": "CLOSE_WAIT",
+    "09": "LAST_ACK", "0A": "LISTEN", "0B": "CLOSING",
+}
+
+
+def parse_lsof_sockets(output: str) -> List[Dict[str, str]]:
+    """
+    Parse `lsof -i -n -P` output into socket dicts.
+
+    Each line looks like:
+    COMMAND PID USER FD TYPE DEVICE SIZE/OFF NODE NAME
+    postgres 812 me 7u IPv4 0xabc 0t0 TCP 127.0.0.1:5432->127.0.0.1:50412 (ESTABLISHED)
+    """
+    sockets = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) < 9 or parts[0] == "COMMAND":
+            continue
+
+        # TCP sockets end with a "(STATE)" column after the NAME
+        state = ""
+        name = parts[-1]
+        if name.startswith("(") and name.endswith(")"):
+            state = name[1:-1]
+            name = parts[-2]
+
+        if "->" in name:
+            local, remote = name.split("->", 1)
+        else:
+            local, remote = name, ""
+
+        sockets.append({
+            "process": parts[0].replace("\\x20", " "),
+            "pid": parts[1],
+            "user": parts[2],
+            "family": parts[4],
+            "proto": parts[7],
+            "name": name,
+            "local": local,
+            "remote": remote,
+            "state": state,
+        })
+    return sockets
+
+
+def get_lsof_sockets() -> Optional[List[Dict[str, str]]]:
+    """Socket backend: `lsof -i` (works everywhere, but stats every open file)."""
+    return run_parsed_probe(["lsof", "+c", "0", "-i", "-n", "-P"], parse_lsof_sockets, timeout=15)
+
+
+def split_host_port(address: str) -> Tuple[str, str]:
+    """Split "1.2.3.4:80" / "[::1]:80" / "*:80" into (host, port)."""
+    if ":" not in address:
+        return address, ""
+    host, port = address.rsplit(":", 1)
+    return host.strip("[]"), port
+
+
+@functools.lru_cache(maxsize=4096)
+def _procfs_host(hex_ip: str) -> str:
+    """Decode a /proc/net host ("0100007F") into lsof style ("127.0.0.1", "[::1]" or "*")."""
+    # Addresses are stored as native-endian (little-endian) 32-bit words
+    raw = b"".join(bytes.fromhex(hex_ip[i:i + 8])[::-1] for i in range(0, len(hex_ip), 8))
+    if not any(raw):
+        return "*"
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw)
+    return f"[{socket.inet_ntop(socket.AF_INET6, raw)}]"
+
+
+def _procfs_address(hex_address: str) -> str:
+    """Decode a /proc/net address ("0100007F:1F90") into lsof style ("127.0.0.1:8080")."""
+    hex_ip, hex_port = hex_address.split(":")
+    return f"{_procfs_host(hex_ip)}:{int(hex_port, 16)}"
+
+
+def _procfs_socket_owners(proc_root: str) -> Dict[str, Tuple[str, str]]:
+    """Map socket inode -> (pid, process name) by scanning /proc/*/fd."""
+    owners = {}
+    try:
+        pids = [entry for entry in os.listdir(proc_root) if entry.isdigit()]
+    except OSError:
+        return owners
+
+    for pid in pids:
+        fd_dir = os.path.join(proc_root, pid, "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue  # process exited or belongs to another user
+
+        name = None
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                if name is None:
+                    try:
+                        with open(os.path.join(proc_root, pid, "comm")) as f:
+                            name = f.read().strip()
+                    except OSError:
+                        name = "?"
+                owners.setdefault(target[8:-1], (pid, name))
+    return owners
+
+
+def get_procfs_sockets(proc_root: Optional[str] = None) -> Optional[List[Dict[str, str]]]:
+    """Socket backend: read /proc/net/{tcp,tcp6,udp,udp6} and /proc/*/fd directly (Linux)."""
+    import pwd
+
+    proc_root = proc_root or PROC_ROOT
+    tables = [("tcp", "TCP", "IPv4"), ("tcp6", "TCP", "IPv6"), ("udp", "UDP", "IPv4"), ("udp6", "UDP", "IPv6")]
+
+    rows = []
+    for table, proto, family in tables:
+        try:
+            with open(os.path.join(proc_root, "net", table)) as f:
+                lines = f.read().splitlines()[1:]  # Skip header
+        except OSError:
+            continue
+        for line in lines:
+            # sl local_address rem_address st tx:rx tr:when retrnsmt uid timeout inode ...
+            parts = line.split()
+            if len(parts) >= 10 and parts[9] != "0":
+                rows.append((proto, family, parts))
+
+    if not rows:
+        return None if not os.path.isdir(os.path.join(proc_root, "net")) else []
+
+    owners = _procfs_socket_owners(proc_root)
+    users: Dict[str, str] = {}
+    sockets = []
+    for proto, family, parts in rows:
+        owner = owners.get(parts[9])
+        if owner is None:
+            continue  # like lsof, only show sockets we can attribute to a process
+
+        uid = parts[7]
+        if uid not in users:
+            try:
+                users[uid] = pwd.getpwuid(int(uid)).pw_name
+            except (KeyError, ValueError):
+                users[uid] = uid
+
+        local = _procfs_address(parts[1])
+        remote = _procfs_address(parts[2])
+        if remote.startswith("*:"):
+            remote = ""
+        state = PROCFS_TCP_STATES.get(parts[3], "") if proto == "TCP" else ""
+
+        sockets.append({
+            "process": owner[1],
+            "pid": owner[0],
+            "user": users[uid],
+            "family": family,
+            "proto": proto,
+            "name": f"{local}->{remote}" if remote else local,
+            "local": local,
+            "remote": remote,
+            "state": state,
+        })
+    return sockets
+
+
+SOCKET_BACKENDS = {
+    "lsof": get_lsof_sockets,
+    "procfs": get_procfs_sockets,
+}
+
+
+def get_socket_backend_name() -> str:
+    """Resolve SOCKET_BACKEND ("auto" prefers /proc when it exists)."""
+    if SOCKET_BACKEND in SOCKET_BACKENDS:
+        return SOCKET_BACKEND
+    return "procfs" if os.path.exists(os.path.join(PROC_ROOT, "net", "tcp")) else "lsof"
+
+
+def get_socket_table() -> Optional[List[Dict[str, str]]]:
+    """Get every open internet socket (one enumeration per tick, shared by all monitors), or None if unavailable."""
+    backend = get_socket_backend_name()
+    if backend == "lsof":
+        return get_lsof_sockets()  # already memoized as a command probe
+    return tick_memo(f"sockets:{backend}", SOCKET_BACKENDS[backend])
+
+
+# =============================================================================
+# Port Scan Parser
+# =============================================================================
+
+def get_recent_connections() -> List[Dict[str, str]]:
+    """Get recent network connections using lsof to identify port scan sources."""
+    connections = []
+    seen_sources = set()
+
+    for sock in get_socket_table() or []:
+        # Look for connections with remote addresses
+        if sock["state"] == "LISTEN" or not sock["remote"]:
+            continue
+
+        # Extract remote IP (before the port)
+        remote_ip = split_host_port(sock["remote"])[0]
+        # Avoid duplicates
+        if remote_ip and remote_ip not in seen_sources:
+            seen_sources.add(remote_ip)
+            connections.append({
+                "process": sock["process"],
+                "pid": sock["pid"],
+                "user": sock["user"],
+                "remote_ip": remote_ip,
+                "full_connection": sock["name"],
+            })
+
+    return connections
+
+
+PORTSCAN_PREDICATE = 'process == "kernel"'   # narrowed to the RST-limiting message by the portscan rules
+
+
+def parse_portscan_entry(
+    entry: Dict[str, Any],
+    recent_connections: Optional[List[Dict[str, str]]] = None,
+) -> Optional[Event]:
+    """
+    Turn a single kernel RST-limiting log entry into an event.
+
+    recent_connections is the live connection list used to guess the scan
+    source; it is None when replaying old logs, where the source is unknown.
+    """
+    message = entry.get("eventMessage", "")
+    # The guessed source goes in before matching, so rules can match on remote
+    remote = recent_connections[0]["remote_ip"] if recent_connections else ""
+    fields = entry_rule_fields(entry, remote=remote)
+    rule = get_rules().match("portscan", fields)
+    if rule is None:
+        return None
+
+    # Extract rate limit info
+    rate_info = message.split("response ", 1)[-1] if "response " in message else message
+
+    title = "PORT SCAN DETECTED"
+    source_ips = []
+    if recent_connections:
+        # Get unique source IPs
+        source_ips = list(set(conn["remote_ip"] for conn in recent_connections[:5]))
+        if len(source_ips) == 1:
+            body = f"from {source_ips[0]} - Limiting {rate_info}"
+        elif len(source_ips) <= 3:
+            body = f"from {', '.join(source_ips)} - Limiting {rate_info}"
+        else:
+            body = f"from {source_ips[0]} (+{len(source_ips)-1} more) - Limiting {rate_info}"
+    else:
+        body = f"Limiting {rate_info} (source unknown)"
+
+    event = Event("alert", title, body, source=remote, fields={"sources": source_ips, "limit": rate_info})
+    return apply_rule(rule, fields, event)
+
+
+def parse_portscan_events(state: Dict[str, Any]) -> List[Event]:
+    """Parse port scan detection events from unified log."""
+    if not MONITOR_PORTSCAN:
+        return []
+
+    events = []
+
+    # Query for kernel port scan detection messages
+    entries = read_log_entries(state, "portscan", PORTSCAN_PREDICATE)
+
+    recent_connections = None
+    for entry in entries:
+        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
+        if event_id in state["seen_events"]:
+            continue
+
+        # Try to identify the source of the port scan (only once per check)
+        if recent_connections is None:
+            recent_connections = get_recent_connections()
+
+        event = parse_portscan_entry(entry, recent_connections)
+        if event:
+            events.append(event)
+            state["seen_events"].append(event_id)
+
+    return events
+
+
+# =============================================================================
+# FTP Parser
+# =============================================================================
+
+FTP_PREDICATE = '(process == "ftpd")'
+
+
+def parse_ftp_entry(entry: Dict[str, Any]) -> Optional[Event]:
+    """Turn a single ftpd log entry into an event."""
+    message = entry.get("eventMessage", "")
+
+    if not message:
+        return None
+
+    title = "FTP Access"
+    body = message[:80] + "..." if len(message) > 80 else message
+    fields = entry_rule_fields(entry)
+    rule = get_rules().match("ftp", fields)
+    if rule is None:
+        return None
+    return apply_rule(rule, fields, Event("notify", title, body, source=extract_event_source(message), process="ftpd"))
+
+
+def parse_ftp_events(state: Dict[str, Any]) -> List[Event]:
+    """Parse FTP events from unified log."""
+    events = []
+
+    # Query for ftpd events
+    entries = read_log_entries(state, "ftp", FTP_PREDICATE)
+
+    for entry in entries:
+        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
+        if event_id in state["seen_events"]:
+            continue
+
+        event = parse_ftp_entry(entry)
+        if event:
+            events.append(event)
+            state["seen_events"].append(event_id)
+
+    return events
+
+
+# =============================================================================
+# Novelty Baseline
+# =============================================================================
+#
+# Connection and listener alerts are keyed by PID and ephemeral port, which
+# change all the time, so routine traffic (a Postgres client reconnecting,
+# a dev server restarting) would keep re-alerting. Instead each flow is
+# reduced to a (process, remote /24 or /48 prefix, port) combination and
+# counted in a count-min sketch: a fixed BASELINE_DEPTH x BASELINE_WIDTH
+# table of 16-bit counters (256KB), saved to baseline.bin. Only combinations
+# seen fewer than NOVELTY_THRESHOLD times alert, unless a user rule matches. Counters are halved every
+# BASELINE_HALF_LIFE_DAYS so what stopped happening eventually becomes novel
+# again. The sketch can overestimate (a rare flow colliding with busy ones)
+# but never underestimates, and its size doesn't depend on how many flows
+# have been seen.
+
+BASELINE_FILE = STATE_DIR / "baseline.bin"
+BASELINE_DEPTH = 4
+BASELINE_WIDTH = 1 << 15
+BASELINE_HALF_LIFE_DAYS = float(os.environ.get("BASELINE_HALF_LIFE_DAYS", "7"))
+NOVELTY_THRESHOLD = int(os.environ.get("NOVELTY_THRESHOLD", "2"))
+_BASELINE_MAGIC = b"SGCM1"
+
+
+class NoveltySketch:
+    """Count-min sketch with conservative updates and periodic halving."""
+
+    def __init__(self, depth: int = BASELINE_DEPTH, width: int = BASELINE_WIDTH):
+        from array import array
+
+        self.depth = depth
+        self.width = width
+        self.counts = array("H", bytes(2 * depth * width))
+        self.decayed_at = time.time()
+        self.observed = 0
+        self.dirty = False
+
+    def _cells(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return [
+            row * self.width + int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def estimate(self, key: str) -> int:
+        """How often `key` has been seen (never less than the truth)."""
+        return min(self.counts[cell] for cell in self._cells(key))
+
+    def observe(self, key: str) -> int:
+        """Count one sighting of `key`; returns the estimate from before it."""
+        cells = self._cells(key)
+        current = min(self.counts[cell] for cell in cells)
+        # Conservative update: only raise the counters that are at the minimum
+        if current < 0xFFFF:
+            for cell in cells:
+                if self.counts[cell] == current:
+                    self.counts[cell] = current + 1
+        self.observed += 1
+        self.dirty = True
+        return current
+
+    def decay(self, now: Optional[float] = None) -> None:
+        """Halve every counter once per elapsed half-life."""
+        from array import array
+
+        now = time.time() if now is None else now
+        half_life = BASELINE_HALF_LIFE_DAYS * 86400
+        halvings = int((now - self.decayed_at) // half_life) if half_life > 0 else 0
+        if halvings <= 0:
+            return
+        shift = min(halvings, 16)
+        self.counts = array("H", (count >> shift for count in self.counts))
+        self.decayed_at += halvings * half_life
+        self.dirty = True
+
+    def to_bytes(self) -> bytes:
+        import struct
+
+        header = _BASELINE_MAGIC + struct.pack("<IIdQ", self.depth, self.width, self.decayed_at, self.observed)
+        return header + self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "NoveltySketch":
+        from array import array
+        import struct
+
+        if not data.startswith(_BASELINE_MAGIC):
+            raise ValueError("not a baseline file")
+        offset = len(_BASELINE_MAGIC)
+        depth, width, decayed_at, observed = struct.unpack_from("<IIdQ", data, offset)
+        counts = data[offset + struct.calcsize("<IIdQ"):]
+        if len(counts) != 2 * depth * width:
+            raise ValueError("truncated baseline file")
+        sketch = cls.__new__(cls)
+        sketch.depth, sketch.width, sketch.counts = depth, width, array("H", counts)
+        sketch.decayed_at, sketch.observed, sketch.dirty = decayed_at, observed, False
+        return sketch
+
+
+_baseline: Optional[NoveltySketch] = None
+
+
+def get_baseline() -> NoveltySketch:
+    """The novelty sketch, loaded once per process (a fresh one if missing or unreadable)."""
+    global _baseline
+    if _baseline is None:
+        try:
+            _baseline = NoveltySketch.from_bytes(BASELINE_FILE.read_bytes())
+        except (OSError, ValueError):
+            _baseline = NoveltySketch()
+        _baseline.decay()
+    return _baseline
+
+
+def save_baseline() -> None:
+    """Write the sketch back if it changed (atomically, it's read every tick)."""
+    if _baseline is None or not _baseline.dirty:
+        return
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    write_atomic(BASELINE_FILE, _baseline.to_bytes())
+    _baseline.dirty = False
+
+
+def remote_prefix(host: str) -> str:
+    """Group a remote address by network: /24 for IPv4, /48 for IPv6."""
+    if not host:
+        return ""
+    if ":" in host:
+        return ":".join(host.split(":")[:3]) + "::/48"
+    parts = host.split(".")
+    return ".".join(parts[:3]) + ".0/24" if len(parts) == 4 else host
+
+
+def baseline_key(process: str, remote: str, port: Any) -> str:
+    return f"{process}|{remote_prefix(remote)}|{port}"
+
+
+# =============================================================================
+# GeoIP Enrichment
+# =============================================================================
+#
+# With a MaxMind-format database on disk (GeoLite2-Country/-City and/or
+# GeoLite2-ASN, or any compatible .mmdb), events from remote addresses get
+# the country and autonomous system added: "from 203.0.113.7 via Password
+# [NL, AS1136 KPN]". Nothing is downloaded; without a database this is a
+# no-op. The file is mmap'd rather than read, so only the pages a lookup
+# touches are loaded, and a lookup is a walk of at most 128 tree nodes plus
+# decoding one small record. Answers are kept in a GEOIP_CACHE_SIZE LRU
+# since the same few addresses tend to repeat.
+
+GEOIP_COUNTRY_DB = os.environ.get("GEOIP_COUNTRY_DB", str(STATE_DIR / "GeoLite2-Country.mmdb"))
+GEOIP_ASN_DB = os.environ.get("GEOIP_ASN_DB", str(STATE_DIR / "GeoLite2-ASN.mmdb"))
+GEOIP_CACHE_SIZE = 4096
+# Monitors whose events carry a remote address in event.source
+GEOIP_MONITORS = {"ssh", "portscan", "ports", "vnc"}
+_MMDB_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+
+
+class MMDBReader:
+    """Minimal reader for MaxMind DB files (format version 2), over mmap."""
+
+    def __init__(self, path: str):
+        import mmap
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        marker = self._mmap.rfind(_MMDB_METADATA_MARKER, max(0, len(self._mmap) - 128 * 1024))
+        if marker < 0:
+            raise ValueError(f"{path}: not a MaxMind DB file")
+        # Metadata is decoded relative to its own start; the data section's offset isn't known yet
+        self._data_start = marker + len(_MMDB_METADATA_MARKER)
+        self.metadata, _ = self._decode(0)
+        self.node_count = self.metadata["node_count"]
+        self.record_size = self.metadata["record_size"]
+        self.ip_version = self.metadata["ip_version"]
+        if self.record_size not in (24, 28, 32):
+            raise ValueError(f"{path}: unsupported record size {self.record_size}")
+        self._node_bytes = self.record_size // 4
+        self._data_start = self.node_count * self._node_bytes + 16
+        # IPv4 addresses live under ::/96 in IPv6 trees
+        self._ipv4_start = 0
+        if self.ip_version == 6:
+            node = 0
+            for _ in range(96):
+                if node >= self.node_count:
+                    break
+                node = self._record(node, 0)
+            self._ipv4_start = node
+        self.lookup = functools.lru_cache(maxsize=GEOIP_CACHE_SIZE)(self._lookup)
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def _record(self, node: int, bit: int) -> int:
+        offset = node * self._node_bytes
+        buf = self._mmap
+        if self.record_size == 24:
+            offset += 3 * bit
+            return int.from_bytes(buf[offset:offset + 3], "big")
+        if self.record_size == 28:
+            middle = buf[offset + 3]
+            if bit:
+                return ((middle & 0x0F) << 24) | int.from_bytes(buf[offset + 4:offset + 7], "big")
+            return ((middle & 0xF0) << 20) | int.from_bytes(buf[offset:offset + 3], "big")
+        offset += 4 * bit
+        return int.from_bytes(buf[offset:offset + 4], "big")
+
+    def _lookup(self, ip: str) -> Optional[Dict[str, Any]]:
+        """The record for `ip`, or None if the database has nothing for it."""
+        ip = ip.strip("[]")
+        try:
+            packed = socket.inet_pton(socket.AF_INET6 if ":" in ip else socket.AF_INET, ip)
+        except (OSError, ValueError):
+            return None
+        if len(packed) == 16 and self.ip_version == 4:
+            return None
+        node = self._ipv4_start if len(packed) == 4 else 0
+        value = int.from_bytes(packed, "big")
+        bits = 8 * len(packed)
+        node_count = self.node_count
+        buf = self._mmap
+        for i in range(bits):
+            if node >= node_count:
+                break
+            bit = (value >> (bits - 1 - i)) & 1
+            if self.record_size == 24:
+                # The common case, inlined: this loop runs up to 128 times per lookup
+                offset = node * 6 + 3 * bit
+                node = (buf[offset] << 16) | (buf[offset + 1] << 8) | buf[offset + 2]
+            else:
+                node = self._record(node, bit)
+        if node <= node_count:
+            return None
+        record, _ = self._decode(node - node_count - 16)
+        return record
+
+    def _decode(self, offset: int) -> Tuple[Any, int]:
+        """Decode the data field at `offset` (relative to the data section); returns (value, next offset)."""
+        buf = self._mmap
+        base = self._data_start
+        ctrl = buf[base + offset]
+        offset += 1
+        kind = ctrl >> 5
+        if kind == 1:
+            # Pointer: 11-35 bit offset into the data section
+            size = (ctrl >> 3) & 0x3
+            extra = int.from_bytes(buf[base + offset:base + offset + size + 1], "big")
+            if size == 0:
+                target = ((ctrl & 0x7) << 8) | extra
+            elif size == 1:
+                target = (((ctrl & 0x7) << 16) | extra) + 2048
+            elif size == 2:
+                target = (((ctrl & 0x7) << 24) | extra) + 526336
+            else:
+                target = extra
+            value, _ = self._decode(target)
+            return value, offset + size + 1
+        if kind == 0:
+            kind = 7 + buf[base + offset]
+            offset += 1
+        size = ctrl & 0x1F
+        if size >= 29:
+            extra = size - 28
+            size = (29, 285, 65821)[extra - 1] + int.from_bytes(buf[base + offset:base + offset + extra], "big")
+            offset += extra
+        start = base + offset
+        if kind == 2:
+            return buf[start:start + size].decode("utf-8", "replace"), offset + size
+        if kind == 7:
+            result = {}
+            for _ in range(size):
+                key, offset = self._decode(offset)
+                result[key], offset = self._decode(offset)
+            return result, offset
+        if kind == 11:
+            items = []
+            for _ in range(size):
+                item, offset = self._decode(offset)
+                items.append(item)
+            return items, offset
+        if kind in (5, 6, 9, 10):
+            return int.from_bytes(buf[start:start + size], "big"), offset + size
+        if kind == 8:
+            return int.from_bytes(buf[start:start + size], "big", signed=size == 4), offset + size
+        if kind == 14:
+            return bool(size), offset
+        if kind in (3, 15):
+            import struct
+
+            return struct.unpack(">d" if kind == 3 else ">f", buf[start:start + size])[0], offset + size
+        if kind == 4:
+            return bytes(buf[start:start + size]), offset + size
+        raise ValueError(f"{self.path}: unsupported data type {kind} at {offset}")
+
+
+# Open readers by path; reopened when the file is replaced (e.g. a monthly geoipupdate)
+_geoip_readers: Dict[str, Optional[MMDBReader]] = {}
+
+
+def get_geoip_reader(path: str) -> Optional[MMDBReader]:
+    """The reader for a database path, or None if it's missing or unreadable."""
+    if not path:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        _geoip_readers.pop(path, None)
+        return None
+    reader = _geoip_readers.get(path)
+    if path in _geoip_readers and (reader is None or reader.mtime == mtime):
+        return reader
+    try:
+        _geoip_readers[path] = MMDBReader(path)
+    except (OSError, ValueError, KeyError, IndexError) as e:
+        log_event("error", "GeoIP", f"Could not open {path}: {e}")
+        _geoip_readers[path] = None
+    return _geoip_readers[path]
+
+
+def geoip_lookup(ip: str) -> Dict[str, Any]:
+    """Country and AS for a remote address: {"country": "NL", "asn": 1136, "as_org": "KPN"}, whatever is known."""
+    info: Dict[str, Any] = {}
+    country_db = get_geoip_reader(GEOIP_COUNTRY_DB)
+    if country_db:
+        record = country_db.lookup(ip) or {}
+        country = record.get("country") or record.get("registered_country") or {}
+        if country.get("iso_code"):
+            info["country"] = country["iso_code"]
+    asn_db = get_geoip_reader(GEOIP_ASN_DB)
+    if asn_db:
+        record = asn_db.lookup(ip) or {}
+        if record.get("autonomous_system_number"):
+            info["asn"] = record["autonomous_system_number"]
+        if record.get("autonomous_system_organization"):
+            info["as_org"] = record["autonomous_system_organization"]
+    return info
+
+
+def format_geoip(info: Dict[str, Any]) -> str:
+    """Short label for a lookup result, e.g. "NL, AS1136 KPN"."""
+    parts = []
+    if info.get("country"):
+        parts.append(info["country"])
+    if info.get("asn"):
+        parts.append(" ".join(filter(None, [f"AS{info['asn']}", info.get("as_org", "")])))
+    return ", ".join(parts)
+
+
+def enrich_event(event: Event) -> None:
+    """Add country/AS fields (and a short label in the body) to an event from a remote address."""
+    if not event.source:
+        return
+    info = geoip_lookup(event.source)
+    if not info:
+        return
+    event.fields = {**(event.fields or {}), **info}
+    event.body = f"{event.body} [{format_geoip(info)}]"
+
+
+# =============================================================================
+# Allow and Deny Lists
+# =============================================================================
+#
+# ALLOWLIST and DENYLIST are comma-separated IPs, CIDRs (IPv4 or IPv6) and/or
+# files of them: one per line, "#" or ";" comments, so threat-intel feeds
+# like Spamhaus DROP or FireHOL netsets can be used as they are. Notifications
+# from an allowed address (known peers: VPN ranges, database hosts) are
+# dropped; alerts never are, so allowlisting e.g. the gateway can't hide an
+# ARP spoof or a login. Events from a denied address become alerts, even for
+# connections the novelty baseline considers routine. Deny wins if an
+# address is on both.
+#
+# Each list is kept as sorted, merged address ranges in flat int arrays and
+# searched with bisect, the same way as the port ranges: 100k+ prefixes take
+# a few MB and a lookup is one binary search (see `bench ip-lists`). Files
+# are re-read only when one of them changes.
+
+ALLOWLIST = os.environ.get("ALLOWLIST", str(STATE_DIR / "allowlist.txt"))
+DENYLIST = os.environ.get("DENYLIST", str(STATE_DIR / "denylist.txt"))
+# Monitors whose events carry a remote address in event.source
+IP_LIST_MONITORS = {"ssh", "portscan", "ports", "vnc", "arp"}
+
+
+def parse_cidr(text: str) -> Optional[Tuple[int, int, int]]:
+    """"10.0.0.0/8" or "2001:db8::1" -> (version, first address, last address) as ints."""
+    address, _, bits = text.strip("[]").partition("/")
+    try:
+        if ":" in address:
+            version, width = 6, 128
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        else:
+            version, width = 4, 32
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+        prefix = int(bits) if bits else width
+    except (OSError, ValueError):
+        return None
+    if not 0 <= prefix <= width:
+        return None
+    host_mask = (1 << (width - prefix)) - 1
+    return version, value & ~host_mask, value | host_mask
+
+
+class IPRangeSet:
+    """
+    Addresses and CIDRs as disjoint ranges, each labelled with where it came
+    from. Where ranges from different sources overlap, an address gets the
+    label of the most specific range containing it.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str]] = ()):
+        from array import array
+
+        ranges: Dict[int, List[Tuple[int, int, str]]] = {4: [], 6: []}
+        for cidr, label in entries:
+            parsed = parse_cidr(cidr)
+            if parsed:
+                version, low, high = parsed
+                ranges[version].append((low, high, label))
+        self.count = len(ranges[4]) + len(ranges[6])
+        # IPv4 fits in unsigned 32-bit arrays; IPv6 stays as Python ints
+        self._starts: Dict[int, Any] = {4: array("I"), 6: []}
+        self._ends: Dict[int, Any] = {4: array("I"), 6: []}
+        self._labels: Dict[int, List[str]] = {4: [], 6: []}
+        for version, items in ranges.items():
+            starts, ends, labels = self._starts[version], self._ends[version], self._labels[version]
+
+            def emit(low: int, high: int, label: str) -> None:
+                # Adjacent or overlapping pieces with the same label become one range
+                if low > high:
+                    return
+                if ends and labels[-1] == label and low <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], high)
+                else:
+                    starts.append(low)
+                    ends.append(high)
+                    labels.append(label)
+
+            # CIDRs are either disjoint or nested, so a stack of the enclosing
+            # ranges (widest at the bottom) splits them into disjoint pieces
+            # labelled by the innermost one
+            enclosing: List[Tuple[int, str]] = []
+            position = 0
+            for low, high, label in sorted(items, key=lambda item: (item[0], -item[1])):
+                while enclosing and enclosing[-1][0] < low:
+                    end, outer = enclosing.pop()
+                    emit(position, end, outer)
+                    position = max(position, end + 1)
+                if enclosing:
+                    emit(position, low - 1, enclosing[-1][1])
+                enclosing.append((high, label))
+                position = low
+            while enclosing:
+                end, outer = enclosing.pop()
+                emit(position, end, outer)
+                position = max(position, end + 1)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def find(self, address: str) -> Optional[str]:
+        """Label of the range containing `address`, or None."""
+        if not address or not self.count:
+            return None
+        parsed = parse_cidr(address)
+        if not parsed:
+            return None
+        version, value, _ = parsed
+        starts = self._starts[version]
+        i = bisect.bisect_right(starts, value) - 1
+        if i >= 0 and value <= self._ends[version][i]:
+            return self._labels[version][i]
+        return None
+
+
+def ip_list_files(spec: str) -> List[str]:
+    """The file paths named in an ALLOWLIST/DENYLIST setting (the rest are addresses)."""
+    return [item for item in (part.strip() for part in spec.split(",")) if item and not parse_cidr(item)]
+
+
+def read_ip_list(spec: str, name: str) -> List[Tuple[str, str]]:
+    """(entry, label) pairs for an ALLOWLIST/DENYLIST setting; entries from files are labelled with the file name."""
+    entries = [(item, name) for item in (part.strip() for part in spec.split(",")) if item and parse_cidr(item)]
+    for path in ip_list_files(spec):
+        label = Path(path).stem
+        try:
+            with open(path, "r", errors="replace") as f:
+                for line in f:
+                    line = line.split("#", 1)[0].split(";", 1)[0].strip()
+                    if line:
+                        entries.append((line.split()[0], label))
+        except OSError:
+            # Missing files (like the defaults) are simply empty lists
+            pass
+    return entries
+
+
+_ip_lists_cache: Dict[str, Any] = {"mtimes": None, "lists": None, "checked": 0.0}
+
+
+def get_ip_lists() -> Tuple[IPRangeSet, IPRangeSet]:
+    """The (allow, deny) sets, rebuilt only when a list file changes (checked at most once a second)."""
+    now = time.monotonic()
+    if _ip_lists_cache["lists"] is not None and now - _ip_lists_cache["checked"] < 1:
+        return _ip_lists_cache["lists"]
+    _ip_lists_cache["checked"] = now
+
+    mtimes = {}
+    for path in ip_list_files(ALLOWLIST) + ip_list_files(DENYLIST):
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            mtimes[path] = 0
+
+    if _ip_lists_cache["lists"] is None or _ip_lists_cache["mtimes"] != mtimes:
+        lists = (IPRangeSet(read_ip_list(ALLOWLIST, "ALLOWLIST")), IPRangeSet(read_ip_list(DENYLIST, "DENYLIST")))
+        _ip_lists_cache.update(mtimes=mtimes, lists=lists)
+    return _ip_lists_cache["lists"]
+
+
+def denylisted(address: str) -> Optional[str]:
+    """Which deny list (file name or "DENYLIST") has `address`, if any."""
+    return get_ip_lists()[1].find(address)
+
+
+def apply_ip_lists(events: List[Event]) -> List[Event]:
+    """Drop notifications from allowed addresses and escalate events from denied addresses."""
+    allow, deny = get_ip_lists()
+    if not allow and not deny:
+        return events
+    kept = []
+    for event in events:
+        addresses = [event.source] if event.source else []
+        addresses += [address for address in (event.fields or {}).get("sources", ()) if address != event.source]
+        if not addresses:
+            kept.append(event)
+            continue
+        listed = next(filter(None, (deny.find(address) for address in addresses)), None)
+        if listed:
+            event.severity = sys.intern("alert")
+            event.body = f"{event.body} (on {listed})"
+            event.fields = {**(event.fields or {}), "denylist": listed}
+        elif event.severity != "alert" and all(allow.find(address) for address in addresses):
+            continue
+        kept.append(event)
+    return kept
+
+
+# =============================================================================
+# Network Connection Monitor
+# =============================================================================
+
+def get_port_connections(port: int) -> Optional[List[Dict[str, str]]]:
+    """Get current connections on a specific port from the shared socket table (None if unavailable)."""
+    sockets = get_socket_table()
+    if sockets is None:
+        return None
+
+    connections = []
+    for sock in sockets:
+        if sock["process"] == "launchd":
+            continue
+
+        local_port = split_host_port(sock["local"])[1]
+        remote_port = split_host_port(sock["remote"])[1] if sock["remote"] else ""
+        if str(port) not in (local_port, remote_port):
+            continue
+
+        conn = dict(sock)
+        conn["port"] = port
+        # If our side owns the monitored port, the remote connected to us
+        conn["direction"] = "incoming" if local_port == str(port) else "outgoing"
+        connections.append(conn)
+
+    return connections
+
+
+# Connections shorter than this close silently instead of raising a "closed" event
+CONNECTION_CLOSE_MIN_MINUTES = float(os.environ.get("CONNECTION_CLOSE_MIN_MINUTES", "1"))
+
+# Fields of a tracked flow, stored as a compact list in state["connections"]
+FLOW_FIRST_SEEN, FLOW_LAST_SEEN, FLOW_DIRECTION, FLOW_PROCESS, FLOW_PID, FLOW_USER, FLOW_REMOTE = range(7)
+
+
+def track_port_connections(
+    state: Dict[str, Any],
+    scope: str,
+    port: int,
+) -> Tuple[List[Dict[str, str]], List[List[Any]]]:
+    """
+    Update the connection-tracking table for one port.
+
+    state["connections"][scope][port] maps a flow key ("proto|local|remote|pid")
+    to [first_seen, last_seen, direction, process, pid, user, remote]; every
+    update is a dict lookup, so cost is constant per flow.
+
+    Returns (connections that are new since last tick, closed flow records).
+    """
+    connections = get_port_connections(port)
+    if connections is None:
+        # lsof failed this tick: don't mistake that for every flow closing
+        return [], []
+
+    table = state.setdefault("connections", {}).setdefault(scope, {})
+    flows = table.setdefault(str(port), {})
+    now = int(time.time())
+
+    opened = []
+    current = set()
+    for conn in connections:
+        key = f"{conn['proto']}|{conn['local']}|{conn['remote']}|{conn['pid']}"
+        current.add(key)
+        record = flows.get(key)
+        if record is None:
+            record = [now, now, conn["direction"], conn["process"], conn["pid"], conn["user"], conn["remote"]]
+            flows[key] = record
+            opened.append(conn)
+        else:
+            record[FLOW_LAST_SEEN] = now
+
+    closed = [flows.pop(key) for key in [key for key in flows if key not in current]]
+    if not flows:
+        del table[str(port)]
+
+    return opened, closed
+
+
+def describe_closed_flow(record: List[Any], port: int) -> Optional[str]:
+    """Body for a "connection closed" event, or None if the flow was too short to report."""
+    minutes = (record[FLOW_LAST_SEEN] - record[FLOW_FIRST_SEEN]) / 60
+    if minutes < CONNECTION_CLOSE_MIN_MINUTES:
+        return None
+
+    if record[FLOW_REMOTE] and record[FLOW_DIRECTION] == "outgoing":
+        flow = f"{record[FLOW_PROCESS]}@localhost -> {record[FLOW_REMOTE]}"
+    elif record[FLOW_REMOTE]:
+        flow = f"{record[FLOW_REMOTE]} -> {record[FLOW_PROCESS]}@localhost:{port}"
+    else:
+        flow = f"{record[FLOW_USER]} {record[FLOW_PROCESS]} (PID {record[FLOW_PID]})"
+    return f"{flow} closed after {minutes:.0f} min"
+
+
+def connection_rule_fields(conn: Dict[str, str], port: int) -> Dict[str, Any]:
+    """Rule fields for a tracked connection."""
+    return {
+        "process": conn["process"],
+        "user": conn["user"],
+        "pid": conn["pid"],
+        "port": port,
+        "remote": split_host_port(conn["remote"])[0] if conn.get("remote") else "",
+        "direction": conn["direction"],
+        "message": "",
+    }
+
+
+def closed_flow_rule_fields(record: List[Any], port: int) -> Dict[str, Any]:
+    """The same fields as connection_rule_fields, for a flow record that closed."""
+    return {
+        "process": record[FLOW_PROCESS],
+        "user": record[FLOW_USER],
+        "pid": record[FLOW_PID],
+        "port": port,
+        "remote": split_host_port(record[FLOW_REMOTE])[0] if record[FLOW_REMOTE] else "",
+        "direction": record[FLOW_DIRECTION],
+        "message": "",
+    }
+
+
+def connection_event(severity: str, title: str, body: str, fields: Dict[str, Any]) -> Event:
+    """Event for a connection, from its rule fields."""
+    return Event(
+        severity, title, body, source=fields["remote"], user=fields["user"], process=fields["process"],
+        fields={"port": fields["port"], "pid": fields["pid"], "direction": fields["direction"]},
+    )
+
+
+def closed_flow_event(rule: Optional[Dict[str, Any]], title: str, body: str, fields: Dict[str, Any]) -> Optional[Event]:
+    """Event for a closed flow, shaped by the rule that matches it the way it shapes opens."""
+    event = apply_rule(rule, fields, connection_event("notify", f"{title} CLOSED", body, fields))
+    if event and not event.title.endswith(" CLOSED"):
+        # A retitling rule describes the connection; keep its close marked as one
+        event.title += " CLOSED"
+    return event
+
+
+def describe_new_connection(conn: Dict[str, str], port: int) -> str:
+    """Body for a new connection event."""
+    # Determine connection direction from which side owns the monitored port
+    if conn.get("remote"):
+        if conn["direction"] == "outgoing":
+            # Outgoing: we initiated the connection
+            body = f"{conn['process']}@localhost -> {conn['remote']}"
+        else:
+            # Incoming: remote connected to us
+            body = f"{conn['remote']} -> {conn['process']}@localhost:{port}"
+    else:
+        # No remote info, just show the process
+        body = f"{conn['user']} {conn['process']} (PID {conn['pid']})"
+
+    return body + describe_spawned_by(conn["pid"])
+
+
+def parse_port_events(state: Dict[str, Any]) -> List[Event]:
+    """Monitor network connections on configured ports."""
+    if not MONITOR_PORTS:
+        return []
+
+    events = []
+    baseline = get_baseline()
+    # Replaced by the connection-tracking table
+    state.pop("known_connections", None)
+
+    for port in PORTS_TO_MONITOR:
+        port_name = PORT_NAMES.get(port, str(port))
+        opened, closed = track_port_connections(state, "ports", port)
+
+        for conn in opened:
+            title = f"PORT {port} ({port_name})"
+            fields = connection_rule_fields(conn, port)
+            # Routine combinations (seen NOVELTY_THRESHOLD+ times) are only counted,
+            # unless a rule explicitly covers them
+            seen = baseline.observe(baseline_key(fields["process"], fields["remote"], port))
+            rule = get_rules().match("ports", fields)
+            if rule is None and seen >= NOVELTY_THRESHOLD and not denylisted(fields["remote"]):
+                continue
+            event = connection_event("notify", title, describe_new_connection(conn, port), fields)
+            event = apply_rule(rule, fields, event)
+            if event:
+                event.fields["seen"] = seen
+                events.append(event)
+
+        for record in closed:
+            body = describe_closed_flow(record, port)
+            if not body:
+                continue
+            fields = closed_flow_rule_fields(record, port)
+            # Closes of routine combinations are as uninteresting as their opens
+            seen = baseline.estimate(baseline_key(fields["process"], fields["remote"], port))
+            rule = get_rules().match("ports", fields)
+            if rule is None and seen >= NOVELTY_THRESHOLD and not denylisted(fields["remote"]):
+                continue
+            event = closed_flow_event(rule, f"PORT {port} ({port_name})", body, fields)
+            if event:
+                events.append(event)
+
+    return events
+
+
+def parse_vnc_events(state: Dict[str, Any]) -> List[Event]:
+    """Monitor VNC connections specifically (elevated to alert level)."""
+    if not MONITOR_VNC:
+        return []
+
+    events = []
+    port = 5900
+    opened, closed = track_port_connections(state, "vnc", port)
+
+    # VNC connections are alerts, not just notifications
+    for conn in opened:
+        fields = connection_rule_fields(conn, port)
+        event = connection_event("alert", "VNC CONNECTION", describe_new_connection(conn, port), fields)
+        event = apply_rule(get_rules().match("vnc", fields), fields, event)
+        if event:
+            events.append(event)
+
+    for record in closed:
+        body = describe_closed_flow(record, port)
+        if not body:
+            continue
+        fields = closed_flow_rule_fields(record, port)
+        event = closed_flow_event(get_rules().match("vnc", fields), "VNC CONNECTION", body, fields)
+        if event:
+            events.append(event)
+
+    return events
+
+
+# =============================================================================
+# New Listening Ports Monitor
+# =============================================================================
+
+def parse_port_ranges(spec: str) -> List[Tuple[int, int]]:
+    """Parse "22-1024,8080" into sorted, merged inclusive (low, high) ranges."""
+    ranges = []
+    for part in spec.split(","):
+        low, _, high = part.strip().partition("-")
+        if low.isdigit() and (not high or high.isdigit()):
+            ranges.append((int(low), int(high or low)))
+
+    merged: List[Tuple[int, int]] = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def port_in_ranges(port: int, ranges: List[Tuple[int, int]], starts: List[int]) -> bool:
+    """Binary-search merged ranges (starts is [low for low, _ in ranges])."""
+    i = bisect.bisect_right(starts, port) - 1
+    return i >= 0 and port <= ranges[i][1]
+
+
+LISTENING_RANGES = parse_port_ranges(LISTENING_PORT_RANGES)
+LISTENING_RANGE_STARTS = [low for low, _ in LISTENING_RANGES]
+LISTENING_IGNORE_RANGES = parse_port_ranges(LISTENING_IGNORE)
+LISTENING_IGNORE_STARTS = [low for low, _ in LISTENING_IGNORE_RANGES]
+LISTENING_IGNORE_PROCESSES = {
+    part.strip() for part in LISTENING_IGNORE.split(",")
+    if part.strip() and not part.strip().replace("-", "").isdigit()
+}
+
+
+def get_listening_ports() -> Optional[Dict[str, Dict[str, str]]]:
+    """
+    Get the listening-socket inventory from the shared socket table.
+
+    Keyed by "proto|address|port|pid:start", so IPv4 and IPv6 listeners and
+    several processes sharing a port are all kept. None if lsof failed.
+    """
+    sockets = get_socket_table()
+    if sockets is None:
+        return None
+
+    snapshot = None
+    listening = {}
+    for sock in sockets:
+        if sock["state"] != "LISTEN" or sock["process"] in LISTENING_IGNORE_PROCESSES:
+            continue
+
+        # Extract port from name (e.g., "*:8080", "127.0.0.1:3000" or "[::1]:3000")
+        address, port_str = split_host_port(sock["local"])
+        try:
+            port = int(port_str)
+        except ValueError:
+            continue
+
+        if not port_in_ranges(port, LISTENING_RANGES, LISTENING_RANGE_STARTS):
+            continue
+        if port_in_ranges(port, LISTENING_IGNORE_RANGES, LISTENING_IGNORE_STARTS):
+            continue
+
+        snapshot = snapshot or get_process_snapshot()
+        identity = snapshot.identity(sock["pid"]) or sock["pid"]
+        proto = f"{sock['proto'].lower()}{sock['family'][-1]}"  # tcp4 / tcp6
+        key = f"{proto}|{address}|{port}|{identity}"
+        listening[key] = {
+            "process": sock["process"],
+            "pid": sock["pid"],
+            "user": sock["user"],
+            "address": sock["local"],
+            "port": port,
+            "proto": proto,
+        }
+
+    return listening
+
+
+def parse_listening_port_events(state: Dict[str, Any]) -> List[Event]:
+    """
+    Monitor for new listening sockets.
+
+    state["listening"] maps inventory keys to [first_seen, process, user, pid];
+    state["listening_missing"] holds keys that vanished and when. Only the set
+    difference against the last tick is processed, and a socket has to stay
+    gone for LISTENING_GRACE_SECONDS before it is forgotten, so a service that
+    briefly drops its socket (or restarts under a new PID) doesn't re-alert.
+    """
+    if not MONITOR_LISTENING:
+        return []
+
+    events = []
+    current = get_listening_ports()
+    if current is None:
+        return events
+
+    # Replaced by the keyed inventory
+    state.pop("known_listening_ports", None)
+    known = state.setdefault("listening", {})
+    missing = state.setdefault("listening_missing", {})
+    now = int(time.time())
+
+    added = current.keys() - known.keys()
+    removed = known.keys() - current.keys()
+
+    # Sockets that came back within the grace period
+    for key in current.keys() & missing.keys():
+        del missing[key]
+
+    if added:
+        # "proto|address|port|process" of everything known, to spot restarts
+        known_services = {key.rsplit("|", 1)[0] + "|" + record[1] for key, record in known.items()}
+
+    for key in added:
+        info = current[key]
+        known[key] = [now, info["process"], info["user"], info["pid"]]
+        if key.rsplit("|", 1)[0] + "|" + info["process"] in known_services:
+            continue  # same service listening again under a new PID
+
+        fields = {"process": info["process"], "user": info["user"], "pid": info["pid"], "port": info["port"], "address": info["address"], "message": ""}
+        seen = get_baseline().observe(baseline_key(info["process"], "", f"listen:{info['port']}"))
+        rule = get_rules().match("listening", fields)
+        if rule is None and seen >= NOVELTY_THRESHOLD:
+            continue  # this process routinely listens here (and no rule says otherwise)
+
+        title = f"NEW LISTENING PORT: {info['port']}"
+        body = f"{info['user']} {info['process']} (PID {info['pid']}) on {info['address']}"
+        if info["proto"].endswith("6"):
+            body += " (IPv6)"
+        body += describe_spawned_by(info["pid"])
+        event = Event(
+            "alert", title, body, user=info["user"], process=info["process"],
+            fields={"port": info["port"], "pid": info["pid"], "address": info["address"], "proto": info["proto"], "seen": seen},
+        )
+        event = apply_rule(rule, fields, event)
+        if event:
+            events.append(event)
+
+    for key in removed:
+        missing.setdefault(key, now)
+
+    # Forget sockets that have stayed gone past the grace period
+    for key in [key for key, since in missing.items() if now - since >= LISTENING_GRACE_SECONDS]:
+        del missing[key]
+        known.pop(key, None)
+
+    return events
+
+
+# =============================================================================
+# .env File Monitor (using find)
+# =============================================================================
+
+def find_recent_dotenv_files() -> List[str]:
+    """Find .env files modified in the last 2 minutes using find, excluding ~/Library."""
+    home = str(Path.home())
+
+    # Use find to locate .env files modified in last 2 minutes
+    # -mmin -2 means modified within last 2 minutes
+    # -name matches both .env and *.env files
+    # -not -path excludes ~/Library
+    # -type f ensures we only get files
+    cmd = [
+        "find", home, "-maxdepth", "6", "-type", "f",
+        "(", "-name", ".env", "-o", "-name", "*.env", ")",
+        "-mmin", "-2",
+        "-not", "-path", "*/Library/*",
+        "-not", "-path", "*/.git/*",
+        "-not", "-path", "*/node_modules/*",
+    ]
+
+    return probe_lines(cmd, timeout=15)
+
+
+def file_owner(path: str) -> Optional[str]:
+    """User name owning a file (None if it's gone or the UID has no name)."""
+    import pwd
+
+    try:
+        return pwd.getpwuid(os.stat(path).st_uid).pw_name
+    except (OSError, KeyError):
+        return None
+
+
+def parse_dotenv_events(state: Dict[str, Any]) -> List[Event]:
+    """Monitor for new .env files in home directory."""
+    if not MONITOR_DOTENV:
+        return []
+
+    events = []
+    known_dotenv = set(state.get("known_dotenv_files", []))
+    current_dotenv = find_recent_dotenv_files()
+
+    for filepath in current_dotenv:
+        if filepath not in known_dotenv:
+            # Get relative path from home
+            try:
+                rel_path = str(Path(filepath).relative_to(Path.home()))
+            except ValueError:
+                rel_path = filepath
+
+            title = "NEW .ENV FILE"
+            body = f"~/{rel_path}"
+            events.append(Event("alert", title, body, user=file_owner(filepath), fields={"path": filepath}))
+            known_dotenv.add(filepath)
+
+    state["known_dotenv_files"] = list(known_dotenv)
+    return events
+
+
+# =============================================================================
+# Dangerous Commands Monitor (npx, uvx, op) - uses shell history + ps polling
+# =============================================================================
+
+def get_shell_history_commands() -> List[Dict[str, str]]:
+    """
+    Read recent commands from shell history files.
+    Works with zsh, bash, and fish shells.
+    """
+    home = Path.home()
+    commands = []
+
+    # Shell history file locations and their formats
+    history_files = [
+        (home / ".zsh_history", "zsh"),
+        (home / ".bash_history", "bash"),
+        (home / ".local/share/fish/fish_history", "fish"),
+    ]
+
+    for hist_file, shell_type in history_files:
+        if not hist_file.exists():
+            continue
+
+        try:
+            # Read last 50 lines of history (recent commands)
+            with open(hist_file, "rb") as f:
+                # Seek to end and read backwards to get recent lines
+                try:
+                    f.seek(0, 2)  # End of file
+                    size = f.tell()
+                    # Read last 8KB or whole file if smaller
+                    read_size = min(8192, size)
+                    f.seek(max(0, size - read_size))
+                    content = f.read().decode("utf-8", errors="ignore")
+                except Exception:
+                    continue
+
+            lines = content.splitlines()[-50:]  # Last 50 commands
+
+            for line in lines:
                 # Parse based on shell type
                 cmd = ""
                 if shell_type == "zsh":
@@ -1020,65 +4090,43 @@ def get_shell_history_commands() -> List[Dict[str, str]]:
     return commands
 
 
-def get_running_dangerous_commands() -> List[Dict[str, str]]:
-    """Find running instances of dangerous commands using ps."""
-    cmd = "ps -eo pid,user,comm,args 2>/dev/null"
-
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-
-        processes = []
-        for line in result.stdout.strip().splitlines()[1:]:  # Skip header
-            parts = line.split(None, 3)
-            if len(parts) >= 3:
-                pid = parts[0]
-                user = parts[1]
-                comm = parts[2]
-                args = parts[3] if len(parts) > 3 else comm
-
-                comm_lower = comm.lower()
-                args_lower = args.lower()
+def get_running_dangerous_commands() -> Optional[List[Dict[str, str]]]:
+    """Find running instances of dangerous commands in the process snapshot (None if ps failed)."""
+    snapshot = get_process_snapshot()
+    if not snapshot.ok:
+        return None
 
-                for dangerous_cmd in DANGEROUS_COMMANDS:
-                    if comm_lower == dangerous_cmd or comm_lower.endswith(f"/{dangerous_cmd}"):
-                        processes.append({
-                            "pid": pid,
-                            "user": user,
-                            "command": dangerous_cmd,
-                            "full_cmd": args[:100],
-                            "source": "process",
-                        })
-                        break
-                    elif f"/{dangerous_cmd}" in args_lower or f" {dangerous_cmd} " in f" {args_lower} ":
-                        processes.append({
-                            "pid": pid,
-                            "user": user,
-                            "command": dangerous_cmd,
-                            "full_cmd": args[:100],
-                            "source": "process",
-                        })
-                        break
+    processes = []
+    for proc in snapshot:
+        comm_lower = proc["comm"].lower()
+        args_lower = proc["args"].lower()
 
-        return processes
+        for dangerous_cmd in DANGEROUS_COMMANDS:
+            if (comm_lower == dangerous_cmd or comm_lower.endswith(f"/{dangerous_cmd}")
+                    or f"/{dangerous_cmd}" in args_lower or f" {dangerous_cmd} " in f" {args_lower} "):
+                processes.append({
+                    "pid": proc["pid"],
+                    "identity": proc["identity"],
+                    "user": proc["user"],
+                    "command": dangerous_cmd,
+                    "full_cmd": proc["args"][:100],
+                    "source": "process",
+                })
+                break
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
+    return processes
 
 
-def parse_dangerous_command_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+def parse_dangerous_command_events(state: Dict[str, Any]) -> List[Event]:
     """Monitor for npx, uvx, op command execution using history + ps polling."""
     if not MONITOR_DANGEROUS_COMMANDS:
         return []
 
     events = []
     seen_commands = set(state.get("seen_dangerous_commands", []))
-    seen_pids = set(state.get("seen_dangerous_pids", []))
+    # Running processes are tracked by "pid:start" so a reused PID still alerts
+    seen_procs = set(state.get("seen_dangerous_procs", []))
+    state.pop("seen_dangerous_pids", None)
 
     # Check shell history for completed commands
     history_commands = get_shell_history_commands()
@@ -1093,69 +4141,117 @@ def parse_dangerous_command_events(state: Dict[str, Any]) -> List[Tuple[str, str
             if len(full_cmd) > 55:
                 full_cmd = full_cmd[:52] + "..."
             body = f"[{cmd_info['shell']}] {full_cmd}"
-            events.append(("alert", title, body))
+            events.append(Event("alert", title, body, process=cmd_info["command"], fields={"shell": cmd_info["shell"], "command": cmd_info["full_cmd"]}))
 
     # Check for currently running processes
     running_processes = get_running_dangerous_commands()
-    current_pids = set()
+    current_procs = set()
 
-    for proc in running_processes:
+    for proc in running_processes or []:
         pid = proc.get("pid", "")
-        current_pids.add(pid)
+        identity = proc["identity"]
+        current_procs.add(identity)
 
-        if pid and pid not in seen_pids:
-            seen_pids.add(pid)
+        if pid and identity not in seen_procs:
+            seen_procs.add(identity)
 
             title = f"COMMAND: {proc['command']}"
             full_cmd = proc["full_cmd"]
             if len(full_cmd) > 50:
                 full_cmd = full_cmd[:47] + "..."
             body = f"PID {pid} by {proc.get('user', '?')}: {full_cmd}"
-            events.append(("alert", title, body))
+            body += describe_spawned_by(pid)
+            events.append(Event(
+                "alert", title, body, user=proc.get("user"), process=proc["command"],
+                fields={"pid": pid, "command": proc["full_cmd"]},
+            ))
 
     # Keep only recent history entries (last 100) to prevent unbounded growth
     if len(seen_commands) > 100:
         # Convert to list, keep last 100, convert back to set
         seen_commands = set(list(seen_commands)[-100:])
 
-    # Clean up PIDs no longer running
-    seen_pids = seen_pids & current_pids
+    # Clean up processes no longer running (unless ps failed this tick: don't
+    # mistake that for every process exiting, or they all re-alert next tick)
+    if running_processes is not None:
+        seen_procs = seen_procs & current_procs
 
     state["seen_dangerous_commands"] = list(seen_commands)
-    state["seen_dangerous_pids"] = list(seen_pids)
+    state["seen_dangerous_procs"] = list(seen_procs)
 
     return events
 
 
 # =============================================================================
-# DNS Resolver Monitor
+# Linux Network Collectors (`ip -j`, /etc/resolv.conf)
 # =============================================================================
 
-def get_dns_resolvers() -> List[str]:
-    """Get current DNS resolver addresses using scutil."""
-    cmd = "scutil --dns 2>/dev/null | grep 'nameserver\\[' | awk '{print $3}' | sort -u"
+RESOLV_CONF = "/etc/resolv.conf"
+
+
+def ip_json(args: List[str]) -> List[Dict[str, Any]]:
+    """Run `ip -j <args>` and return its parsed JSON (memoized for the tick)."""
+    result = run_parsed_probe(["ip", "-j"] + args, json.loads, timeout=5)
+    return result if isinstance(result, list) else []
+
+
+def get_linux_addresses() -> Dict[str, Dict[str, str]]:
+    """Interface -> {"ip", "mac"} from `ip -j addr` (first IPv4 address per interface)."""
+    addresses = {}
+    for iface in ip_json(["addr"]):
+        name = iface.get("ifname", "")
+        if not name or name == "lo":
+            continue
+        info = {"mac": (iface.get("address") or "").lower()}
+        for addr in iface.get("addr_info", []):
+            if addr.get("family") == "inet":
+                info["ip"] = addr.get("local", "")
+                break
+        addresses[name] = info
+    return addresses
+
+
+def get_linux_neighbors() -> List[Dict[str, str]]:
+    """ARP/NDP neighbour table from `ip -j neigh` as [{"ip", "mac", "dev"}]."""
+    return [
+        {"ip": entry.get("dst", ""), "mac": entry["lladdr"].lower(), "dev": entry.get("dev", "")}
+        for entry in ip_json(["neigh"])
+        if entry.get("lladdr")
+    ]
 
+
+def get_linux_dns_resolvers() -> List[str]:
+    """Nameservers listed in /etc/resolv.conf."""
+    resolvers = set()
     try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+        with open(RESOLV_CONF) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver":
+                    resolvers.add(parts[1])
+    except OSError:
+        pass
+    return sorted(resolvers)
+
+
+# =============================================================================
+# DNS Resolver Monitor
+# =============================================================================
 
-        resolvers = [
-            line.strip()
-            for line in result.stdout.strip().splitlines()
-            if line.strip()
-        ]
-        return resolvers
+def get_dns_resolvers() -> List[str]:
+    """Get current DNS resolver addresses using scutil."""
+    if IS_LINUX:
+        return get_linux_dns_resolvers()
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
+    resolvers = set()
+    # Lines look like: "  nameserver[0] : 192.168.1.1"
+    for line in probe_lines(["scutil", "--dns"], timeout=5):
+        if line.startswith("nameserver[") and ":" in line:
+            resolvers.add(line.split(":", 1)[1].strip())
+    return sorted(resolvers)
 
 
-def parse_dns_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+def parse_dns_events(state: Dict[str, Any]) -> List[Event]:
     """Monitor for DNS resolver changes."""
     if not MONITOR_DNS:
         return []
@@ -1177,7 +4273,7 @@ def parse_dns_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
             if removed:
                 parts.append(f"removed: {', '.join(removed)}")
             body = "; ".join(parts)
-            events.append(("alert", title, body))
+            events.append(Event("alert", title, body, fields={"added": sorted(added), "removed": sorted(removed)}))
 
     # Always update to current (including first run)
     state["known_dns_resolvers"] = list(current_dns)
@@ -1198,36 +4294,28 @@ def get_public_ip() -> Optional[str]:
     ]
 
     for cmd in methods:
-        try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            ip = result.stdout.strip()
-            # Basic validation - should look like an IP
-            if ip and "." in ip and len(ip) <= 15:
-                return ip
-        except (subprocess.TimeoutExpired, subprocess.SubprocessError, FileNotFoundError):
-            continue
+        ip = (run_probe(cmd, timeout=5) or "").strip()
+        # Basic validation - should look like an IP
+        if ip and "." in ip and len(ip) <= 15:
+            return ip
 
     return None
 
 
-def parse_public_ip_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+def parse_public_ip_events(state: Dict[str, Any]) -> List[Event]:
     """Monitor for public IP address changes."""
     if not MONITOR_PUBLIC_IP:
         return []
 
     events = []
     known_ip = state.get("known_public_ip")
-    current_ip = get_public_ip()
+    # Looked up by the network worker; the tick never waits on the network
+    current_ip = get_network_results().get("public_ip", {}).get("value")
 
     if current_ip and known_ip and current_ip != known_ip:
         title = "PUBLIC IP CHANGED"
         body = f"{known_ip} → {current_ip}"
-        events.append(("alert", title, body))
+        events.append(Event("alert", title, body, fields={"old": known_ip, "new": current_ip}))
 
     if current_ip:
         state["known_public_ip"] = current_ip
@@ -1241,364 +4329,2002 @@ def parse_public_ip_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
 
 def get_local_ips() -> Dict[str, str]:
     """Get local IP addresses for all interfaces."""
+    if IS_LINUX:
+        return {iface: info["ip"] for iface, info in get_linux_addresses().items() if info.get("ip")}
+
     interfaces = ["en0", "en1", "en2", "en3", "en4", "utun0", "utun1", "utun2"]
     ips = {}
 
     for iface in interfaces:
-        try:
-            result = subprocess.run(
-                ["ipconfig", "getifaddr", iface],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            ip = result.stdout.strip()
-            if ip:
-                ips[iface] = ip
-        except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-            continue
+        ip = (run_probe(["ipconfig", "getifaddr", iface], timeout=2) or "").strip()
+        if ip:
+            ips[iface] = ip
 
     return ips
 
 
-def parse_local_ip_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+def parse_local_ip_events(state: Dict[str, Any]) -> List[Event]:
     """Monitor for local IP address changes."""
     if not MONITOR_LOCAL_IP:
         return []
 
-    events = []
-    known_ips = state.get("known_local_ips", {})
-    current_ips = get_local_ips()
+    events = []
+    known_ips = state.get("known_local_ips", {})
+    current_ips = get_local_ips()
+
+    # Check for changes
+    for iface, ip in current_ips.items():
+        old_ip = known_ips.get(iface)
+        if old_ip and old_ip != ip:
+            title = f"LOCAL IP CHANGED: {iface}"
+            body = f"{old_ip} → {ip}"
+            events.append(Event("notify", title, body, fields={"interface": iface, "old": old_ip, "new": ip}))
+
+    # Check for new interfaces
+    for iface, ip in current_ips.items():
+        if iface not in known_ips:
+            title = f"NEW INTERFACE: {iface}"
+            body = f"IP: {ip}"
+            events.append(Event("notify", title, body, fields={"interface": iface, "new": ip}))
+
+    # Check for removed interfaces
+    for iface in known_ips:
+        if iface not in current_ips:
+            title = f"INTERFACE DOWN: {iface}"
+            body = f"was {known_ips[iface]}"
+            events.append(Event("notify", title, body, fields={"interface": iface, "old": known_ips[iface]}))
+
+    state["known_local_ips"] = current_ips
+    return events
+
+
+# =============================================================================
+# Kandji/MDM Events Monitor
+# =============================================================================
+
+MDM_PROCESSES = ["Kandji", "kandji-daemon", "mdmclient", "profiles", "ManagedClient", "softwareupdated"]
+
+# Only the interesting messages (MDM_INTERESTING_KEYWORDS) are fetched, see rules_log_predicate
+MDM_PREDICATE = (
+    "process IN {" + ", ".join(f'"{name}"' for name in MDM_PROCESSES) + "} OR "
+    'subsystem == "com.apple.ManagedClient" OR '
+    'subsystem CONTAINS "kandji" OR '
+    'eventMessage CONTAINS "MDM" OR '
+    'eventMessage CONTAINS "Configuration Profile"'
+)
+
+# Filter for interesting events
+MDM_INTERESTING_KEYWORDS = [
+    "install", "remove", "profile", "command", "push", "enroll",
+    "policy", "restrict", "allow", "block", "update", "compliance"
+]
+
+
+def is_mdm_entry(entry: Dict[str, Any]) -> bool:
+    """Python-side equivalent of MDM_PREDICATE, for replaying saved logs."""
+    subsystem = entry.get("subsystem", "") or ""
+    message = entry.get("eventMessage", "") or ""
+    return (
+        entry.get("process") in MDM_PROCESSES
+        or subsystem == "com.apple.ManagedClient"
+        or "kandji" in subsystem
+        or "MDM" in message
+        or "Configuration Profile" in message
+    )
+
+
+def parse_mdm_entry(entry: Dict[str, Any]) -> Optional[Event]:
+    """Turn a single MDM log entry into an event, if it is interesting."""
+    process = entry.get("process", "MDM")
+    message = entry.get("eventMessage", "")
+
+    # Only alert on interesting MDM events (by default MDM_INTERESTING_KEYWORDS)
+    fields = entry_rule_fields(entry)
+    rule = get_rules().match("mdm", fields)
+    if rule is None:
+        return None
+
+    title = f"MDM: {process}"
+    body = message[:60] + "..." if len(message) > 60 else message
+    return apply_rule(rule, fields, Event("alert", title, body, process=process, fields={"subsystem": fields["subsystem"]}))
+
+
+def parse_mdm_events(state: Dict[str, Any]) -> List[Event]:
+    """Monitor for Kandji/MDM events."""
+    if not MONITOR_MDM:
+        return []
+
+    events = []
+
+    # Query for MDM-related processes
+    entries = read_log_entries(state, "mdm", MDM_PREDICATE)
+
+    for entry in entries:
+        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
+        if event_id in state["seen_events"]:
+            continue
+
+        event = parse_mdm_entry(entry)
+        if event:
+            events.append(event)
+            state["seen_events"].append(event_id)
+
+    return events
+
+
+# =============================================================================
+# ARP Spoofing Detection
+# =============================================================================
+
+def get_gateway_info() -> Optional[Dict[str, str]]:
+    """Get the default gateway IP and interface."""
+    if IS_LINUX:
+        for route in ip_json(["route", "show", "default"]):
+            if route.get("gateway") and route.get("dev"):
+                return {"gateway_ip": route["gateway"], "interface": route["dev"]}
+        return None
+
+    info = {}
+    # Lines look like: "    gateway: 192.168.1.1" / "  interface: en0"
+    for line in probe_lines(["route", "-n", "get", "default"], timeout=5):
+        key, _, value = line.partition(":")
+        if key in ("gateway", "interface") and value.strip():
+            info[key] = value.strip()
+
+    if "gateway" in info and "interface" in info:
+        return {
+            "gateway_ip": info["gateway"],
+            "interface": info["interface"]
+        }
+
+    return None
+
+
+def _arp_line_mac(line: str) -> Optional[str]:
+    """Extract the MAC from an arp line: "? (192.168.1.1) at aa:bb:cc:dd:ee:ff on en0 ..."."""
+    parts = line.split()
+    if len(parts) < 4:
+        return None
+    mac = parts[3].lower()
+    # Validate MAC address format (aa:bb:cc:dd:ee:ff)
+    if ":" in mac and len(mac) >= 14:
+        return mac
+    return None
+
+
+def get_mac_address(ip: str) -> Optional[str]:
+    """Get MAC address for a given IP from ARP table."""
+    if IS_LINUX:
+        macs = [entry["mac"] for entry in get_linux_neighbors() if entry["ip"] == ip]
+        return macs[-1] if macs else None
+
+    lines = [
+        line for line in probe_lines(["arp", "-n", ip], timeout=5)
+        if "no entry" not in line and "incomplete" not in line
+    ]
+    return _arp_line_mac(lines[-1]) if lines else None
+
+
+def get_own_ip_and_mac(interface: str = "en0") -> Optional[Dict[str, str]]:
+    """Get our own IP and MAC address for the given interface."""
+    if IS_LINUX:
+        info = get_linux_addresses().get(interface, {})
+        return dict(info) if info.get("ip") and info.get("mac") else None
+
+    info = {}
+
+    # Get IP address
+    ip = (run_probe(["ipconfig", "getifaddr", interface], timeout=2) or "").strip()
+    if ip:
+        info["ip"] = ip
+
+    # Get MAC address
+    for line in probe_lines(["ifconfig", interface], timeout=2):
+        if line.startswith("ether "):
+            info["mac"] = line.split()[1].lower()
+            break
+
+    return info if "ip" in info and "mac" in info else None
+
+
+def check_arp_table_for_duplicates(our_ip: str) -> List[str]:
+    """Check ARP table for multiple MAC addresses claiming our IP."""
+    if IS_LINUX:
+        return [entry["mac"] for entry in get_linux_neighbors() if entry["ip"] == our_ip]
+
+    macs = []
+    for line in probe_lines(["arp", "-a"], timeout=5):
+        if f"({our_ip})" in line:
+            mac = _arp_line_mac(line)
+            if mac:
+                macs.append(mac)
+
+    return macs
+
+
+def parse_arp_spoof_events(state: Dict[str, Any]) -> List[Event]:
+    """Monitor for ARP spoofing attacks."""
+    if not MONITOR_ARP_SPOOF:
+        return []
+
+    events = []
+
+    # Get gateway information
+    gateway_info = get_gateway_info()
+    if not gateway_info:
+        # Can't monitor without gateway info
+        return events
+
+    gateway_ip = gateway_info["gateway_ip"]
+    interface = gateway_info["interface"]
+
+    # Method 1: Check if gateway MAC has changed (gateway spoofing)
+    # Ping gateway to ensure fresh ARP entry
+    run_probe(["ping", "-c", "1", "-W", "1", gateway_ip], timeout=3)
+
+    current_gateway_mac = get_mac_address(gateway_ip)
+
+    if current_gateway_mac:
+        known_gateway_mac = state.get("known_gateway_mac")
+        known_gateway_ip = state.get("known_gateway_ip")
+
+        # Check if gateway MAC changed for the same IP
+        if known_gateway_mac and known_gateway_ip == gateway_ip:
+            if current_gateway_mac != known_gateway_mac:
+                title = "ARP SPOOF: Gateway MAC Changed"
+                body = f"Gateway {gateway_ip} MAC changed: {known_gateway_mac} → {current_gateway_mac}"
+                events.append(Event(
+                    "alert", title, body, source=gateway_ip,
+                    fields={"interface": interface, "old_mac": known_gateway_mac, "new_mac": current_gateway_mac},
+                ))
+
+        # Update known gateway
+        state["known_gateway_mac"] = current_gateway_mac
+        state["known_gateway_ip"] = gateway_ip
+
+    # Method 2: Check if our own IP is being claimed by another MAC (own IP spoofing)
+    own_info = get_own_ip_and_mac(interface)
+
+    if own_info:
+        our_ip = own_info["ip"]
+        our_mac = own_info["mac"]
+
+        # Check ARP table for duplicates of our IP
+        arp_macs = check_arp_table_for_duplicates(our_ip)
+
+        # Filter out our own MAC
+        foreign_macs = [mac for mac in arp_macs if mac != our_mac]
+
+        if foreign_macs:
+            # Someone else is claiming our IP!
+            for foreign_mac in foreign_macs:
+                # Create unique event ID
+                event_id = f"arp_spoof_own_ip_{our_ip}_{foreign_mac}"
+
+                if event_id not in state["seen_events"]:
+                    title = "ARP SPOOF: Own IP Claimed"
+                    body = f"MAC {foreign_mac} is claiming your IP {our_ip}"
+                    events.append(Event("alert", title, body, fields={"interface": interface, "ip": our_ip, "mac": foreign_mac}))
+                    state["seen_events"].append(event_id)
+
+    return events
+
+
+# =============================================================================
+# Offline Backfill (forensic sweeps over saved logs)
+# =============================================================================
+
+# Log-based monitors that can be replayed offline: name -> (predicate, entry parser)
+LOG_MONITORS = {
+    "ssh": (SSH_PREDICATE, parse_ssh_entry),
+    "sudo": (SUDO_PREDICATE, parse_sudo_entry),
+    "portscan": (PORTSCAN_PREDICATE, parse_portscan_entry),
+    "ftp": (FTP_PREDICATE, parse_ftp_entry),
+    "mdm": (MDM_PREDICATE, parse_mdm_entry),
+}
+
+
+def parse_duration(value: str) -> timedelta:
+    """Parse a short duration like "30d", "12h", "90m" or "45s"."""
+    units = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return timedelta(**{units[value[-1]]: float(value[:-1])})
+    return timedelta(minutes=float(value))
+
+
+def parse_log_timestamp(timestamp: str) -> Optional[datetime]:
+    """Parse a unified log timestamp (e.g. "2025-01-15 10:23:45.123456-0800")."""
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f%z", "%Y-%m-%d %H:%M:%S%z", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            parsed = datetime.strptime(timestamp, fmt)
+        except (ValueError, TypeError):
+            continue
+        # Naive timestamps are in local time
+        return parsed if parsed.tzinfo else parsed.astimezone()
+    return None
+
+
+def get_log_entry_monitor(entry: Dict[str, Any]) -> Optional[str]:
+    """Work out which log monitor an entry belongs to (Python side of the predicates)."""
+    process = entry.get("process", "")
+    if process == "sshd":
+        return "ssh"
+    if process == "sudo":
+        return "sudo"
+    if process == "kernel":
+        return "portscan"
+    if process == "ftpd":
+        return "ftp"
+    if is_mdm_entry(entry):
+        return "mdm"
+    return None
+
+
+def backfill_entries(entries: List[Dict[str, Any]], monitors: List[str]) -> List[Dict[str, Any]]:
+    """Run saved log entries through the monitor parsers, returning event records."""
+    records = []
+    for entry in entries:
+        monitor = get_log_entry_monitor(entry)
+        if monitor not in monitors:
+            continue
+
+        event = LOG_MONITORS[monitor][1](entry)
+        if not event:
+            continue
+
+        records.append({
+            "timestamp": entry.get("timestamp", ""),
+            "monitor": monitor,
+            "type": event.severity,
+            "title": event.title,
+            "body": event.body,
+            "source": event.source,
+            "user": event.user,
+            "event_id": str(entry.get("eventID", entry.get("traceID", ""))),
+            "process": entry.get("process", ""),
+            "message": entry.get("eventMessage", ""),
+        })
+    return records
+
+
+def _backfill_archive_chunk(archive: str, start: datetime, end: datetime, monitors: List[str]) -> List[Dict[str, Any]]:
+    """Process pool worker: read one time slice of a .logarchive and parse it."""
+    predicate = " OR ".join(f"({rules_log_predicate(name, LOG_MONITORS[name][0])})" for name in monitors)
+    levels = tuple({level for name in monitors for level in LOG_LEVELS.get(name, ())})
+    # A slice of a big archive can take a while to read, so allow a generous timeout
+    entries = get_log_entries(predicate, start=start, end=end, archive=archive, timeout=3600, levels=levels)
+    return backfill_entries(entries, monitors)
+
+
+def _backfill_json_chunk(entries: List[Dict[str, Any]], monitors: List[str]) -> List[Dict[str, Any]]:
+    """Process pool worker: parse one slice of saved `log show --style json` output."""
+    return backfill_entries(entries, monitors)
+
+
+def run_backfill(argv: List[str]) -> int:
+    """
+    Sweep saved logs through the monitor parsers and write events as JSONL.
+
+    Usage:
+        security-growler.30s.py backfill --archive system_logs.logarchive --since 30d
+        security-growler.30s.py backfill --json log_show.json --output events.jsonl
+    """
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(prog="security-growler backfill", description=run_backfill.__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--archive", help="path to a .logarchive export (read via `log show --archive`)")
+    source.add_argument("--json", help="path to saved `log show --style json` output")
+    parser.add_argument("--since", default="30d", help="how far back to sweep, e.g. 30d, 12h (default: 30d)")
+    parser.add_argument("--start", help="explicit start time (YYYY-MM-DD[ HH:MM:SS]), overrides --since")
+    parser.add_argument("--end", help="explicit end time (YYYY-MM-DD[ HH:MM:SS]), default: now")
+    parser.add_argument("--monitors", default=",".join(LOG_MONITORS), help="comma-separated monitors to replay")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="process pool size")
+    parser.add_argument("--chunk-hours", type=float, default=6, help="hours of archive per worker task")
+    parser.add_argument("--chunk-size", type=int, default=20000, help="saved JSON entries per worker task")
+    parser.add_argument("--output", "-o", default="-", help="JSONL file to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    monitors = [m.strip() for m in args.monitors.split(",") if m.strip() in LOG_MONITORS]
+    end = datetime.fromisoformat(args.end).astimezone() if args.end else datetime.now().astimezone()
+    start = datetime.fromisoformat(args.start).astimezone() if args.start else end - parse_duration(args.since)
+
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        if args.archive:
+            # Split the time range into slices, one `log show --archive` per slice
+            step = timedelta(hours=args.chunk_hours)
+            slices = []
+            slice_start = start
+            while slice_start < end:
+                slices.append((slice_start, min(slice_start + step, end)))
+                slice_start += step
+            futures = [pool.submit(_backfill_archive_chunk, args.archive, a, b, monitors) for a, b in slices]
+        else:
+            with open(args.json, "r", errors="replace") as f:
+                entries = parse_log_output(f.read())
+            in_range = []
+            for entry in entries:
+                ts = parse_log_timestamp(entry.get("timestamp", ""))
+                if ts is None or start <= ts <= end:
+                    in_range.append(entry)
+            futures = [
+                pool.submit(_backfill_json_chunk, in_range[i:i + args.chunk_size], monitors)
+                for i in range(0, len(in_range), args.chunk_size)
+            ]
+
+        # Collect chunk results in submission order so the output stays chronological
+        records = []
+        for future in futures:
+            records.extend(future.result())
+
+    # Order by log timestamp and drop duplicates (slice boundaries overlap by design)
+    epoch = datetime.fromtimestamp(0).astimezone()
+    records.sort(key=lambda r: parse_log_timestamp(r["timestamp"]) or epoch)
+    seen = set()
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        for record in records:
+            key = record["event_id"] or f"{record['timestamp']}|{record['process']}|{record['message']}"
+            if key in seen:
+                continue
+            seen.add(key)
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{len(seen)} events from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}", file=sys.stderr)
+    return 0
+
+
+# =============================================================================
+# Fleet Aggregation (agent -> collector)
+# =============================================================================
+#
+# FLEET_COLLECTOR is delivered like any other event sink (see Event Sinks):
+# spooled to disk, then sent in gzip-compressed JSON batches with backoff
+# while the collector is unreachable. The collector deduplicates, indexes by
+# host and source IP, and serves fleet-wide views.
+#
+# Collector addresses:
+#   http://host:port          POST /ingest with a gzip JSON body
+#   tcp://host:port           length-prefixed gzip frames, answered with "OK"
+#   unix:///path/to/socket    same framing over a Unix socket
+
+FLEET_COLLECTOR = os.environ.get("FLEET_COLLECTOR", "")
+FLEET_HOST = os.environ.get("FLEET_HOST", socket.gethostname())
+
+
+def export_event_record(event: Event) -> Dict[str, Any]:
+    """Normalize a history event for sinks and the fleet, with a stable cross-host ID."""
+    record = event.to_record()
+    del record["seq"]
+    record["host"] = FLEET_HOST
+    digest = hashlib.sha1(f"{FLEET_HOST}|{record['date']}|{record['monitor']}|{record['title']}|{record['body']}".encode())
+    record["id"] = digest.hexdigest()[:16]
+    return record
+
+
+def _fleet_frame(payload: bytes) -> bytes:
+    """Length-prefix a payload for the socket transports."""
+    return len(payload).to_bytes(4, "big") + payload
+
+
+def _read_fleet_frame(sock) -> Optional[bytes]:
+    """Read one length-prefixed frame from a socket-like object with recv()."""
+    def read_exactly(size: int) -> Optional[bytes]:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    header = read_exactly(4)
+    return read_exactly(int.from_bytes(header, "big")) if header else None
+
+
+def send_fleet_batch(collector: str, events: List[Dict[str, Any]], timeout: float) -> bool:
+    """Send one compressed batch to the collector; True once it acknowledges."""
+    import gzip
+    import urllib.request
+
+    payload = gzip.compress(json.dumps({"host": FLEET_HOST, "events": events}).encode(), compresslevel=6)
+    try:
+        if collector.startswith(("http://", "https://")):
+            request = urllib.request.Request(
+                collector.rstrip("/") + "/ingest",
+                data=payload,
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return 200 <= response.status < 300
+
+        if collector.startswith("unix://"):
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address: Any = collector[len("unix://"):]
+        elif collector.startswith("tcp://"):
+            host, port = split_host_port(collector[len("tcp://"):])
+            conn = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+            address = (host, int(port))
+        else:
+            return False
+
+        with conn:
+            conn.settimeout(timeout)
+            conn.connect(address)
+            conn.sendall(_fleet_frame(payload))
+            return _read_fleet_frame(conn) == b"OK"
+    except (OSError, ValueError):
+        return False
+
+
+class FleetCollector:
+    """In-memory, deduplicated, indexed store of events from many hosts."""
+
+    def __init__(self, store_path: Optional[str] = None, max_events: int = 1000000, max_ids: Optional[int] = None):
+        from collections import OrderedDict
+
+        self.lock = threading.Lock()
+        self.max_events = max_events
+        self.events: List[Dict[str, Any]] = []
+        # Recently seen event IDs, least recently seen first; agents only resend
+        # recent batches, so a bounded LRU is enough to deduplicate them
+        self.ids: "OrderedDict[str, None]" = OrderedDict()
+        self.max_ids = max_ids or 2 * max_events
+        self.hosts: Dict[str, Dict[str, Any]] = {}          # host -> {"count", "last_seen"}
+        self.hosts_by_source: Dict[str, Dict[str, int]] = {}  # source IP -> {host: count}
+        self.store_path = store_path
+
+        if store_path and os.path.exists(store_path):
+            with open(store_path, "r") as f:
+                self.ingest([json.loads(line) for line in f if line.strip()], persist=False)
+
+    def ingest(self, events: List[Dict[str, Any]], persist: bool = True) -> int:
+        """Add a batch, skipping events already seen; returns how many were new."""
+        fresh = []
+        with self.lock:
+            for event in events:
+                event_id = event.get("id")
+                if not event_id:
+                    continue
+                if event_id in self.ids:
+                    self.ids.move_to_end(event_id)
+                    continue
+                self.ids[event_id] = None
+                if len(self.ids) > self.max_ids:
+                    self.ids.popitem(last=False)
+                self.events.append(event)
+                fresh.append(event)
+
+                host = event.get("host", "?")
+                info = self.hosts.setdefault(host, {"count": 0, "last_seen": ""})
+                info["count"] += 1
+                info["last_seen"] = max(info["last_seen"], event.get("date") or "")
+                if event.get("source"):
+                    by_host = self.hosts_by_source.setdefault(event["source"], {})
+                    by_host[host] = by_host.get(host, 0) + 1
+
+            # Cap memory: drop the oldest events (their IDs stay known for dedup, up to max_ids)
+            del self.events[:-self.max_events]
+
+            if persist and fresh and self.store_path:
+                with open(self.store_path, "a") as f:
+                    f.writelines(json.dumps(event) + "\n" for event in fresh)
+        return len(fresh)
+
+    def view(self, path: str, query: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Fleet-wide views served over HTTP GET."""
+        with self.lock:
+            if path == "/hosts":
+                if "src" in query:
+                    # Which hosts saw this scanner IP?
+                    return {"src": query["src"], "hosts": self.hosts_by_source.get(query["src"], {})}
+                return {"hosts": self.hosts}
+            if path == "/sources":
+                limit = int(query.get("limit", "20"))
+                top = heapq.nlargest(limit, self.hosts_by_source.items(), key=lambda item: len(item[1]))
+                return {"sources": [{"src": src, "hosts": len(hosts), "events": sum(hosts.values())} for src, hosts in top]}
+            if path == "/events":
+                limit = int(query.get("limit", "100"))
+                matches = [
+                    event for event in reversed(self.events)
+                    if all(event.get(key) == query[key] for key in ("host", "monitor", "source", "type") if key in query)
+                ]
+                return {"events": matches[:limit]}
+            if path == "/stats":
+                return {"events": len(self.events), "hosts": len(self.hosts), "sources": len(self.hosts_by_source)}
+        return None
+
+
+def run_collector(argv: List[str]) -> int:
+    """
+    Run a fleet collector that agents send their events to.
+
+    Usage:
+        security-growler.30s.py collector --listen http://0.0.0.0:8765 [--listen unix:///tmp/sg.sock] [--store fleet.jsonl]
+
+    Views: GET /hosts?src=1.2.3.4, /hosts, /sources, /events?host=x&monitor=ssh, /stats
+    """
+    import argparse
+    import gzip
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qsl
+
+    parser = argparse.ArgumentParser(prog="security-growler collector", description=run_collector.__doc__.strip().splitlines()[0])
+    parser.add_argument("--listen", action="append", help="http://host:port, tcp://host:port or unix:///path (repeatable)")
+    parser.add_argument("--store", help="JSONL file to persist events to (reloaded on start)")
+    args = parser.parse_args(argv)
+
+    collector = FleetCollector(args.store)
+
+    class HTTPHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            pass
+
+        def _reply(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/ingest":
+                return self._reply(404, {"error": "not found"})
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            try:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                accepted = collector.ingest(json.loads(body).get("events", []))
+            except (OSError, ValueError, AttributeError):
+                return self._reply(400, {"error": "bad batch"})
+            self._reply(200, {"accepted": accepted})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            try:
+                result = collector.view(url.path, dict(parse_qsl(url.query)))
+            except ValueError:
+                return self._reply(400, {"error": "bad query"})
+            self._reply(200 if result is not None else 404, result or {"error": "not found"})
+
+    class FrameHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            while True:
+                payload = _read_fleet_frame(self.request)
+                if payload is None:
+                    return
+                try:
+                    collector.ingest(json.loads(gzip.decompress(payload)).get("events", []))
+                    self.request.sendall(_fleet_frame(b"OK"))
+                except (OSError, ValueError, AttributeError):
+                    self.request.sendall(_fleet_frame(b"ERR"))
+
+    servers = []
+    for listen in args.listen or ["http://127.0.0.1:8765"]:
+        if listen.startswith("http://"):
+            host, port = split_host_port(listen[len("http://"):])
+            servers.append(ThreadingHTTPServer((host, int(port)), HTTPHandler))
+        elif listen.startswith("tcp://"):
+            host, port = split_host_port(listen[len("tcp://"):])
+            servers.append(socketserver.ThreadingTCPServer((host, int(port)), FrameHandler))
+        elif listen.startswith("unix://"):
+            path = listen[len("unix://"):]
+            if os.path.exists(path):
+                os.unlink(path)
+            servers.append(socketserver.ThreadingUnixStreamServer(path, FrameHandler))
+        else:
+            print(f"unsupported listen address: {listen}", file=sys.stderr)
+            return 1
+
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"collector listening on {server.server_address}", file=sys.stderr, flush=True)
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+    return 0
+
+
+# =============================================================================
+# Event Sinks
+# =============================================================================
+#
+# Besides the menu, log file and notifications, new events can be exported to
+# any number of sinks listed in SINKS (comma-separated):
+#   jsonl:///path/events.jsonl   append JSON lines to a file
+#   syslog://                    local syslog; syslog://host:514 for remote UDP (RFC 5424)
+#   https://siem.example/hook    webhook, POSTed as {"host": ..., "events": [...]}
+#   unix:///path/to.sock         JSON lines over a Unix stream socket
+#   fleet+http://host:8765       a fleet collector (FLEET_COLLECTOR adds this for you)
+#
+# The tick only appends events to a per-sink spool file on disk. Delivery runs
+# afterwards in a detached `sinks flush` process (or a thread in daemon mode),
+# in batches, under a deadline, with exponential backoff per sink. A slow or
+# dead destination therefore never delays the tick, and undelivered events
+# survive restarts. If a spool grows past SINK_SPOOL_MAX_BYTES the oldest
+# events are dropped (and counted) rather than filling the disk.
+
+SINKS = [url.strip() for url in os.environ.get("SINKS", "").split(",") if url.strip()]
+SPOOL_DIR = STATE_DIR / "spool"
+SINK_BATCH_SIZE = 500             # events per delivery
+SINK_SEND_TIMEOUT = 5             # seconds per delivery attempt
+SINK_DELIVERY_DEADLINE = 25       # seconds a flush may run before yielding to the next tick
+SINK_SPOOL_MAX_BYTES = 50 * 1024 * 1024
+SINK_BACKOFF_BASE = 30            # seconds before the first retry
+SINK_BACKOFF_MAX = 3600           # longest wait between retries
+
+
+def get_sink_urls() -> List[str]:
+    """Configured sinks, including the fleet collector if one is set."""
+    urls = list(SINKS)
+    if FLEET_COLLECTOR:
+        urls.append("fleet+" + FLEET_COLLECTOR)
+    return urls
+
+
+def send_jsonl_sink(target: str, events: List[Dict[str, Any]], timeout: float) -> bool:
+    """Append events as JSON lines to a local file."""
+    with open(os.path.expanduser(target), "a") as f:
+        f.writelines(json.dumps(event) + "\n" for event in events)
+    return True
+
+
+def send_syslog_sink(target: str, events: List[Dict[str, Any]], timeout: float) -> bool:
+    """Send events to the local syslog, or to a remote one over UDP."""
+    if not target:
+        import syslog
+
+        syslog.openlog("security-growler", 0, syslog.LOG_AUTH)
+        for event in events:
+            priority = syslog.LOG_WARNING if event["type"] == "alert" else syslog.LOG_INFO
+            syslog.syslog(priority, f"[{event['monitor']}] {event['title']}: {event['body']}")
+        return True
+
+    # Remote syslog over UDP: facility auth (4), severity warning (4) or info (6)
+    host, port = split_host_port(target)
+    with socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for event in events:
+            priority = 4 * 8 + (4 if event["type"] == "alert" else 6)
+            # RFC 5424 wants an explicit offset; event dates are naive local time
+            try:
+                when = datetime.fromisoformat(event.get("date") or "").astimezone()
+            except ValueError:
+                when = datetime.now().astimezone()
+            timestamp = when.isoformat(timespec="microseconds")
+            line = f"<{priority}>1 {timestamp} {event['host']} security-growler - {event['monitor']} - {event['title']}: {event['body']}"
+            sock.sendto(line.encode(errors="replace"), (host, int(port or 514)))
+    return True
+
+
+def send_webhook_sink(target: str, events: List[Dict[str, Any]], timeout: float) -> bool:
+    """POST a batch of events as JSON."""
+    import urllib.request
+
+    request = urllib.request.Request(
+        target,
+        data=json.dumps({"host": FLEET_HOST, "events": events}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return 200 <= response.status < 300
+
+
+def send_unix_sink(target: str, events: List[Dict[str, Any]], timeout: float) -> bool:
+    """Write events as JSON lines to a Unix stream socket."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(target)
+        sock.sendall("".join(json.dumps(event) + "\n" for event in events).encode())
+    return True
+
+
+SINK_TYPES = {
+    "jsonl": send_jsonl_sink,
+    "syslog": send_syslog_sink,
+    "webhook": send_webhook_sink,
+    "unix": send_unix_sink,
+    "fleet": send_fleet_batch,
+}
+
+
+def parse_sink_url(url: str) -> Optional[Tuple[str, str]]:
+    """Map a sink URL to (sink type, target), or None if unsupported."""
+    if url.startswith("fleet+"):
+        return "fleet", url[len("fleet+"):]
+    if url.startswith(("jsonl://", "file://")):
+        return "jsonl", url.split("://", 1)[1]
+    if url.startswith("syslog://"):
+        return "syslog", url[len("syslog://"):].rstrip("/")
+    if url.startswith(("http://", "https://")):
+        return "webhook", url
+    if url.startswith("unix://"):
+        return "unix", url[len("unix://"):]
+    return None
+
+
+def get_sink_spool(url: str) -> Path:
+    """Spool directory for one sink: queue.jsonl, meta.json and a lock file."""
+    return SPOOL_DIR / hashlib.sha1(url.encode()).hexdigest()[:12]
+
+
+def _load_spool_meta(spool: Path) -> Dict[str, Any]:
+    try:
+        with open(spool / "meta.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"offset": 0, "failures": 0, "next_try": 0, "dropped": 0, "delivered": 0}
+
+
+def _save_spool_meta(spool: Path, meta: Dict[str, Any]) -> None:
+    tmp = spool / "meta.json.tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, spool / "meta.json")
+
+
+def spool_sink_events(events: List[Event]) -> None:
+    """Append new events to every sink's spool file (cheap; no network)."""
+    urls = get_sink_urls()
+    if not urls or not events:
+        return
 
-    # Check for changes
-    for iface, ip in current_ips.items():
-        old_ip = known_ips.get(iface)
-        if old_ip and old_ip != ip:
-            title = f"LOCAL IP CHANGED: {iface}"
-            body = f"{old_ip} → {ip}"
-            events.append(("notify", title, body))
+    data = "".join(json.dumps(export_event_record(event)) + "\n" for event in events)
+    for url in urls:
+        spool = get_sink_spool(url)
+        spool.mkdir(parents=True, exist_ok=True)
+        with _locked(spool / "lock"):
+            (spool / "url").write_text(url)
+            with open(spool / "queue.jsonl", "a") as f:
+                f.write(data)
 
-    # Check for new interfaces
-    for iface, ip in current_ips.items():
-        if iface not in known_ips:
-            title = f"NEW INTERFACE: {iface}"
-            body = f"IP: {ip}"
-            events.append(("notify", title, body))
 
-    # Check for removed interfaces
-    for iface in known_ips:
-        if iface not in current_ips:
-            title = f"INTERFACE DOWN: {iface}"
-            body = f"was {known_ips[iface]}"
-            events.append(("notify", title, body))
+def sink_has_pending(url: str, now: Optional[float] = None) -> bool:
+    """True if a sink has undelivered events and isn't backing off."""
+    spool = get_sink_spool(url)
+    try:
+        size = (spool / "queue.jsonl").stat().st_size
+    except OSError:
+        return False
+    meta = _load_spool_meta(spool)
+    return size > meta["offset"] and (now or time.time()) >= meta["next_try"]
+
+
+def flush_sink(url: str, deadline: float) -> Dict[str, Any]:
+    """Deliver one sink's spool in batches until drained, failing, or past the deadline."""
+    spool = get_sink_spool(url)
+    sink = parse_sink_url(url)
+    meta = _load_spool_meta(spool)
+    if sink is None or time.time() < meta["next_try"]:
+        return meta
+    send = SINK_TYPES[sink[0]]
+    queue_path = spool / "queue.jsonl"
+
+    while time.monotonic() < deadline:
+        with _locked(spool / "lock"):
+            size = queue_path.stat().st_size if queue_path.exists() else 0
+            # Backpressure: never let a dead sink fill the disk, drop the oldest instead
+            if size - meta["offset"] > SINK_SPOOL_MAX_BYTES:
+                with open(queue_path, "rb") as f:
+                    f.seek(size - SINK_SPOOL_MAX_BYTES)
+                    f.readline()
+                    skip_to = f.tell()
+                    f.seek(meta["offset"])
+                    meta["dropped"] += f.read(skip_to - meta["offset"]).count(b"\n")
+                meta["offset"] = skip_to
+            with open(queue_path, "rb") as f:
+                f.seek(meta["offset"])
+                lines = [line for line in (f.readline() for _ in range(SINK_BATCH_SIZE)) if line.endswith(b"\n")]
+
+        if not lines:
+            break
 
-    state["known_local_ips"] = current_ips
-    return events
+        try:
+            delivered = send(sink[1], [json.loads(line) for line in lines], min(SINK_SEND_TIMEOUT, max(0.5, deadline - time.monotonic())))
+        except (OSError, ValueError):
+            delivered = False
+
+        if not delivered:
+            meta["failures"] += 1
+            delay = min(SINK_BACKOFF_MAX, SINK_BACKOFF_BASE * 2 ** (meta["failures"] - 1))
+            # Jitter so a fleet of agents doesn't retry in lockstep
+            meta["next_try"] = time.time() + delay * random.uniform(0.8, 1.2)
+            break
+
+        meta.update(failures=0, next_try=0)
+        meta["offset"] += sum(len(line) for line in lines)
+        meta["delivered"] += len(lines)
+
+    with _locked(spool / "lock"):
+        # Compact once everything delivered so far has been cut from the file
+        size = queue_path.stat().st_size if queue_path.exists() else 0
+        if meta["offset"] and meta["offset"] >= size:
+            queue_path.write_bytes(b"")
+            meta["offset"] = 0
+        elif meta["offset"] > 1024 * 1024:
+            with open(queue_path, "rb") as f:
+                f.seek(meta["offset"])
+                rest = f.read()
+            queue_path.write_bytes(rest)
+            meta["offset"] = 0
+        _save_spool_meta(spool, meta)
+    return meta
+
+
+def flush_sinks(deadline_seconds: float = SINK_DELIVERY_DEADLINE) -> Dict[str, Dict[str, Any]]:
+    """Flush every sink, one worker at a time (a second flusher just returns)."""
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    worker_lock = _locked(SPOOL_DIR / "worker.lock", blocking=False)
+    if worker_lock is None:
+        return {}
+    with worker_lock:
+        deadline = time.monotonic() + deadline_seconds
+        return {url: flush_sink(url, deadline) for url in get_sink_urls()}
 
 
-# =============================================================================
-# Kandji/MDM Events Monitor
-# =============================================================================
+_background_threads: Dict[str, Any] = {}
 
-def parse_mdm_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor for Kandji/MDM events."""
-    if not MONITOR_MDM:
-        return []
 
-    events = []
+def start_background_job(command: List[str], target: Callable[[], Any], background_thread: bool = False) -> None:
+    """
+    Run slow work off the tick without waiting for it: target() on a thread in
+    daemon mode, else a detached copy of this script running `command`.
+    """
+    if background_thread:
+        thread = _background_threads.get(command[0])
+        if thread is None or not thread.is_alive():
+            thread = _background_threads[command[0]] = threading.Thread(target=target, daemon=True)
+            thread.start()
+        return
 
-    # Query for MDM-related processes
-    predicate = '''(
-        process == "Kandji" OR
-        process == "kandji-daemon" OR
-        process == "mdmclient" OR
-        process == "profiles" OR
-        process == "ManagedClient" OR
-        process == "softwareupdated" OR
-        subsystem == "com.apple.ManagedClient" OR
-        subsystem CONTAINS "kandji" OR
-        eventMessage CONTAINS "MDM" OR
-        eventMessage CONTAINS "Configuration Profile"
-    )'''
-
-    entries = get_log_entries(predicate)
-
-    # Filter for interesting events
-    interesting_keywords = [
-        "install", "remove", "profile", "command", "push", "enroll",
-        "policy", "restrict", "allow", "block", "update", "compliance"
-    ]
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), *command],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
 
-    for entry in entries:
-        event_id = entry.get("eventID", entry.get("traceID", str(entry)))
-        if event_id in state["seen_events"]:
-            continue
 
-        process = entry.get("process", "MDM")
-        message = entry.get("eventMessage", "")
-        message_lower = message.lower()
+def start_sink_delivery(background_thread: bool = False) -> None:
+    """Kick off delivery if anything is pending (see start_background_job)."""
+    now = time.time()
+    if any(sink_has_pending(url, now) for url in get_sink_urls()):
+        start_background_job(["sinks", "flush"], flush_sinks, background_thread)
 
-        # Only alert on interesting MDM events
-        if any(kw in message_lower for kw in interesting_keywords):
-            title = f"MDM: {process}"
-            body = message[:60] + "..." if len(message) > 60 else message
-            events.append(("alert", title, body))
-            state["seen_events"].append(event_id)
 
-    return events
+def run_sinks(argv: List[str]) -> int:
+    """
+    Deliver or inspect spooled sink events.
+
+    Usage:
+        security-growler.30s.py sinks flush     deliver now (what each tick runs in the background)
+        security-growler.30s.py sinks status    pending/delivered/dropped per sink
+    """
+    command = argv[0] if argv else "status"
+    if command == "flush":
+        flush_sinks()
+        return 0
+    if command != "status":
+        print(run_sinks.__doc__, file=sys.stderr)
+        return 1
+
+    for url in get_sink_urls():
+        spool = get_sink_spool(url)
+        meta = _load_spool_meta(spool)
+        try:
+            with open(spool / "queue.jsonl", "rb") as f:
+                f.seek(meta["offset"])
+                pending = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 16), b""))
+        except OSError:
+            pending = 0
+        retry = f", retry in {int(meta['next_try'] - time.time())}s" if meta["next_try"] > time.time() else ""
+        print(f"{url}: {pending} pending, {meta['delivered']} delivered, {meta['dropped']} dropped{retry}")
+    return 0
 
 
 # =============================================================================
-# ARP Spoofing Detection
+# Network Worker
 # =============================================================================
+#
+# Probes that depend on the network (public IP lookup, update check) can take
+# many seconds when the network is slow or down, so they never run inside the
+# tick. A background worker (a detached `network` process, or a thread in
+# daemon mode) refreshes them when due and publishes the results with their
+# timestamps to network.json; the tick only reads the latest results.
 
-def get_gateway_info() -> Optional[Dict[str, str]]:
-    """Get the default gateway IP and interface."""
-    cmd = "route -n get default 2>/dev/null | grep -E 'gateway:|interface:' | awk '{print $2}'"
+NETWORK_FILE = STATE_DIR / "network.json"
+PUBLIC_IP_REFRESH_SECONDS = 60
 
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
 
-        lines = [line.strip() for line in result.stdout.strip().splitlines() if line.strip()]
-        if len(lines) >= 2:
-            return {
-                "gateway_ip": lines[0],
-                "interface": lines[1]
-            }
+def load_network_results() -> Dict[str, Any]:
+    """Latest network worker results: {"public_ip": {...}, "update": {...}}."""
+    try:
+        with open(NETWORK_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        pass
 
-    return None
+def get_network_results() -> Dict[str, Any]:
+    """load_network_results(), read once per tick."""
+    return tick_memo("network.json", load_network_results)
 
 
-def get_mac_address(ip: str) -> Optional[str]:
-    """Get MAC address for a given IP from ARP table."""
-    cmd = f"arp -n {ip} 2>/dev/null | grep -v 'no entry' | grep -v 'incomplete' | tail -1 | awk '{{print $4}}'"
+def network_probes_due(results: Dict[str, Any], now: float) -> List[str]:
+    """Which network probes are stale enough to refresh."""
+    due = []
+    if MONITOR_PUBLIC_IP and now - results.get("public_ip", {}).get("checked", 0) >= PUBLIC_IP_REFRESH_SECONDS:
+        due.append("public_ip")
+    if now - results.get("update", {}).get("checked", 0) >= UPDATE_CHECK_SECONDS:
+        due.append("update")
+    return due
 
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
 
-        mac = result.stdout.strip()
-        # Validate MAC address format (aa:bb:cc:dd:ee:ff)
-        if mac and ":" in mac and len(mac) >= 14:
-            return mac.lower()
+def refresh_network_probes() -> None:
+    """Refresh whatever network probes are due and publish the results (one worker at a time)."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    worker_lock = _locked(STATE_DIR / "network.lock", blocking=False)
+    if worker_lock is None:
+        return
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        pass
+    with worker_lock:
+        results = load_network_results()
+        due = network_probes_due(results, time.time())
+        if "public_ip" in due:
+            results["public_ip"] = {"value": get_public_ip(), "checked": time.time()}
+        if "update" in due:
+            results["update"] = fetch_remote_script_hash(results.get("update", {}))
 
-    return None
+        tmp = NETWORK_FILE.with_name(NETWORK_FILE.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(results, f)
+        os.replace(tmp, NETWORK_FILE)
 
 
-def get_own_ip_and_mac(interface: str = "en0") -> Optional[Dict[str, str]]:
-    """Get our own IP and MAC address for the given interface."""
-    info = {}
+def start_network_worker(background_thread: bool = False) -> None:
+    """Kick off the network worker if any of its results are stale."""
+    if network_probes_due(load_network_results(), time.time()):
+        start_background_job(["network"], refresh_network_probes, background_thread)
 
-    # Get IP address
-    try:
-        result = subprocess.run(
-            ["ipconfig", "getifaddr", interface],
-            capture_output=True,
-            text=True,
-            timeout=2
-        )
-        ip = result.stdout.strip()
-        if ip:
-            info["ip"] = ip
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return None
 
-    # Get MAC address
-    cmd = f"ifconfig {interface} 2>/dev/null | grep ether | awk '{{print $2}}'"
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=2
-        )
-        mac = result.stdout.strip()
-        if mac:
-            info["mac"] = mac.lower()
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return None
+def describe_age(seconds: float) -> str:
+    """Short human age, e.g. "45s", "12m", "3h"."""
+    if seconds < 120:
+        return f"{int(seconds)}s"
+    if seconds < 7200:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h"
 
-    return info if "ip" in info and "mac" in info else None
 
+# =============================================================================
+# Benchmarks
+# =============================================================================
+#
+# Synthetic workloads for the hot paths, run with:
+#     security-growler.30s.py bench [name ...]
+# Benchmarks also check their results, and fail through bench_check rather than
+# assert so the checks still run under `python -O`.
 
-def check_arp_table_for_duplicates(our_ip: str) -> List[str]:
-    """Check ARP table for multiple MAC addresses claiming our IP."""
-    cmd = f"arp -a 2>/dev/null | grep '({our_ip})' | awk '{{print $4}}'"
 
-    try:
-        result = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+class BenchmarkFailed(Exception):
+    """A benchmark's result check failed."""
 
-        macs = []
-        for line in result.stdout.strip().splitlines():
-            mac = line.strip().lower()
-            if mac and ":" in mac and len(mac) >= 14:
-                macs.append(mac)
 
-        return macs
+def bench_check(ok: bool, message: str) -> None:
+    """Fail the running benchmark (exit status 1) unless `ok`."""
+    if not ok:
+        raise BenchmarkFailed(message)
 
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        return []
 
+def bench_ssh_replay() -> str:
+    """Replay a synthetic 100k-line sshd log through the brute-force aggregation."""
+    rng = random.Random(1)
+    start = datetime.now().astimezone() - timedelta(hours=6)
+    attackers = [f"203.0.113.{i}" for i in range(1, 6)]
+    users = ["root", "admin", "ubuntu", "git", "oracle"]
 
-def parse_arp_spoof_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Monitor for ARP spoofing attacks."""
-    if not MONITOR_ARP_SPOOF:
-        return []
+    entries = []
+    for i in range(100000):
+        when = start + timedelta(seconds=i * 0.2)
+        if i % 50 == 0:
+            message = f"Accepted publickey for me from 192.168.1.{rng.randint(2, 250)} port 50000 ssh2"
+        elif rng.random() < 0.7:
+            message = f"Failed password for {rng.choice(users)} from {rng.choice(attackers)} port {rng.randint(1024, 65535)} ssh2"
+        else:
+            # Background noise from many one-off sources (exercises the LRU cap)
+            message = f"Failed password for invalid user {rng.choice(users)} from 198.51.{rng.randint(0, 255)}.{rng.randint(0, 255)} port 22 ssh2"
+        entries.append({"eventID": i, "eventMessage": message, "timestamp": when.strftime("%Y-%m-%d %H:%M:%S.%f%z")})
+
+    state = {"seen_events": []}
+    began = time.perf_counter()
+    events = process_ssh_entries(state, entries)
+    elapsed = time.perf_counter() - began
+
+    kinds = {}
+    for event in events:
+        kind = event.title.split(":", 1)[0]
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return (
+        f"{len(entries)} lines in {elapsed:.2f}s ({len(entries) / elapsed:,.0f} lines/s) -> {len(events)} events {kinds}; "
+        f"tracking {len(state['ssh_failures']['src'])} sources, {len(state['ssh_failures']['user'])} users"
+    )
+
+
+def bench_sockets() -> str:
+    """Compare socket backends: live on this host, then parsing 10k synthetic sockets."""
+    import tempfile
+
+    results = []
+    for name, backend in SOCKET_BACKENDS.items():
+        reset_probes()
+        began = time.perf_counter()
+        sockets = backend()
+        if sockets is not None:
+            results.append(f"live {name}: {len(sockets)} sockets in {(time.perf_counter() - began) * 1000:.1f}ms")
+
+    # 10k established TCP sockets spread over 100 processes
+    count, processes = 10000, 100
+    lsof_lines = ["COMMAND PID USER FD TYPE DEVICE SIZE/OFF NODE NAME"]
+    net_lines = ["  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode"]
+    for i in range(count):
+        pid, port = 1000 + i % processes, 20000 + i
+        lsof_lines.append(f"proc{pid % 7} {pid} me {i % 50}u IPv4 0x{i:x} 0t0 TCP 10.0.0.2:{port}->93.184.216.34:443 (ESTABLISHED)")
+        net_lines.append(f"{i}: 0200000A:{port:04X} 22D8B85D:01BB 01 00000000:00000000 00:00000000 00000000 0 0 {100000 + i} 1")
+
+    began = time.perf_counter()
+    parsed = parse_lsof_sockets("\n".join(lsof_lines))
+    results.append(f"parse lsof output x{count}: {(time.perf_counter() - began) * 1000:.1f}ms ({len(parsed)} sockets, excludes lsof's own runtime)")
+
+    with tempfile.TemporaryDirectory() as proc_root:
+        os.makedirs(os.path.join(proc_root, "net"))
+        with open(os.path.join(proc_root, "net", "tcp"), "w") as f:
+            f.write("\n".join(net_lines) + "\n")
+        for n in range(processes):
+            pid = str(1000 + n)
+            os.makedirs(os.path.join(proc_root, pid, "fd"))
+            with open(os.path.join(proc_root, pid, "comm"), "w") as f:
+                f.write(f"proc{n % 7}\n")
+        for i in range(count):
+            os.symlink(f"socket:[{100000 + i}]", os.path.join(proc_root, str(1000 + i % processes), "fd", str(i)))
+
+        began = time.perf_counter()
+        parsed = get_procfs_sockets(proc_root)
+        results.append(f"procfs x{count}: {(time.perf_counter() - began) * 1000:.1f}ms ({len(parsed)} sockets, full enumeration)")
+
+    return "; ".join(results)
+
+
+def bench_rules() -> str:
+    """Match 100k synthetic events against 1k rules, indexed vs. a linear scan."""
+    rng = random.Random(1)
+    # Rules use 1.2k of the 12k words events are made of, so most events match nothing
+    vocabulary = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(6, 10))) for _ in range(12000)]
+    words = rng.sample(vocabulary, 1200)
+    rules = []
+    for i in range(1000):
+        kind = i % 10
+        if kind < 4:
+            match: Dict[str, Any] = {"process": f"proc{rng.randint(0, 499)}", "message_keywords": rng.choice(words)}
+        elif kind < 7:
+            match = {"message_contains": rng.sample(words, 2)}
+        elif kind < 9:
+            match = {"port": rng.randint(1, 2000), "remote": f"10.{rng.randint(0, 255)}.0.0/16"}
+        else:
+            match = {"message_regex": rf"\b{rng.choice(words)}\b.*{rng.choice(words)}"}
+        rules.append({"id": f"r{i}", "monitor": "*", "action": rng.choice(["alert", "notify", "drop"]), "match": match})
 
     events = []
+    for _ in range(100000):
+        events.append({
+            "process": f"proc{rng.randint(0, 999)}",
+            "user": "root",
+            "port": rng.randint(1, 65535),
+            "remote": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.1",
+            "message": " ".join(rng.sample(vocabulary, 8)),
+        })
 
-    # Get gateway information
-    gateway_info = get_gateway_info()
-    if not gateway_info:
-        # Can't monitor without gateway info
-        return events
+    began = time.perf_counter()
+    rule_set = RuleSet(rules)
+    compile_ms = (time.perf_counter() - began) * 1000
+
+    began = time.perf_counter()
+    results = [rule_set.match("sudo", dict(fields)) for fields in events]
+    indexed = time.perf_counter() - began
+    matched = sum(1 for rule in results if rule)
+
+    # Baseline: test every rule against every event (on a 10k sample)
+    sample = events[:10000]
+    began = time.perf_counter()
+    for n, fields in enumerate(sample):
+        fields = dict(fields, message_lower=fields["message"].lower())
+        linear = next((rule_set.rules[i] for i, tests in enumerate(rule_set.tests) if all(test(fields) for test in tests)), None)
+        bench_check(linear is results[n], "index and linear scan disagree")
+    linear_rate = len(sample) / (time.perf_counter() - began)
+
+    return (
+        f"{len(rules)} rules compiled in {compile_ms:.0f}ms; {len(events)} events in {indexed:.2f}s "
+        f"({len(events) / indexed:,.0f}/s, {matched} matched) vs linear scan {linear_rate:,.0f}/s "
+        f"({len(events) / indexed / linear_rate:.0f}x)"
+    )
+
+
+# The predicates and levels every monitor used before filters were pushed into `log`
+LEGACY_LOG_PREDICATES = {
+    "ssh": '(process == "sshd") AND (eventMessage CONTAINS "Accepted" OR eventMessage CONTAINS "Failed" OR eventMessage CONTAINS "error")',
+    "sudo": '(process == "sudo") AND (eventMessage CONTAINS "COMMAND")',
+    "portscan": '(process == "kernel") AND (eventMessage CONTAINS "Limiting closed port RST")',
+    "ftp": '(process == "ftpd")',
+    "mdm": (
+        '(process IN {"Kandji", "kandji-daemon", "mdmclient", "profiles", "ManagedClient", "softwareupdated"} OR '
+        'subsystem == "com.apple.ManagedClient" OR subsystem CONTAINS "kandji" OR '
+        'eventMessage CONTAINS "MDM" OR eventMessage CONTAINS "Configuration Profile")'
+    ),
+}
 
-    gateway_ip = gateway_info["gateway_ip"]
-    interface = gateway_info["interface"]
 
-    # Method 1: Check if gateway MAC has changed (gateway spoofing)
-    try:
-        # Ping gateway to ensure fresh ARP entry
-        subprocess.run(
-            ["ping", "-c", "1", "-W", "1", gateway_ip],
-            capture_output=True,
-            timeout=3
-        )
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError):
-        pass
+def synthetic_log_fixture(count: int = 20000) -> List[Dict[str, Any]]:
+    """A mixed unified-log recording (all levels) shaped like a busy Mac's."""
+    rng = random.Random(1)
+    templates = [
+        # (process, subsystem, messageType, message, weight)
+        ("sshd", "", "Info", "Accepted publickey for me from 192.168.1.{n} port 50{n} ssh2", 1),
+        ("sshd", "", "Info", "Failed password for root from 203.0.113.{n} port 4{n} ssh2", 3),
+        ("sshd", "", "Error", "error: kex_exchange_identification: Connection closed by remote host", 1),
+        ("sshd", "", "Debug", "debug1: userauth-request for user me service ssh-connection method none [{n}]", 4),
+        ("sudo", "", "Default", "me : TTY=ttys00{n} ; PWD=/Users/me ; USER=root ; COMMAND=/usr/bin/whoami", 1),
+        ("sudo", "", "Default", "me : TTY=?? ; PWD=/ ; USER=root ; COMMAND=/usr/sbin/lsof +c 0 -i -n -P", 6),
+        ("kernel", "", "Default", "Limiting closed port RST response from 3{n} to 250 packets per second", 1),
+        ("kernel", "", "Default", "MDM check-in throttled (AppleMobileFileIntegrity) {n}", 2),
+        ("ftpd", "", "Info", "FTP LOGIN FROM 10.0.0.{n} as anonymous", 1),
+        ("mdmclient", "com.apple.ManagedClient", "Info", "Installing configuration profile com.example.wifi{n}", 1),
+        ("mdmclient", "com.apple.ManagedClient", "Info", "MDM: idle, next poll in {n}s", 12),
+        ("mdmclient", "com.apple.ManagedClient", "Debug", "Processing queue item {n} (push token refreshed)", 20),
+        ("kandji-daemon", "io.kandji.agent", "Info", "heartbeat ok, {n} checks passed", 10),
+        ("cloudd", "com.apple.cloudkit", "Default", "MDM-managed container sync {n} done", 5),
+        ("trustd", "com.apple.securityd", "Debug", "Configuration Profile trust evaluation {n}", 8),
+    ]
+    weights = [template[4] for template in templates]
+    start = datetime(2024, 1, 1, 9, 0, 0)
+
+    entries = []
+    for i in range(count):
+        process, subsystem, level, message, _ = rng.choices(templates, weights)[0]
+        entries.append({
+            "eventID": i,
+            "timestamp": (start + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S.000000-0800"),
+            "process": process,
+            "subsystem": subsystem,
+            "messageType": level,
+            "eventMessage": message.format(n=rng.randint(1, 99)),
+        })
+    return entries
 
-    current_gateway_mac = get_mac_address(gateway_ip)
 
-    if current_gateway_mac:
-        known_gateway_mac = state.get("known_gateway_mac")
-        known_gateway_ip = state.get("known_gateway_ip")
+def bench_log_predicates() -> str:
+    """Bytes `log show` returns per monitor with the legacy vs. pushed-down predicates (from fixtures)."""
+    if PROBE_FIXTURES:
+        with open(Path(PROBE_FIXTURES) / "probes.json", "r") as f:
+            recorded = json.load(f)
+        entries = [
+            entry for key, output in recorded.items() if key.startswith("/usr/bin/log show")
+            for entry in parse_log_output(output)
+        ]
+        source = f"{len(entries)} recorded entries"
+    else:
+        entries = synthetic_log_fixture()
+        source = f"{len(entries)} synthetic entries"
+
+    results = []
+    total_before = total_after = 0
+    for monitor, (predicate, parser) in LOG_MONITORS.items():
+        before = filter_log_entries(entries, LEGACY_LOG_PREDICATES[monitor], ["info", "debug"])
+        after = filter_log_entries(entries, rules_log_predicate(monitor, predicate), list(LOG_LEVELS.get(monitor, ())))
+        before_bytes = len(json_dumps(before, indent=True))
+        after_bytes = len(json_dumps(after, indent=True))
+        total_before += before_bytes
+        total_after += after_bytes
+
+        # Pushing filters down must not change what the monitor reports
+        events_before = [(event.severity, event.title, event.body) for event in map(parser, before) if event]
+        events_after = [(event.severity, event.title, event.body) for event in map(parser, after) if event]
+        bench_check(events_before == events_after, f"{monitor}: pushed-down predicate changes events")
+        results.append(f"{monitor} {before_bytes // 1024}KB->{after_bytes // 1024}KB ({len(events_after)} events)")
+
+    return (
+        f"{source}: {total_before // 1024}KB -> {total_after // 1024}KB "
+        f"(-{100 - 100 * total_after // max(total_before, 1)}%), same events; " + ", ".join(results)
+    )
+
+
+def bench_archive() -> str:
+    """Query a synthetic year of archived events (365 daily segments, 1k events each)."""
+    import tempfile
+
+    global ARCHIVE_DIR
+    rng = random.Random(1)
+    monitors = ["ssh", "sudo", "ports", "listening", "dns", "portscan"]
+    saved_dir = ARCHIVE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        ARCHIVE_DIR = Path(tmp)
+        try:
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=365)
+            began = time.perf_counter()
+            for day in range(365):
+                events = []
+                for i in range(1000):
+                    when = start + timedelta(days=day, seconds=i * 86)
+                    # A handful of sources show up every day; each scanner IP only on a few days
+                    source = f"203.0.113.{rng.randint(1, 20)}" if rng.random() < 0.5 else f"198.51.{day % 256}.{rng.randint(1, 250)}"
+                    monitor = rng.choice(monitors)
+                    events.append(Event(
+                        rng.choice(["alert", "notify"]), f"{monitor.upper()} EVENT", f"from {source}",
+                        monitor, source=source, ts=when.timestamp(), seq=day * 1000 + i,
+                    ))
+                archive_events(events)
+            write_s = time.perf_counter() - began
+            size_mb = sum(path.stat().st_size for path in ARCHIVE_DIR.iterdir()) / 1e6
+
+            results = [f"wrote 365k events in {write_s:.1f}s ({size_mb:.1f}MB)"]
+            now = datetime.now()
+            for label, kwargs in [
+                ("--since 7d --type ssh", {"since": now - timedelta(days=7), "monitors": ["ssh"]}),
+                ("--since 52w --src <scanner>", {"since": now - timedelta(weeks=52), "source": "198.51.100.7"}),
+                ("--since 52w --type ssh", {"since": now - timedelta(weeks=52), "monitors": ["ssh"]}),
+            ]:
+                began = time.perf_counter()
+                count = sum(1 for _ in query_archive(**kwargs))
+                results.append(f"{label}: {count} events in {(time.perf_counter() - began) * 1000:.0f}ms")
+        finally:
+            ARCHIVE_DIR = saved_dir
+
+    return "; ".join(results)
+
+
+def bench_events() -> str:
+    """Memory and state.json size of a full history (MAX_EVENTS): Event records vs. the old per-event dicts."""
+    import tracemalloc
+
+    rng = random.Random(1)
+    start = time.time() - 86400
+    specs = []
+    for i in range(MAX_EVENTS):
+        source = f"203.0.113.{rng.randint(1, 50)}"
+        user = rng.choice(["root", "admin", "me"])
+        specs.append((i, start + i * 4, "ssh", rng.choice(["alert", "notify"]), f"SSH LOGIN: {user}", f"from {source} via Password", source, user))
+
+    def legacy_history() -> List[Dict[str, Any]]:
+        history = []
+        for seq, ts, monitor, severity, title, body, source, user in specs:
+            when = datetime.fromtimestamp(ts)
+            history.append({
+                "seq": seq, "monitor": monitor, "type": severity, "title": title, "body": body,
+                "source": extract_event_source(f"{title} {body}"), "time": when.strftime("%H:%M"), "date": when.isoformat(),
+            })
+        return history
+
+    def event_history() -> List[Event]:
+        return [
+            Event(severity, title, body, monitor, source=source, user=user, process="sshd", ts=ts, seq=seq)
+            for seq, ts, monitor, severity, title, body, source, user in specs
+        ]
 
-        # Check if gateway MAC changed for the same IP
-        if known_gateway_mac and known_gateway_ip == gateway_ip:
-            if current_gateway_mac != known_gateway_mac:
-                title = "ARP SPOOF: Gateway MAC Changed"
-                body = f"Gateway {gateway_ip} MAC changed: {known_gateway_mac} → {current_gateway_mac}"
-                events.append(("alert", title, body))
+    results = []
+    for label, build, encode in [
+        ("dicts", legacy_history, lambda history: history),
+        ("Event", event_history, lambda history: [event.to_row() for event in history]),
+    ]:
+        # The title/body strings are built by the monitors either way; count what the history adds
+        tracemalloc.start()
+        began = time.perf_counter()
+        history = build()
+        build_ms = (time.perf_counter() - began) * 1000
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        began = time.perf_counter()
+        data = json.dumps(encode(history), separators=(",", ":"))
+        dump_ms = (time.perf_counter() - began) * 1000
+        began = time.perf_counter()
+        rows = json.loads(data)
+        if label == "Event":
+            rows = [Event.from_row(row) for row in rows]
+        load_ms = (time.perf_counter() - began) * 1000
+        results.append(
+            f"{label}: {retained / len(history):.0f} B/event, {len(data) / len(history):.0f} B/event on disk, "
+            f"build {build_ms:.0f}ms, dump {dump_ms:.0f}ms, load {load_ms:.0f}ms"
+        )
 
-        # Update known gateway
-        state["known_gateway_mac"] = current_gateway_mac
-        state["known_gateway_ip"] = gateway_ip
+    return f"{MAX_EVENTS} events; " + "; ".join(results)
 
-    # Method 2: Check if our own IP is being claimed by another MAC (own IP spoofing)
-    own_info = get_own_ip_and_mac(interface)
 
-    if own_info:
-        our_ip = own_info["ip"]
-        our_mac = own_info["mac"]
+def bench_baseline() -> str:
+    """Feed 1M connection openings (mostly routine, some novel) through the novelty sketch."""
+    rng = random.Random(1)
+    # Routine traffic: a few hundred (process, client network, port) combinations, Zipf-like
+    routine = [
+        (f"proc{rng.randint(0, 99)}", f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}", rng.choice(PORTS_TO_MONITOR))
+        for _ in range(500)
+    ]
+    weights = [1 / (rank + 1) for rank in range(len(routine))]
+    flows = rng.choices(routine, weights, k=950000)
+    # Novel traffic: one-off remote networks
+    flows += [
+        (f"proc{rng.randint(0, 99)}", f"{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.9", rng.choice(PORTS_TO_MONITOR))
+        for _ in range(50000)
+    ]
+    rng.shuffle(flows)
+
+    sketch = NoveltySketch()
+    exact: Dict[str, int] = {}
+    alerts = missed = 0
+    began = time.perf_counter()
+    for process, remote, port in flows:
+        key = baseline_key(process, remote, port)
+        seen = sketch.observe(key)
+        if seen < NOVELTY_THRESHOLD:
+            alerts += 1
+        elif exact.get(key, 0) < NOVELTY_THRESHOLD:
+            missed += 1   # truly rare, but the sketch overestimated it
+        exact[key] = exact.get(key, 0) + 1
+    elapsed = time.perf_counter() - began
+    truly_rare = sum(min(count, NOVELTY_THRESHOLD) for count in exact.values())
+
+    began = time.perf_counter()
+    sketch.decay(sketch.decayed_at + BASELINE_HALF_LIFE_DAYS * 86400)
+    decay_ms = (time.perf_counter() - began) * 1000
+
+    return (
+        f"{len(flows)} openings ({len(exact)} distinct combinations) in {elapsed:.1f}s: {alerts} alerts instead of {len(flows)} "
+        f"({truly_rare} truly rare sightings, {missed} missed to collisions); "
+        f"{len(sketch.to_bytes()) // 1024}KB on disk vs {sum(len(key) + 60 for key in exact) // 1024}KB for an exact table; decay {decay_ms:.0f}ms"
+    )
+
+
+def _mmdb_encode(value: Any) -> bytes:
+    """Encode a value in the MaxMind DB data format (for synthetic databases)."""
+    if isinstance(value, bool):
+        kind, size, payload = 14, int(value), b""
+    elif isinstance(value, str):
+        payload = value.encode()
+        kind, size = 2, len(payload)
+    elif isinstance(value, int):
+        payload = value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+        kind, size = (6 if value < 1 << 32 else 9), len(payload)
+    elif isinstance(value, float):
+        import struct
+
+        kind, size, payload = 3, 8, struct.pack(">d", value)
+    elif isinstance(value, dict):
+        payload = b"".join(_mmdb_encode(str(k)) + _mmdb_encode(v) for k, v in value.items())
+        kind, size = 7, len(value)
+    else:
+        payload = b"".join(_mmdb_encode(v) for v in value)
+        kind, size = 11, len(value)
+    if size < 29:
+        head, extra = size, b""
+    elif size < 285:
+        head, extra = 29, (size - 29).to_bytes(1, "big")
+    elif size < 65821:
+        head, extra = 30, (size - 285).to_bytes(2, "big")
+    else:
+        head, extra = 31, (size - 65821).to_bytes(3, "big")
+    if kind > 7:
+        return bytes([head, kind - 7]) + extra + payload
+    return bytes([(kind << 5) | head]) + extra + payload
+
+
+def synthetic_mmdb(path: Path, networks: List[Tuple[str, Dict[str, Any]]], record_size: int = 24) -> None:
+    """Write an IPv6 MaxMind DB mapping non-overlapping networks to records (IPv4 under ::/96)."""
+    import ipaddress
+
+    nodes = [[None, None]]
+    data = bytearray()
+    offsets: Dict[str, int] = {}
+    for cidr, record in networks:
+        network = ipaddress.ip_network(cidr)
+        key = json.dumps(record, sort_keys=True)
+        if key not in offsets:
+            offsets[key] = len(data)
+            data += _mmdb_encode(record)
+        prefix = network.prefixlen + (96 if network.version == 4 else 0)
+        value = int(network.network_address)
+        node = 0
+        for i in range(prefix):
+            bit = (value >> (127 - i)) & 1
+            if i == prefix - 1:
+                nodes[node][bit] = ("data", offsets[key])
+            else:
+                if nodes[node][bit] is None:
+                    nodes.append([None, None])
+                    nodes[node][bit] = len(nodes) - 1
+                node = nodes[node][bit]
+    count = len(nodes)
+
+    def pointer(entry: Any) -> int:
+        if entry is None:
+            return count
+        if isinstance(entry, tuple):
+            return count + 16 + entry[1]
+        return entry
+
+    tree = bytearray()
+    for left, right in nodes:
+        left, right = pointer(left), pointer(right)
+        if record_size == 28:
+            tree += left.to_bytes(4, "big")[1:] + bytes([((left >> 20) & 0xF0) | (right >> 24)]) + right.to_bytes(4, "big")[1:]
+        else:
+            tree += left.to_bytes(record_size // 8, "big") + right.to_bytes(record_size // 8, "big")
+    metadata = {
+        "node_count": count, "record_size": record_size, "ip_version": 6,
+        "binary_format_major_version": 2, "binary_format_minor_version": 0,
+        "database_type": "SecurityGrowler-Synthetic", "languages": ["en"], "build_epoch": int(time.time()),
+    }
+    path.write_bytes(bytes(tree) + bytes(16) + bytes(data) + _MMDB_METADATA_MARKER + _mmdb_encode(metadata))
 
-        # Check ARP table for duplicates of our IP
-        arp_macs = check_arp_table_for_duplicates(our_ip)
 
-        # Filter out our own MAC
-        foreign_macs = [mac for mac in arp_macs if mac != our_mac]
+def bench_geoip() -> str:
+    """Look up addresses in a 100k-network country+ASN database, cold and through the LRU cache."""
+    import tempfile
 
-        if foreign_macs:
-            # Someone else is claiming our IP!
-            for foreign_mac in foreign_macs:
-                # Create unique event ID
-                event_id = f"arp_spoof_own_ip_{our_ip}_{foreign_mac}"
+    rng = random.Random(1)
+    countries = ["US", "DE", "NL", "CN", "RU", "BR", "IN", "FR", "GB", "JP"]
+    prefixes = rng.sample(range(1 << 24), 100000)
+    # A few thousand distinct records shared between networks, as in the real databases
+    records = {
+        prefix: {"country": {"iso_code": countries[prefix % 7 % len(countries)]}, "autonomous_system_number": 64512 + prefix % 3000,
+                 "autonomous_system_organization": f"Example Net {prefix % 3000}"}
+        for prefix in prefixes
+    }
+    addresses = [f"{p >> 16}.{(p >> 8) & 255}.{p & 255}.{rng.randint(1, 254)}" for p in rng.choices(prefixes, k=100000)]
+    addresses += [f"2001:db8::{i:x}" for i in range(1000)]   # not in the database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "synthetic.mmdb"
+        began = time.perf_counter()
+        synthetic_mmdb(path, [(f"{p >> 16}.{(p >> 8) & 255}.{p & 255}.0/24", record) for p, record in records.items()])
+        build_s = time.perf_counter() - began
+        reader = MMDBReader(str(path))
+        try:
+            began = time.perf_counter()
+            for address in addresses:
+                reader._lookup(address)
+            cold_us = (time.perf_counter() - began) / len(addresses) * 1e6
+
+            hot = rng.choices(addresses[:500], k=1000000)
+            began = time.perf_counter()
+            for address in hot:
+                reader.lookup(address)
+            hot_us = (time.perf_counter() - began) / len(hot) * 1e6
+
+            for address in addresses[:1000]:
+                a, b, c, _ = (int(part) for part in address.split("."))
+                bench_check(reader.lookup(address) == records[(a << 16) | (b << 8) | c], f"wrong record for {address}")
+            bench_check(reader.lookup("2001:db8::1") is None, "found a record for an address not in the database")
+            size_mb = path.stat().st_size / 1e6
+        finally:
+            reader.close()
+
+    return (
+        f"{len(records)} networks ({size_mb:.1f}MB, built in {build_s:.1f}s): "
+        f"{cold_us:.1f}us/lookup uncached, {hot_us:.2f}us/lookup through the cache"
+    )
+
+
+def bench_ip_lists() -> str:
+    """Load a 120k-prefix deny feed (IPv4 and IPv6) and match 1M addresses against it."""
+    import tempfile
+
+    rng = random.Random(1)
+    prefixes = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.0/{rng.choice((16, 20, 24, 24, 24, 28, 32))}" for _ in range(100000)]
+    prefixes += [f"2001:db8:{rng.randint(0, 0xffff):x}:{rng.randint(0, 0xffff):x}::/{rng.choice((48, 56, 64))}" for _ in range(20000)]
+    # Half the lookups fall inside a listed prefix, half are random
+    addresses = [
+        (f"{p.split('/')[0][:-1]}{rng.randint(1, 254)}" if ":" not in p else p.split("/")[0] + "1")
+        if rng.random() < 0.5 else f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        for p in rng.choices(prefixes, k=1000000)
+    ]
 
-                if event_id not in state["seen_events"]:
-                    title = "ARP SPOOF: Own IP Claimed"
-                    body = f"MAC {foreign_mac} is claiming your IP {our_ip}"
-                    events.append(("alert", title, body))
-                    state["seen_events"].append(event_id)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "drop.txt"
+        path.write_text("; synthetic feed\n" + "".join(f"{prefix} ; SBL{i}\n" for i, prefix in enumerate(prefixes)))
+        began = time.perf_counter()
+        ranges = IPRangeSet(read_ip_list(str(path), "DENYLIST"))
+        load_ms = (time.perf_counter() - began) * 1000
+
+    began = time.perf_counter()
+    hits = sum(1 for address in addresses if ranges.find(address))
+    lookup_us = (time.perf_counter() - began) / len(addresses) * 1e6
+
+    # Cross-check a sample against a linear scan of every prefix
+    parsed = [parse_cidr(prefix) for prefix in prefixes]
+    for address in addresses[:100]:
+        version, value, _ = parse_cidr(address)
+        expected = any(v == version and low <= value <= high for v, low, high in parsed)
+        bench_check((ranges.find(address) is not None) == expected, f"wrong lookup result for {address}")
+
+    # IPv4 bounds are array items; IPv6 ones are ~32-byte ints plus a list slot
+    size_kb = (2 * len(ranges._starts[4]) * ranges._starts[4].itemsize + 2 * len(ranges._starts[6]) * 40) // 1024
+    return (
+        f"{len(prefixes)} prefixes loaded in {load_ms:.0f}ms (~{size_kb}KB of ranges); "
+        f"{len(addresses)} lookups ({hits} listed) at {lookup_us:.2f}us each"
+    )
+
+
+def bench_codec() -> str:
+    """Decode a 10MB `log show` dump and save/load a full state.json with each installed JSON codec."""
+    global JSON_CODEC
+
+    if PROBE_FIXTURES:
+        with open(Path(PROBE_FIXTURES) / "probes.json", "r") as f:
+            recorded = json.load(f)
+        entries = [
+            entry for key, output in recorded.items() if key.startswith("/usr/bin/log show")
+            for entry in json.loads(output or "[]")
+        ]
+        source = "recorded"
+    else:
+        entries = synthetic_log_fixture()
+        source = "synthetic"
+    if not entries:
+        return "no recorded `log show` output in PROBE_FIXTURES"
+    # Real entries carry fields no monitor reads; pad to what `log show` emits
+    for entry in entries:
+        entry.setdefault("processImagePath", f"/usr/sbin/{entry.get('process', 'unknown')}")
+        entry.setdefault("senderImageUUID", "5C2A1F0E-8E34-3B6B-9F1A-2D7C4E1B9A60")
+        entry.setdefault("backtrace", {"frames": [{"imageOffset": 28536, "imageUUID": "5C2A1F0E-8E34-3B6B-9F1A-2D7C4E1B9A60"}]})
+        entry.setdefault("bootUUID", "")
+        entry.setdefault("threadID", 1234567)
+    # Repeat (with fresh IDs) up to ~10MB, the size of a busy hour
+    chunk = json.dumps(entries, indent=2)
+    copies = max(1, 10 * 1024 * 1024 // len(chunk))
+    dump = json.dumps([dict(entry, eventID=n * len(entries) + i) for n in range(copies) for i, entry in enumerate(entries)], indent=2)
+
+    state = {"events": [
+        Event("alert", f"SSH LOGIN: user{i % 7}", f"from 203.0.113.{i % 250} via Password", "ssh", source=f"203.0.113.{i % 250}", ts=1.7e9 + i, seq=i)
+        for i in range(MAX_EVENTS)
+    ], "seen_events": list(range(MAX_SEEN_EVENTS))}
+
+    saved_codec = JSON_CODEC
+    results = []
+    messages = None
+    try:
+        for name in JSON_CODECS:
+            JSON_CODEC = name   # (for "msgspec" this includes the LogEntry struct decoding "auto" uses)
+            began = time.perf_counter()
+            decoded = parse_log_output(dump)
+            decode_ms = (time.perf_counter() - began) * 1000
+            # Every codec must hand the monitors the same entries
+            current = [(entry.get("process"), entry.get("eventMessage")) for entry in decoded]
+            bench_check(messages is None or current == messages, f"{name} decodes log entries differently")
+            messages = current
+
+            began = time.perf_counter()
+            data = json_dumps(dict(state, events=[event.to_row() for event in state["events"]]))
+            dump_ms = (time.perf_counter() - began) * 1000
+            began = time.perf_counter()
+            json_loads(data)
+            load_ms = (time.perf_counter() - began) * 1000
+            kind = type(decoded[0]).__name__
+            results.append(f"{name}: log {decode_ms:.0f}ms ({kind}), state dump {dump_ms:.0f}ms / load {load_ms:.0f}ms")
+
+        # PROBE_FIXTURES replay re-encodes decoded entries (LogEntry structs under
+        # "auto"/"msgspec"); the monitors must get the same entries back
+        global _probe_fixtures
+        saved_fixtures = _probe_fixtures
+        _probe_fixtures = {"/usr/bin/log show --style json": json.dumps(entries)}
+        try:
+            expected = None
+            for name in ["json", "auto", *JSON_CODECS]:
+                JSON_CODEC = name
+                replayed = parse_log_output(_replay_log_fixture(["/usr/bin/log", "show", "--style", "json"]))
+                current = sorted((entry.get("process"), entry.get("eventMessage")) for entry in replayed)
+                bench_check(bool(current) and (expected is None or current == expected), f"{name} replays log fixtures differently")
+                expected = current
+        finally:
+            _probe_fixtures = saved_fixtures
+    finally:
+        JSON_CODEC = saved_codec
+
+    return f"{len(dump) / 1e6:.1f}MB {source} log dump, {len(data) / 1e6:.1f}MB state; " + "; ".join(results)
+
+
+BENCHMARKS = {
+    "ssh-replay": bench_ssh_replay,
+    "sockets": bench_sockets,
+    "rules": bench_rules,
+    "log-predicates": bench_log_predicates,
+    "archive": bench_archive,
+    "events": bench_events,
+    "codec": bench_codec,
+    "baseline": bench_baseline,
+    "geoip": bench_geoip,
+    "ip-lists": bench_ip_lists,
+}
 
-    return events
+
+def run_benchmarks(names: List[str]) -> int:
+    """Run the named benchmarks (or all of them) and print their results; 1 if one fails its checks."""
+    for name in names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            print(f"unknown benchmark: {name} (available: {', '.join(BENCHMARKS)})", file=sys.stderr)
+            return 1
+        try:
+            print(f"{name}: {BENCHMARKS[name]()}")
+        except BenchmarkFailed as e:
+            print(f"{name}: FAILED: {e}", file=sys.stderr)
+            return 1
+    return 0
 
 
 # =============================================================================
 # Main Plugin Logic
 # =============================================================================
 
-def collect_all_events(state: Dict[str, Any]) -> List[Tuple[str, str, str]]:
-    """Collect events from all sources."""
-    all_events = []
-
+# All monitors, in the order they run each tick: (name, display name, parser)
+MONITORS = [
     # Log-based events
-    all_events.extend(parse_ssh_events(state))
-    all_events.extend(parse_sudo_events(state))
-    all_events.extend(parse_portscan_events(state))
-    all_events.extend(parse_ftp_events(state))
-    all_events.extend(parse_dangerous_command_events(state))
-    all_events.extend(parse_mdm_events(state))
+    ("ssh", "SSH", parse_ssh_events),
+    ("sudo", "Sudo", parse_sudo_events),
+    ("portscan", "Port Scans", parse_portscan_events),
+    ("ftp", "FTP", parse_ftp_events),
+    ("commands", "Commands", parse_dangerous_command_events),
+    ("mdm", "Kandji/MDM", parse_mdm_events),
 
     # Network connection events
-    all_events.extend(parse_port_events(state))
-    all_events.extend(parse_vnc_events(state))
-    all_events.extend(parse_listening_port_events(state))
+    ("ports", "Ports", parse_port_events),
+    ("vnc", "VNC", parse_vnc_events),
+    ("listening", "Listening Ports", parse_listening_port_events),
 
     # File monitoring
-    all_events.extend(parse_dotenv_events(state))
+    ("dotenv", ".env Files", parse_dotenv_events),
 
     # Network configuration monitoring
-    all_events.extend(parse_dns_events(state))
-    all_events.extend(parse_public_ip_events(state))
-    all_events.extend(parse_local_ip_events(state))
+    ("dns", "DNS Resolvers", parse_dns_events),
+    ("public_ip", "Public IP", parse_public_ip_events),
+    ("local_ip", "Local IPs", parse_local_ip_events),
 
     # ARP spoofing detection
-    all_events.extend(parse_arp_spoof_events(state))
+    ("arp", "ARP Spoofing", parse_arp_spoof_events),
 
     # Auto-update checking
-    all_events.extend(check_for_updates(state))
+    ("update", "Updates", check_for_updates),
+]
+
+MONITOR_DISPLAY_NAMES = {name: display for name, display, _ in MONITORS}
+MONITOR_DISPLAY_NAMES["incidents"] = "Incidents"
+
+
+# Every tick has to finish well within xbar's refresh interval. Monitors run
+# in priority order (0 = always run); one whose estimated cost (an EWMA of its
+# recent run times) doesn't fit in what's left of the budget is deferred to a
+# later tick. Each deferral moves a monitor one step up the order (up to just
+# behind priority 0), and after MONITOR_MAX_DEFERRALS in a row it runs
+# regardless, so nothing starves.
+# Probe timeouts are capped by the remaining budget. Must-run monitors
+# (priority 0, or deferred too often) run even once the budget is spent, and
+# their probes get at least MONITOR_MUST_RUN_SECONDS, so a slow tick can
+# overrun the budget by that much per must-run monitor.
+TICK_BUDGET_SECONDS = float(os.environ.get("TICK_BUDGET_SECONDS", "20"))
+MONITOR_PRIORITY = {
+    "ssh": 0, "sudo": 0, "arp": 0,
+    "portscan": 1, "vnc": 1, "commands": 1,
+    "ports": 2, "listening": 2, "ftp": 2,
+    "mdm": 3, "dotenv": 3, "local_ip": 3,
+    "dns": 4, "public_ip": 5, "update": 5,
+}
+MONITOR_COST_ALPHA = 0.3        # EWMA weight of the latest run time
+MONITOR_DEFAULT_COST = 0.5      # seconds, before a monitor has been timed
+MONITOR_MAX_DEFERRALS = 4
+MONITOR_MUST_RUN_SECONDS = 3.0  # probe allowance for a must-run monitor past the deadline
+
+
+# Adaptive polling: each monitor has its own interval, a multiple of the tick.
+# A port scan or a new VNC connection tightens the connection monitors to
+# POLL_BURST_INTERVAL for a while (only the daemon can tick that fast; under
+# xbar they stay at every tick). Monitors that have been quiet for
+# POLL_QUIET_AFTER back off gradually towards POLL_MAX_INTERVAL; the critical
+# (priority 0) monitors never back off. Log-based monitors lose nothing by
+# backing off, since their reads resume where the last one ended.
+POLL_BASE_INTERVAL = 30         # seconds between ticks (xbar's refresh; the daemon uses its --interval)
+POLL_BURST_INTERVAL = 5
+POLL_BURST_SECONDS = 600
+POLL_QUIET_AFTER = 3 * 3600
+POLL_MAX_INTERVAL = 600
+POLL_BACKOFF = 1.5
+CONNECTION_MONITORS = ("portscan", "ports", "vnc", "listening")
+# Monitors whose alerts start a burst of fast connection polling
+POLL_BURST_TRIGGERS = {"portscan": "port scan", "vnc": "VNC connection"}
+
+
+# A manual refresh ("Refresh Now", a toggle click, or any SwiftBar refresh that
+# isn't its timer) runs every monitor regardless of schedule. xbar can't say
+# why it ran the plugin, so those menu items first run `refresh`, which leaves
+# REFRESH_REQUEST_FILE for the run xbar starts next.
+REFRESH_REQUEST_FILE = STATE_DIR / "refresh.request"
+
+
+def request_refresh() -> None:
+    """Make the next run collect from every monitor, due or not."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    REFRESH_REQUEST_FILE.touch()
 
-    return all_events
 
+def take_refresh_request() -> bool:
+    """Whether this run was asked for by the user (consumes the request file)."""
+    reason = os.environ.get("SWIFTBAR_PLUGIN_REFRESH_REASON", "")
+    try:
+        REFRESH_REQUEST_FILE.unlink()
+        return True
+    except OSError:
+        return bool(reason) and reason != "Schedule"
 
-def format_xbar_output(state: Dict[str, Any], new_events: List[Tuple[str, str, str]]) -> None:
-    """Format and print xbar-compatible output."""
 
-    # Process new events
-    for event_type, title, body in new_events:
-        timestamp = datetime.now().strftime("%H:%M")
-        state["events"].append({
-            "type": event_type,
-            "title": title,
-            "body": body,
-            "time": timestamp,
-            "date": datetime.now().isoformat(),
-        })
+def monitor_is_due(state: Dict[str, Any], name: str, now: float) -> bool:
+    """Whether a monitor's polling interval has elapsed (with slack for tick jitter)."""
+    record = state.get("polling", {}).get(name)
+    return record is None or now >= record["next"] - POLL_BASE_INTERVAL * 0.2
+
+
+def update_polling(state: Dict[str, Any], name: str, events: List[Event], now: float) -> None:
+    """Pick a monitor's next polling interval (and the reason) after it ran."""
+    polling = state.setdefault("polling", {})
+    record = polling.setdefault(name, {"interval": POLL_BASE_INTERVAL, "next": 0, "reason": "", "last_event": now})
+    if events:
+        record["last_event"] = now
+
+    if name in POLL_BURST_TRIGGERS and any(event.severity == "alert" for event in events):
+        state["polling_burst"] = {
+            "until": now + POLL_BURST_SECONDS,
+            "reason": f"{POLL_BURST_TRIGGERS[name]} at {datetime.fromtimestamp(now).strftime('%H:%M')}",
+        }
+        # Look again right away instead of waiting out a backed-off interval
+        for other in CONNECTION_MONITORS:
+            if other in polling:
+                polling[other]["next"] = now
+
+    burst = state.get("polling_burst")
+    quiet = now - record["last_event"]
+    if burst and now < burst["until"] and name in CONNECTION_MONITORS:
+        interval, reason = POLL_BURST_INTERVAL, f"incident: {burst['reason']}"
+    elif MONITOR_PRIORITY.get(name, 3) == 0:
+        interval, reason = POLL_BASE_INTERVAL, "critical, never backs off"
+    elif quiet >= POLL_QUIET_AFTER:
+        interval = min(POLL_MAX_INTERVAL, max(POLL_BASE_INTERVAL, record["interval"]) * POLL_BACKOFF)
+        reason = f"quiet for {describe_age(quiet)}"
+    else:
+        interval, reason = POLL_BASE_INTERVAL, "active" if events else "default"
+
+    # Nothing can run more often than the tick itself
+    interval = max(interval, POLL_BASE_INTERVAL if not RUNNING_AS_DAEMON else 1)
+    record.update(interval=interval, next=now + interval, reason=reason)
+
+
+def next_poll_due(state: Dict[str, Any]) -> Optional[float]:
+    """When the next monitor is due (time.time()), for the daemon to sleep until."""
+    polling = state.get("polling", {})
+    due = [polling[name]["next"] if name in polling else 0 for name, _, _ in MONITORS]
+    return min(due) if due else None
+
+
+def collect_all_events(state: Dict[str, Any], force: bool = False) -> List[Event]:
+    """Collect events from all monitors (only the due ones unless force), within the tick budget."""
+    all_events = []
+
+    # Start the tick with a fresh probe memo
+    reset_probes()
+
+    # state["monitor_costs"][name] = {"ewma": seconds, "deferred": ticks in a row, "max_deferred": worst streak}
+    costs = state.setdefault("monitor_costs", {})
+    started = time.monotonic()
+    deadline = started + TICK_BUDGET_SECONDS
+
+    def rank(i: int) -> Tuple[int, int]:
+        # Deferrals promote a monitor, but never ahead of the priority-0 ones
+        priority = MONITOR_PRIORITY.get(MONITORS[i][0], 3)
+        if priority > 0:
+            priority = max(1, priority - costs.get(MONITORS[i][0], {}).get("deferred", 0))
+        return priority, i
+
+    order = sorted(range(len(MONITORS)), key=rank)
+
+    deferred = []
+    ran = 0
+    _tick_budget.deadline = deadline
+    try:
+        for i in order:
+            name, _, parser = MONITORS[i]
+            if not force and not monitor_is_due(state, name, time.time()):
+                continue
+            record = costs.setdefault(name, {"ewma": None, "deferred": 0, "max_deferred": 0})
+            estimate = MONITOR_DEFAULT_COST if record["ewma"] is None else record["ewma"]
+            time_left = deadline - time.monotonic()
+            must_run = MONITOR_PRIORITY.get(name, 3) == 0 or record["deferred"] >= MONITOR_MAX_DEFERRALS
+
+            if not must_run and (time_left <= 0 or estimate > time_left):
+                record["deferred"] += 1
+                record["max_deferred"] = max(record["max_deferred"], record["deferred"])
+                deferred.append(name)
+                continue
+
+            began = time.monotonic()
+            _tick_budget.deadline = max(deadline, began + MONITOR_MUST_RUN_SECONDS) if must_run else deadline
+            ran += 1
+            events = parser(state)
+            if name in IP_LIST_MONITORS:
+                events = apply_ip_lists(events)
+            for event in events:
+                event.monitor = name
+                if name in GEOIP_MONITORS:
+                    enrich_event(event)
+            all_events.extend(events)
+            elapsed = time.monotonic() - began
+            update_polling(state, name, events, time.time())
+
+            record["ewma"] = elapsed if record["ewma"] is None else (
+                MONITOR_COST_ALPHA * elapsed + (1 - MONITOR_COST_ALPHA) * record["ewma"]
+            )
+            record["deferred"] = 0
+    finally:
+        _tick_budget.deadline = None
+
+    state["last_tick"] = {"elapsed": time.monotonic() - started, "budget": TICK_BUDGET_SECONDS, "deferred": deferred, "ran": ran}
+    return all_events
+
+
+def process_new_events(state: Dict[str, Any], new_events: List[Event]) -> List[Event]:
+    """Add new events (and the incidents they complete) to the history, log them and send notifications."""
+    expire_correlation(get_correlation(state), time.time())
+    added = list(new_events)
+    i = 0
+    while i < len(added):
+        event = added[i]
+        i += 1
+        append_event(state, event)
+        if event.monitor != "incidents":
+            # Incidents go right after the event that completed them
+            added[i:i] = correlate_event(state, event)
 
         # Log event
-        log_event(event_type, title, body)
+        log_event(event.severity, event.title, event.body)
 
         # Send notification for alerts
-        if event_type == "alert":
-            send_notification(title, body, is_alert=True)
+        if event.severity == "alert":
+            send_notification(event.title, event.body, is_alert=True)
         elif SHOW_NOTIFICATIONS:
-            send_notification(title, body, is_alert=False)
+            send_notification(event.title, event.body, is_alert=False)
+
+    return added
+
+
+def format_headless_output(state: Dict[str, Any], new_events: List[Event]) -> None:
+    """Print new events as plain lines (or JSON lines) for servers without a menubar."""
+    for event in new_events:
+        if HEADLESS_FORMAT == "json":
+            print(json.dumps(event.to_record()), flush=True)
+        else:
+            prefix = "!!" if event.severity == "alert" else ">>"
+            print(f"[{event.date:%Y-%m-%dT%H:%M:%S}] {prefix} {event.monitor}: {event.title}: {event.body}", flush=True)
+
+
+def format_xbar_output(state: Dict[str, Any], new_events: List[Event]) -> None:
+    """Format and print xbar-compatible output."""
 
-    # Count recent alerts
-    recent_alerts = sum(1 for e in state["events"][-20:] if e["type"] == "alert")
+    # Count alerts in the last hour (from the index, not by rescanning history)
+    index = get_event_index(state)
+    recent_alerts = count_recent_events(index, "hour", alerts_only=True)
 
     # Menubar display
     if recent_alerts > 0:
@@ -1610,7 +6336,41 @@ def format_xbar_output(state: Dict[str, Any], new_events: List[Tuple[str, str, s
 
     # Status section
     print(f"Security Growler v2.0 | color=#666666 size=11")
-    print(f"Last check: {datetime.now().strftime('%H:%M:%S')} | color=#666666 size=11")
+    # (the last collecting run's time: a run that found the tick lock busy renders the saved state)
+    last_check = datetime.fromisoformat(state["last_check"]) if state.get("last_check") else datetime.now()
+    print(f"Last check: {last_check.strftime('%H:%M:%S')} | color=#666666 size=11")
+    probe_runs = sum(stats["runs"] for stats in _probe_stats.values())
+    probe_calls = sum(stats["calls"] for stats in _probe_stats.values())
+    probe_bytes = sum(stats.get("bytes", 0) for stats in _probe_stats.values())
+    print(f"Probes: {probe_runs} run, {probe_calls - probe_runs} cached, {probe_bytes / 1024:.0f} KB read | color=#666666 size=11")
+    last_tick = state.get("last_tick")
+    if last_tick:
+        print(f"Tick: {last_tick['elapsed']:.1f}s of {last_tick['budget']:g}s budget | color=#666666 size=11")
+        if last_tick["deferred"]:
+            names = ", ".join(MONITOR_DISPLAY_NAMES.get(name, name) for name in last_tick["deferred"])
+            print(f"Deferred: {names} | color=#CC6600 size=11")
+            for name in last_tick["deferred"]:
+                record = state["monitor_costs"][name]
+                estimate = f", usually {record['ewma']:.1f}s" if record["ewma"] is not None else ""
+                print(f"--{MONITOR_DISPLAY_NAMES.get(name, name)}: skipped {record['deferred']} tick(s) in a row{estimate} | color=#999999 size=11")
+    polling = state.get("polling", {})
+    if polling:
+        fast = sum(1 for record in polling.values() if record["interval"] < POLL_BASE_INTERVAL)
+        slow = sum(1 for record in polling.values() if record["interval"] > POLL_BASE_INTERVAL)
+        print(f"Polling: every {POLL_BASE_INTERVAL:g}s, {fast} faster, {slow} backed off | color=#666666 size=11")
+        for name, display, _ in MONITORS:
+            if name in polling:
+                record = polling[name]
+                print(f"--{display}: every {describe_age(record['interval'])} ({record['reason']}) | color=#999999 size=11")
+    public_ip = get_network_results().get("public_ip")
+    if MONITOR_PUBLIC_IP and public_ip:
+        age = describe_age(time.time() - public_ip["checked"])
+        print(f"Public IP: {public_ip.get('value') or 'unknown'} (checked {age} ago) | color=#666666 size=11")
+    rule_errors = get_rules().errors + get_incident_patterns().errors
+    if rule_errors:
+        print(f"⚠️ {len(rule_errors)} rule error(s) in {os.path.basename(RULES_FILE)} | color=#CC6600 size=11")
+        for error in rule_errors[:10]:
+            print(f"--{error[:100]} | color=#999999 size=11")
     print("---")
 
     # Active monitors - clickable to toggle
@@ -1624,7 +6384,7 @@ def format_xbar_output(state: Dict[str, Any], new_events: List[Tuple[str, str, s
         ("MONITOR_PORTSCAN", MONITOR_PORTSCAN, "Port Scans"),
         ("MONITOR_VNC", MONITOR_VNC, "VNC"),
         ("MONITOR_PORTS", MONITOR_PORTS, f"Ports: {', '.join(str(p) for p in PORTS_TO_MONITOR[:3])}{f' (+{len(PORTS_TO_MONITOR) - 3})' if len(PORTS_TO_MONITOR) > 3 else ''}"),
-        ("MONITOR_LISTENING", MONITOR_LISTENING, f"Listening ({LISTENING_PORT_MIN}-{LISTENING_PORT_MAX})"),
+        ("MONITOR_LISTENING", MONITOR_LISTENING, f"Listening ({LISTENING_PORT_RANGES})"),
         ("MONITOR_DOTENV", MONITOR_DOTENV, ".env Files"),
         ("MONITOR_DANGEROUS_COMMANDS", MONITOR_DANGEROUS_COMMANDS, f"Commands: {', '.join(DANGEROUS_COMMANDS)}"),
         ("MONITOR_DNS", MONITOR_DNS, "DNS Resolvers"),
@@ -1645,29 +6405,64 @@ def format_xbar_output(state: Dict[str, Any], new_events: List[Tuple[str, str, s
     print("---")
 
     # Recent events section
-    events = state["events"][-20:]
+    events = state["events"][-MENU_EVENTS:]
     events.reverse()  # Most recent first
 
     if events:
         print("Recent Events | color=#333333")
         for event in events:
-            icon = "🔴" if event["type"] == "alert" else "🔵"
-            title = event["title"][:40]
-            time = event["time"]
-            color = "#CC0000" if event["type"] == "alert" else "#333333"
-            print(f"--{icon} [{time}] {title} | color={color} size=12")
-            if event.get("body"):
-                body = event["body"][:50]
-                print(f"----{body} | color=#666666 size=11")
+            print_event_menu_item(event, "--")
     else:
         print("No recent events | color=#999999")
 
+    # History summary, per-monitor and per-source views (all served from the index)
+    if state["events"]:
+        hour_count = count_recent_events(index, "hour")
+        day_count = count_recent_events(index, "day")
+        day_alerts = count_recent_events(index, "day", alerts_only=True)
+        print(f"Last hour: {hour_count} events ({recent_alerts} alerts) · 24h: {day_count} ({day_alerts} alerts) | color=#666666 size=11")
+
+        # Calendar trends from the rollups (constant time, independent of history size)
+        rollups = get_rollups(state)
+        roll_up(rollups)
+        trends = monitor_trends(rollups)
+        if trends["week"] or trends["last_week"]:
+            week_total = sum(n for n, _ in trends["week"].values())
+            last_total = sum(n for n, _ in trends["last_week"].values())
+            print(f"Trends: {week_total} events this week, {last_total} last week | color=#333333")
+            for monitor in sorted(trends["week"].keys() | trends["last_week"].keys(), key=lambda m: -trends["week"].get(m, [0])[0]):
+                today_n = trends["today"].get(monitor, [0, 0])[0]
+                week_n, week_alerts = trends["week"].get(monitor, [0, 0])
+                last_n = trends["last_week"].get(monitor, [0, 0])[0]
+                arrow = "↑" if week_n > last_n else "↓" if week_n < last_n else "→"
+                alerts = f", {week_alerts} alerts" if week_alerts else ""
+                print(
+                    f"--{MONITOR_DISPLAY_NAMES.get(monitor, monitor)}: {today_n} today, {week_n} this week{alerts} "
+                    f"({arrow} {last_n} last week) | color=#333333 size=12"
+                )
+
+        print(f"By Monitor ({len(state['events'])} events) | color=#333333")
+        for monitor, count in sorted(index["by_monitor"].items(), key=lambda item: -item[1]):
+            display_name = MONITOR_DISPLAY_NAMES.get(monitor, monitor)
+            day_monitor = count_recent_events(index, "day", monitor=monitor)
+            print(f"--{display_name}: {count} ({day_monitor} in 24h) | color=#333333 size=12")
+            for seq in reversed(index["recent"].get(monitor, [])):
+                event = get_event_by_seq(state, seq)
+                if event:
+                    print_event_menu_item(event, "----")
+
+        sources = top_sources(index)
+        if sources:
+            print("Top Sources | color=#333333")
+            for source, count in sources:
+                print(f"--{source}: {count} events | color=#333333 size=12")
+
     print("---")
 
     # Actions
     print(f"View Log File | bash=/usr/bin/open param1={LOG_FILE} terminal=false")
     print(f"Open Plugin Folder | bash=/usr/bin/open param1=-R param2={os.path.abspath(__file__)} terminal=false")
-    print("Refresh Now | refresh=true")
+    print(f"Refresh Now | bash={script_path} param1=refresh terminal=false refresh=true")
 
     print("---")
 
@@ -1696,6 +6491,100 @@ def format_xbar_output(state: Dict[str, Any], new_events: List[Tuple[str, str, s
     print(f"--SHOW_NOTIFICATIONS={SHOW_NOTIFICATIONS} | color=#999999 size=11")
 
 
+def print_event_menu_item(event: Event, prefix: str) -> None:
+    """Print one event as a menu item (with its body as a submenu) at the given depth."""
+    icon = "🔴" if event.severity == "alert" else "🔵"
+    title = event.title[:40]
+    color = "#CC0000" if event.severity == "alert" else "#333333"
+    print(f"{prefix}{icon} [{event.date:%H:%M}] {title} | color={color} size=12")
+    if event.body:
+        body = event.body[:50]
+        print(f"{prefix}--{body} | color=#666666 size=11")
+
+
+# Output renderers: xbar menubar on macOS, plain event lines on headless hosts
+RENDERERS = {
+    "xbar": format_xbar_output,
+    "headless": format_headless_output,
+}
+RENDERER = os.environ.get("RENDERER", "headless" if IS_LINUX else "xbar")
+RUNNING_AS_DAEMON = False
+HEADLESS_FORMAT = os.environ.get("HEADLESS_FORMAT", "text")
+
+
+def run_tick(renderer: str) -> Optional[float]:
+    """Run one collection pass: load state, collect, record, render and save. Returns when the next monitor is due."""
+    lock = acquire_tick_lock()
+    if lock is None:
+        # Another run is mid-tick: show what it last saved rather than collecting twice
+        state = load_state()
+        RENDERERS[renderer](state, [])
+        return next_poll_due(state)
+
+    with lock:
+        # Load state
+        state = load_state()
+
+        # Collect new events (from every monitor if the user asked for this run)
+        new_events = collect_all_events(state, force=take_refresh_request())
+
+        # Update last check time, if anything was actually checked
+        if state["last_tick"]["ran"]:
+            state["last_check"] = datetime.now().isoformat()
+
+        # Record events and render output
+        added = process_new_events(state, new_events)
+        RENDERERS[renderer](state, added)
+
+        # Keep everything in the long-term archive, and spool for the configured
+        # sinks (delivery happens off the tick)
+        archive_events(added)
+        spool_sink_events(added)
+
+        # Save state
+        save_state(state)
+        save_baseline()
+
+    background_thread = renderer == "headless" and RUNNING_AS_DAEMON
+    start_sink_delivery(background_thread)
+    start_network_worker(background_thread)
+    return next_poll_due(state)
+
+
+def run_daemon(argv: List[str]) -> int:
+    """
+    Run ticks in a loop with the headless renderer (e.g. under systemd).
+
+    Usage:
+        security-growler.30s.py daemon [--interval 30] [--json]
+    """
+    import argparse
+
+    global HEADLESS_FORMAT, RUNNING_AS_DAEMON, TICK_BUDGET_SECONDS, POLL_BASE_INTERVAL
+    parser = argparse.ArgumentParser(prog="security-growler daemon", description=run_daemon.__doc__.strip().splitlines()[0])
+    parser.add_argument("--interval", type=float, default=30, help="base seconds between ticks (default: 30; shorter during incidents)")
+    parser.add_argument("--json", action="store_true", help="print events as JSON lines")
+    args = parser.parse_args(argv)
+    if args.json:
+        HEADLESS_FORMAT = "json"
+    RUNNING_AS_DAEMON = True
+    TICK_BUDGET_SECONDS = min(TICK_BUDGET_SECONDS, args.interval * 0.8)
+    POLL_BASE_INTERVAL = args.interval
+
+    try:
+        while True:
+            next_due = None
+            try:
+                next_due = run_tick("headless")
+            except Exception as e:
+                print(f"tick failed: {type(e).__name__}: {e}", file=sys.stderr, flush=True)
+            # Sleep until the next monitor is due: sooner during an incident, never longer than --interval
+            wait = args.interval if next_due is None else next_due - time.time()
+            time.sleep(min(args.interval, max(1.0, wait)))
+    except KeyboardInterrupt:
+        return 0
+
+
 def main():
     """Main entry point for the xbar plugin."""
     # Check if we're being called to toggle a monitor
@@ -1705,30 +6594,53 @@ def main():
             toggle_monitor(monitor_name)
         sys.exit(0)
 
-    try:
-        # Load state
-        state = load_state()
+    # "Refresh Now": the run xbar starts next collects from every monitor
+    if len(sys.argv) > 1 and sys.argv[1] == "refresh":
+        request_refresh()
+        sys.exit(0)
 
-        # Collect new events
-        new_events = collect_all_events(state)
+    # Offline forensic sweep over saved logs
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        sys.exit(run_backfill(sys.argv[2:]))
 
-        # Update last check time
-        state["last_check"] = datetime.now().isoformat()
+    # Synthetic benchmarks of the hot paths
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        sys.exit(run_benchmarks(sys.argv[2:]))
 
-        # Output xbar format
-        format_xbar_output(state, new_events)
+    # Long-running headless collector (Linux servers)
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        sys.exit(run_daemon(sys.argv[2:]))
 
-        # Save state
-        save_state(state)
+    # Fleet collector that agents forward their events to
+    if len(sys.argv) > 1 and sys.argv[1] == "collector":
+        sys.exit(run_collector(sys.argv[2:]))
+
+    # Search the long-term event archive
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        sys.exit(run_query(sys.argv[2:]))
+
+    # Refresh network-bound probes (spawned detached by each tick)
+    if len(sys.argv) > 1 and sys.argv[1] == "network":
+        refresh_network_probes()
+        sys.exit(0)
+
+    # Deliver spooled events to sinks (spawned detached by each tick)
+    if len(sys.argv) > 1 and sys.argv[1] == "sinks":
+        sys.exit(run_sinks(sys.argv[2:]))
+
+    try:
+        run_tick(RENDERER if RENDERER in RENDERERS else "xbar")
 
     except Exception as e:
+        if RENDERER == "headless":
+            raise
         # Show error in menubar
         print(f"🛡️❌ | color=#CC0000")
         print("---")
         print(f"Error: {str(e)[:50]} | color=#CC0000")
         print(f"--{type(e).__name__}: {str(e)} | color=#999999 size=11")
         print("---")
-        print("Refresh | refresh=true")
+        print(f"Refresh | bash={os.path.abspath(__file__)} param1=refresh terminal=false refresh=true")
 
 
 if __name__ == "__main__":